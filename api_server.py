@@ -1,18 +1,26 @@
 #!/usr/bin/env python3
 """
 API Server для CS2 Tool
-HTTP API вместо WebSocket для совместимости с бесплатными платформами
+HTTP API, статические файлы и WebSocket на одном порту и в одном цикле событий
 """
 import os
 import sys
 import json
 import time
-import threading
+import asyncio
 import logging
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
 import requests
-from scanner_simple import CS2ScannerSimple
+from async_http import AsyncHTTPServer, HTTPResponse, json_response, error_response, pretty_response
+from http_compression import ResponseCompressor, encoded_etag
+from scanner_simple import CS2ScannerSimple, SERVER_LIST_LIMIT, classify_maps, server_list_key
+from saved_servers_io import detect_format, iter_records
+from response_cache import ResponseCache, etag_matches, query_key
+from change_feed import FEED_COLLECTIONS
+from batch_queries import saved_servers_list, servers_page
+from static_files import StaticFiles
+from metrics import HTTP_REQUEST_DURATION, REGISTRY
+from wire_format import serve_kwargs
+from ws_connections import keepalive_kwargs
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,174 +32,506 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class CS2APIHandler(BaseHTTPRequestHandler):
-    def __init__(self, *args, scanner=None, **kwargs):
+STREAM_HEARTBEAT = 15      # Секунд между комментариями keep-alive в SSE потоке
+STREAM_RETRY_MS = 3000     # Пауза переподключения EventSource
+LONG_POLL_TIMEOUT = 25     # Ожидание изменений в long-poll по умолчанию, сек
+
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'OPTIONS')  # Остальные методы в метриках - 'other'
+
+# CORS заголовки добавляются к каждому ответу
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+class CS2APIHandler:
+    """Маршруты HTTP API
+
+    Обработчики синхронные и возвращают HTTPResponse. Тяжелые (сериализация
+    списков, файлы, импорт) выполняются в пуле потоков, чтобы не задерживать
+    цикл событий с остальными запросами и WebSocket соединениями.
+    
+    versioned - части снимка состояния, от которых зависит ответ:
+    обработчик получает снимок, ответ кэшируется до изменения этих частей,
+    ETag - версия их последнего изменения (другие части его не сбрасывают).
+    """
+
+    def __init__(self, scanner):
         self.scanner = scanner
-        super().__init__(*args, **kwargs)
+        self.routes = {}
+        self.response_cache = ResponseCache()
+        self.compression = ResponseCompressor() if os.environ.get('HTTP_COMPRESSION', 'on').lower() != 'off' else None
+        self.pending = {}  # (ключ, версия) → выполняющаяся сериализация
+        self.stream_clients = 0
+        self.static = StaticFiles(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public'))
+        self.static.preload()
+        self.register_metrics()
+        self.add_route('GET', '/api/status', self.handle_status, offload=False)
+        self.add_route('GET', '/metrics', self.handle_metrics)
+        self.add_route('GET', '/api/servers', self.handle_get_servers, versioned=('server_query',))
+        self.add_route('GET', '/api/saved-servers', self.handle_get_saved_servers, versioned=('saved_servers',))
+        self.add_route('GET', '/api/saved-servers/export', self.handle_export_saved_servers, offload=False)
+        self.add_route('GET', '/api/scan', self.handle_scan, offload=False)
+        self.add_route('GET', '/api/maps', self.handle_get_maps, versioned=('maps',))
+        self.add_route('GET', '/api/top-changing-servers', self.handle_get_top_changing_servers)
+        self.add_route('GET', '/api/auto-save-rules',
+                       lambda request: self.json_response(self.scanner.auto_save_rules.stats()), offload=False)
+        self.add_route('GET', '/api/timeseries', self.handle_get_timeseries)
+        self.add_route('GET', '/api/ws-metrics', self.handle_ws_metrics, offload=False)
+        self.add_route('GET', '/api/stream', self.handle_stream, offload=False)
+        self.add_route('GET', '/api/changes', self.handle_changes, offload=False)
+        for path in ('/api/IGameServersService/GetServerList/v1/', '/api/IGameServersService/GetServerList/v1'):
+            self.add_route('GET', path, self.handle_steam_server_list, offload=False)
+        self.add_route('POST', '/api/update-settings', self.handle_update_settings, offload=False)
+        self.add_route('POST', '/api/clear-cache', self.handle_clear_cache, offload=False)
+        self.add_route('POST', '/api/auto-save-rules', self.handle_update_auto_save_rules, offload=False)
+        self.add_route('POST', '/api/saved-servers/import', self.handle_import_saved_servers)
+        self.add_route('POST', '/api/batch', self.handle_batch)
+
+    def add_route(self, method, path, function, offload=True, versioned=None):
+        self.routes[(method, path)] = (function, offload, versioned)
+
+    async def __call__(self, request):
+        """Обработка запроса с учетом длительности по маршруту (/metrics)"""
+        started = time.perf_counter()
+        response = await self.route_request(request)
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        # Метка маршрута ограничена таблицей маршрутов: пути статики и неизвестные пути не размножают ряды
+        if ('GET' if method == 'HEAD' else method, request.path) in self.routes:
+            route = request.path
+        elif method in ('GET', 'HEAD'):
+            route = 'static'
+        else:
+            route = 'unknown'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route, response.status)
+        return response
     
-    def do_GET(self):
-        """Обработка GET запросов"""
+    async def route_request(self, request):
+        """Выбор обработчика по методу и пути"""
+        if request.method == 'OPTIONS':
+            # CORS preflight
+            return HTTPResponse(200)
+
+        method = 'GET' if request.method == 'HEAD' else request.method
+        route = self.routes.get((method, request.path))
+        if route is None:
+            if method != 'GET':
+                return self.error_response("Неизвестный endpoint", 404)
+            route = (self.handle_static_files, True, None)
+
+        function, offload, versioned = route
         try:
-            parsed_url = urlparse(self.path)
-            path = parsed_url.path
-            query_params = parse_qs(parsed_url.query)
-            
-            # CORS заголовки
-            self.send_cors_headers()
-            
-            if path == '/api/status':
-                self.handle_status()
-            elif path == '/api/servers':
-                self.handle_get_servers(query_params)
-            elif path == '/api/saved-servers':
-                self.handle_get_saved_servers()
-            elif path == '/api/scan':
-                self.handle_scan(query_params)
-            elif path == '/api/maps':
-                self.handle_get_maps()
-            elif path.startswith('/api/static/'):
-                self.handle_static_files(path)
+            if versioned is not None:
+                return await self.versioned_response(request, function, versioned)
+            if asyncio.iscoroutinefunction(function):
+                response = await function(request)
+            elif offload:
+                response = await asyncio.get_running_loop().run_in_executor(None, function, request)
             else:
-                self.handle_static_files(path)
-                
+                response = function(request)
+            return pretty_response(response) if self.pretty_requested(request) else response
         except Exception as e:
             logger.error(f"❌ Ошибка обработки запроса: {e}")
-            self.send_error_response(f"Ошибка сервера: {str(e)}")
+            return self.error_response(f"Ошибка сервера: {str(e)}")
+    
+    async def versioned_response(self, request, function, parts):
+        """Условный GET: 304 по If-None-Match, иначе готовый ответ этой версии частей parts
+        
+        Одновременные запросы новой версии ждут одну сериализацию.
+        """
+        snapshot = self.scanner.snapshot
+        version = snapshot.version_of(*parts)
+        headers = {'ETag': f'"v{version}"', 'Cache-Control': 'no-cache'}
+        if etag_matches(request.header('If-None-Match'), headers['ETag']):
+            self.response_cache.not_modified += 1
+            if self.compression is not None:
+                # 304 подтверждает вариант, сохраненный клиентом (сжатый - со своим ETag)
+                coding = self.compression.negotiate(request.header('Accept-Encoding'))
+                variant = encoded_etag(headers['ETag'], coding) if coding else None
+                if variant and variant in request.header('If-None-Match'):
+                    headers['ETag'] = variant
+            return HTTPResponse(304, headers=headers)
+        
+        key = (request.path, query_key(request.query))
+        response = self.response_cache.get(key, version)
+        if response is None:
+            pending_key = (key, version)
+            future = self.pending.get(pending_key)
+            if future is None:
+                future = asyncio.get_running_loop().run_in_executor(None, function, request, snapshot)
+                self.pending[pending_key] = future
+                future.add_done_callback(lambda _: self.pending.pop(pending_key, None))
+            response = await asyncio.shield(future)
+            if response.status != 200:
+                return response
+            if self.pretty_requested(request):
+                response = pretty_response(response)
+            self.response_cache.put(key, version, response)
+        
+        # Сжатые варианты общие с ответом в кэше: сжатие один раз на версию
+        return HTTPResponse(response.status, response.body, headers={**response.headers, **headers},
+                            encoded=response.encoded)
+    
+    def pretty_requested(self, request):
+        return request.param('pretty') in ('1', 'true')
     
-    def do_POST(self):
-        """Обработка POST запросов"""
+    def requested_version(self, request):
+        """Последняя полученная клиентом версия: ?version= или Last-Event-ID (переподключение SSE)"""
+        value = request.param('version') or request.header('Last-Event-ID')
+        if value in (None, ''):
+            return None
         try:
-            parsed_url = urlparse(self.path)
-            path = parsed_url.path
-            
-            # CORS заголовки
-            self.send_cors_headers()
-            
-            if path == '/api/update-settings':
-                self.handle_update_settings()
-            elif path == '/api/clear-cache':
-                self.handle_clear_cache()
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Неверная версия: {value}")
+    
+    def changes_since(self, version):
+        """Сериализованное событие для клиента с версией version
+        
+        Дельта из ленты изменений или полный список серверов, если версия
+        неизвестна или история уже удалена. Одно событие сериализуется один
+        раз для всех клиентов с той же версией. Возвращает (тип, версия, ответ);
+        тип None - серверы не изменились.
+        """
+        snapshot = self.scanner.snapshot
+        delta = self.scanner.change_feed.since(version) if version is not None else None
+        if delta is None:
+            event_type, key, current = 'snapshot', ('/api/stream', 'snapshot'), snapshot.version
+        else:
+            key, current = ('/api/stream', version), delta['version']
+            event_type = 'delta' if any(name in delta for name in FEED_COLLECTIONS) else None
+        
+        response = self.response_cache.get(key, current)
+        if response is None:
+            if delta is None:
+                payload = {
+                    'type': 'snapshot',
+                    'version': snapshot.version,
+                    'game_servers': list(snapshot.game_servers.values()),
+                    'empty_servers': list(snapshot.empty_servers.values()),
+                    'disappeared_servers': list(snapshot.disappeared_servers.values()),
+                    'stats': snapshot.summary()
+                }
             else:
-                self.send_error_response("Неизвестный endpoint", 404)
+                payload = {'type': 'delta', **delta, 'stats': snapshot.summary()}
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+            response = HTTPResponse(200, body, 'application/json; charset=utf-8')
+            self.response_cache.put(key, current, response)
+        return event_type, current, response
+    
+    async def handle_stream(self, request):
+        """Server-Sent Events: полный список, затем дельты сразу после каждого цикла"""
+        try:
+            version = self.requested_version(request)
+        except ValueError as e:
+            return self.error_response(str(e), 400)
+        
+        return HTTPResponse(200, content_type='text/event-stream; charset=utf-8',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+                            stream=self.event_stream(version))
+    
+    async def event_stream(self, version):
+        feed = self.scanner.change_feed
+        loop = asyncio.get_running_loop()
+        self.stream_clients += 1
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                event_type, current, response = await loop.run_in_executor(None, self.changes_since, version)
+                # Пустые дельты (изменились не серверы) не отправляются, версия просто сдвигается
+                if event_type is not None:
+                    yield f"id: {current}\nevent: {event_type}\ndata: ".encode() + response.body + b"\n\n"
+                version = current
                 
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки POST запроса: {e}")
-            self.send_error_response(f"Ошибка сервера: {str(e)}")
-    
-    def do_OPTIONS(self):
-        """Обработка CORS preflight запросов"""
-        self.send_cors_headers()
-        self.send_response(200)
-        self.end_headers()
-    
-    def send_cors_headers(self):
-        """Отправка CORS заголовков"""
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-    
-    def handle_status(self):
+                while not await feed.wait(version, STREAM_HEARTBEAT):
+                    yield ": keepalive\n\n"
+        finally:
+            self.stream_clients -= 1
+    
+    async def handle_changes(self, request):
+        """Long-poll: ответ сразу при наличии изменений после version, иначе по появлении или таймауту"""
+        try:
+            version = self.requested_version(request)
+            timeout = min(float(request.param('timeout', LONG_POLL_TIMEOUT)), 60)
+        except ValueError as e:
+            return self.error_response(f"Неверные параметры: {str(e)}", 400)
+        
+        if version is not None:
+            self.stream_clients += 1
+            try:
+                await self.scanner.change_feed.wait(version, timeout)
+            finally:
+                self.stream_clients -= 1
+        _, _, response = await asyncio.get_running_loop().run_in_executor(None, self.changes_since, version)
+        return HTTPResponse(200, response.body, headers={**response.headers, 'Cache-Control': 'no-store'},
+                            encoded=response.encoded)
+    
+    async def handle_steam_server_list(self, request):
+        """Прокси Steam GetServerList для браузерного режима
+        
+        Запросы идут через пул соединений и планировщик сканера; одинаковые
+        (фильтр, offset, limit, API ключ) объединяются и кэшируются на
+        server_list_ttl, свежие страницы фонового обхода отдаются без запроса
+        к Steam. Без своего ключа (key) доступны только фильтры карт сканера
+        страницами до SERVER_LIST_LIMIT - с ключом сканера, не открытый прокси.
+        """
+        server_filter = request.param('filter', '')
+        try:
+            offset = max(0, int(request.param('offset', 0)))
+            limit = min(max(1, int(request.param('limit', SERVER_LIST_LIMIT))), 10000)
+        except ValueError:
+            return self.error_response("Неверные параметры: offset и limit должны быть целыми числами", 400)
+        
+        api_key = request.param('key')
+        if not api_key:
+            if not (self.scanner.api_key and self.scanner.is_map_filter(server_filter) and limit <= SERVER_LIST_LIMIT):
+                return self.error_response(f"Не указан API ключ: без key доступны только фильтры карт сканера "
+                                           f"(limit до {SERVER_LIST_LIMIT})", 400)
+            api_key = self.scanner.api_key
+        
+        ttl = self.scanner.server_list_ttl
+        future, source = self.scanner.server_lists.submit(
+            server_list_key(server_filter, offset, limit, api_key),
+            lambda: self.scanner.fetch_server_list(api_key, server_filter, offset, limit, 'interactive'),
+            ttl
+        )
+        try:
+            body = await asyncio.wrap_future(future)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 502
+            logger.warning(f"⚠️ Steam API ответил {status} для фильтра {server_filter}")
+            return self.error_response(f"Steam API: HTTP {status}", status if 400 <= status < 500 else 502)
+        except requests.RequestException as e:
+            logger.error(f"❌ Ошибка запроса к Steam API: {e}")
+            return self.error_response(f"Steam API недоступен: {str(e)}", 502)
+        
+        # Тело Steam без повторной сериализации; кэшированные байты не изменяются
+        return HTTPResponse(200, body, 'application/json; charset=utf-8',
+                            headers={'Cache-Control': f'max-age={int(ttl)}', 'X-Cache': source})
+    
+    def handle_metrics(self, request):
+        """Метрики в текстовом формате Prometheus (metrics.py)"""
+        return HTTPResponse(200, REGISTRY.render(), 'text/plain; version=0.0.4; charset=utf-8',
+                            headers={'Cache-Control': 'no-store'})
+    
+    def register_metrics(self):
+        REGISTRY.gauge('cs2_http_response_cache', 'Обращения к кэшу ответов API по результату', lambda: {
+            result: self.response_cache.stats()[result] for result in ('hits', 'misses', 'not_modified')
+        }, ('result',))
+        REGISTRY.gauge('cs2_http_response_cache_bytes', 'Размер кэша ответов API',
+                       lambda: self.response_cache.stats()['bytes'])
+        REGISTRY.gauge('cs2_http_stream_clients', 'Клиенты SSE и long-poll', lambda: self.stream_clients)
+        if self.compression is not None:
+            REGISTRY.gauge('cs2_http_compressed_bytes', 'Байты до и после сжатия ответов', lambda: {
+                'in': self.compression.bytes_in, 'out': self.compression.bytes_out
+            }, ('direction',))
+    
+    def handle_ws_metrics(self, request):
+        """Задержки обработчиков WebSocket и состояние соединений"""
+        return self.json_response({
+            'handlers': self.scanner.dispatcher.stats(),
+            'connections': self.scanner.connection_stats()
+        })
+    
+    def handle_status(self, request):
         """Статус API сервера"""
+        snapshot = self.scanner.snapshot if self.scanner else None
         status = {
             'status': 'online',
             'timestamp': time.time(),
-            'scanner_running': self.scanner.is_running if self.scanner else False,
-            'servers_count': len(self.scanner.servers) if self.scanner else 0,
-            'saved_servers_count': len(self.scanner.saved_servers) if self.scanner else 0
+            'scanner_running': self.scanner.is_scanning if self.scanner else False,
+            'servers_count': len(snapshot.game_servers) + len(snapshot.disappeared_servers) if snapshot else 0,
+            'saved_servers_count': len(snapshot.saved_servers) if snapshot else 0,
+            'mode_counts': snapshot.stats.get('mode_counts', {}) if snapshot else {},
+            'status_counts': {status: len(servers) for status, servers in snapshot.server_index.items()
+                              if status != 'all'} if snapshot else {},
+            'version': snapshot.version if snapshot else 0,
+            'event_queues': self.scanner.events.stats() if self.scanner else {},
+            'upstream': self.scanner.upstream.stats() if self.scanner else {},
+            'steam_proxy': self.scanner.server_lists.stats() if self.scanner else {},
+            'response_cache': self.response_cache.stats(),
+            'compression': self.compression.stats() if self.compression else None,
+            'static': self.static.stats(),
+            'stream': {**self.scanner.change_feed.stats(), 'clients': self.stream_clients}
         }
-        self.send_json_response(status)
+        return self.json_response(status)
     
-    def handle_get_servers(self, query_params):
-        """Получение списка серверов"""
+    def handle_get_servers(self, request, snapshot):
+        """Получение списка серверов: фильтры, сортировка и страницы по курсору (server_query.py)"""
         try:
-            server_type = query_params.get('type', ['all'])[0]
-            
-            if server_type == 'all':
-                servers = list(self.scanner.servers.values())
-            elif server_type == 'game':
-                servers = [s for s in self.scanner.servers.values() if s.get('status') == 'game']
-            elif server_type == 'empty':
-                servers = [s for s in self.scanner.servers.values() if s.get('status') == 'empty']
-            elif server_type == 'disappeared':
-                servers = [s for s in self.scanner.servers.values() if s.get('status') == 'disappeared']
-            else:
-                servers = list(self.scanner.servers.values())
-            
-            # Сортировка по времени (новые сверху)
-            servers.sort(key=lambda x: x.get('last_seen', 0), reverse=True)
-            
-            self.send_json_response({
-                'servers': servers,
-                'count': len(servers),
-                'type': server_type
-            })
+            return self.json_response(servers_page(snapshot, request))
             
+        except ValueError as e:
+            return self.error_response(f"Неверные параметры: {str(e)}", 400)
         except Exception as e:
             logger.error(f"❌ Ошибка получения серверов: {e}")
-            self.send_error_response(f"Ошибка получения серверов: {str(e)}")
+            return self.error_response(f"Ошибка получения серверов: {str(e)}")
     
-    def handle_get_saved_servers(self):
+    def handle_get_saved_servers(self, request, snapshot):
         """Получение сохраненных серверов"""
         try:
-            saved_servers = []
-            for server_id, server_data in self.scanner.saved_servers.items():
-                # Определяем режим сервера по картам
-                mode = self.scanner.determine_server_mode_from_maps(server_data.get('map_history', []))
-                server_data['mode'] = mode
-                saved_servers.append(server_data)
+            return self.json_response(saved_servers_list(snapshot, classify_maps))
             
-            # Сортировка по количеству смен карт (больше сверху)
-            saved_servers.sort(key=lambda x: x.get('map_changes', 0), reverse=True)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения сохраненных серверов: {e}")
+            return self.error_response(f"Ошибка получения сохраненных серверов: {str(e)}")
+    
+    def handle_batch(self, request):
+        """Несколько запросов на чтение по одному снимку состояния (batch_queries.py)
+        
+        Тело: {"queries": [{"type": "status"}, {"type": "servers", "id": "game",
+                            "params": {"type": "game", "limit": 100}}, {"type": "saved_servers"}]}
+        """
+        try:
+            body = request.json()
+            if not isinstance(body, dict):
+                raise ValueError("Тело запроса должно быть JSON объектом")
+            return self.json_response(self.scanner.batch.run(body.get('queries')))
             
-            self.send_json_response({
-                'saved_servers': saved_servers,
-                'count': len(saved_servers)
+        except ValueError as e:
+            return self.error_response(f"Неверный запрос: {str(e)}", 400)
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного запроса: {e}")
+            return self.error_response(f"Ошибка пакетного запроса: {str(e)}")
+    
+    def handle_import_saved_servers(self, request):
+        """Массовый импорт сохраненных серверов (CSV или NDJSON в теле запроса)"""
+        try:
+            format_name = detect_format(request.query.get('format', [None])[0],
+                                        request.header('Content-Type'))
+            records = (record for _, record in iter_records(request.iter_lines(), format_name))
+            stats = self.scanner.import_saved_servers(records)
+            
+            return self.json_response({
+                'status': 'success',
+                'format': format_name,
+                'stats': stats
             })
             
+        except ValueError as e:
+            return self.error_response(f"Неверный запрос: {str(e)}", 400)
         except Exception as e:
-            logger.error(f"❌ Ошибка получения сохраненных серверов: {e}")
-            self.send_error_response(f"Ошибка получения сохраненных серверов: {str(e)}")
+            logger.error(f"❌ Ошибка импорта серверов: {e}")
+            return self.error_response(f"Ошибка импорта серверов: {str(e)}")
+    
+    def handle_export_saved_servers(self, request):
+        """Потоковый экспорт сохраненных серверов в CSV или NDJSON"""
+        try:
+            format_name = detect_format(request.query.get('format', ['ndjson'])[0])
+        except ValueError as e:
+            return self.error_response(str(e), 400)
+        
+        content_types = {
+            'csv': 'text/csv; charset=utf-8',
+            'ndjson': 'application/x-ndjson; charset=utf-8'
+        }
+        
+        # Длина заранее неизвестна - строки отдаются порциями (chunked)
+        return HTTPResponse(200, content_type=content_types[format_name],
+                            headers={'Content-Disposition': f'attachment; filename="saved_servers.{format_name}"'},
+                            stream=self.scanner.export_saved_servers(format_name))
     
-    def handle_scan(self, query_params):
+    def handle_scan(self, request):
         """Запуск сканирования"""
         try:
-            if not self.scanner.is_running:
+            if not self.scanner.is_scanning:
                 self.scanner.start_scanning()
                 message = "Сканирование запущено"
+                source = 'started'
             else:
-                message = "Сканирование уже запущено"
+                # Внеочередное сканирование: одновременные запросы объединяются
+                _, source = self.scanner.on_demand.submit('full_scan', self.scanner.run_single_scan,
+                                                          self.scanner.on_demand_ttl)
+                message = "Сканирование уже выполняется" if source != 'started' else "Внеочередное сканирование запущено"
             
-            self.send_json_response({
+            return self.json_response({
                 'status': 'success',
                 'message': message,
-                'scanner_running': self.scanner.is_running
+                'source': source,
+                'scanner_running': self.scanner.is_scanning
             })
             
         except Exception as e:
             logger.error(f"❌ Ошибка запуска сканирования: {e}")
-            self.send_error_response(f"Ошибка запуска сканирования: {str(e)}")
+            return self.error_response(f"Ошибка запуска сканирования: {str(e)}")
     
-    def handle_get_maps(self):
-        """Получение списка карт"""
+    def handle_get_maps(self, request, snapshot):
+        """Получение списка карт и карт, выбранных для сканирования"""
         try:
-            maps = self.scanner.maps if self.scanner else []
-            self.send_json_response({
+            maps = list(snapshot.maps.get('catalog', ()))
+            return self.json_response({
                 'maps': maps,
-                'count': len(maps)
+                'count': len(maps),
+                'selected_maps': list(snapshot.maps.get('selected', ()))
             })
             
         except Exception as e:
             logger.error(f"❌ Ошибка получения карт: {e}")
-            self.send_error_response(f"Ошибка получения карт: {str(e)}")
+            return self.error_response(f"Ошибка получения карт: {str(e)}")
+    
+    def handle_get_top_changing_servers(self, request):
+        """Топ серверов по количеству смен карт"""
+        try:
+            limit = int(request.query.get('limit', ['10'])[0])
+            window = request.query.get('window', ['all'])[0]
+            
+            top_servers = self.scanner.get_top_changing_servers(limit, window)
+            return self.json_response({
+                'servers': top_servers,
+                'count': len(top_servers),
+                'window': window
+            })
+            
+        except ValueError as e:
+            return self.error_response(f"Неверные параметры: {str(e)}", 400)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения топа серверов: {e}")
+            return self.error_response(f"Ошибка получения топа серверов: {str(e)}")
     
-    def handle_update_settings(self):
+    def handle_get_timeseries(self, request):
+        """Прореженные временные ряды заселенности карт и регионов
+        
+        Параметры: series=map:de_dust2:servers,region:3:players (или prefix=map:),
+        from/to - unix время, range - длительность в секундах (по умолчанию сутки),
+        points - максимум точек в ответе (по умолчанию 500)
+        """
+        try:
+            history = self.scanner.population_history
+            now = time.time()
+            end = float(request.query.get('to', [now])[0])
+            start = float(request.query.get('from', [end - float(request.query.get('range', [86400])[0])])[0])
+            points = min(int(request.query.get('points', ['500'])[0]), 5000)
+            
+            if 'series' in request.query:
+                keys = [key for key in request.query['series'][0].split(',') if key][:50]
+            else:
+                keys = history.keys(request.query.get('prefix', [''])[0])[:50]
+            
+            series = {}
+            for key in keys:
+                result = history.query(key, start, end, points)
+                if result is not None:
+                    series[key] = result
+            
+            return self.json_response({
+                'from': start,
+                'to': end,
+                'series': series,
+                'available': history.keys()
+            })
+            
+        except ValueError as e:
+            return self.error_response(f"Неверные параметры: {str(e)}", 400)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения временных рядов: {e}")
+            return self.error_response(f"Ошибка получения временных рядов: {str(e)}")
+    
+    def handle_update_settings(self, request):
         """Обновление настроек"""
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                settings = json.loads(post_data.decode('utf-8'))
+            if request.body:
+                settings = request.json()
                 
                 # Обновляем настройки сканера
                 if 'selected_maps' in settings:
@@ -199,107 +539,85 @@ class CS2APIHandler(BaseHTTPRequestHandler):
                 if 'auto_save_threshold' in settings:
                     self.scanner.auto_save_threshold = settings['auto_save_threshold']
                 
-                self.send_json_response({
+                return self.json_response({
                     'status': 'success',
                     'message': 'Настройки обновлены'
                 })
             else:
-                self.send_error_response("Нет данных для обновления")
+                return self.error_response("Нет данных для обновления")
                 
+        except (ValueError, TypeError) as e:
+            return self.error_response(f"Неверные настройки: {str(e)}", 400)
         except Exception as e:
             logger.error(f"❌ Ошибка обновления настроек: {e}")
-            self.send_error_response(f"Ошибка обновления настроек: {str(e)}")
+            return self.error_response(f"Ошибка обновления настроек: {str(e)}")
     
-    def handle_clear_cache(self):
-        """Очистка кэша"""
+    def handle_update_auto_save_rules(self, request):
+        """Замена правил автосохранения
+        
+        Тело: {"rules": [{"rule_id": "fast", "changes": 3, "window": 600,
+                          "map_pattern": "de_*", "mode_pattern": null, "name_pattern": null}]}
+        """
         try:
-            self.scanner.servers.clear()
-            self.send_json_response({
+            body = request.json()
+            
+            self.scanner.auto_save_rules.set_rules(body.get('rules') or [])
+            return self.json_response({
                 'status': 'success',
-                'message': 'Кэш очищен'
+                **self.scanner.auto_save_rules.stats()
             })
             
+        except (ValueError, TypeError, AttributeError) as e:
+            return self.error_response(f"Неверные правила: {str(e)}", 400)
         except Exception as e:
-            logger.error(f"❌ Ошибка очистки кэша: {e}")
-            self.send_error_response(f"Ошибка очистки кэша: {str(e)}")
+            logger.error(f"❌ Ошибка обновления правил автосохранения: {e}")
+            return self.error_response(f"Ошибка обновления правил автосохранения: {str(e)}")
     
-    def handle_static_files(self, path):
-        """Обработка статических файлов"""
+    def handle_clear_cache(self, request):
+        """Очистка кэша"""
         try:
-            if path == '/':
-                path = '/index.html'
-            
-            # Убираем /api/static/ из пути
-            if path.startswith('/api/static/'):
-                path = path[11:]  # Убираем '/api/static/'
-            
-            # Определяем путь к файлу
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            public_dir = os.path.join(current_dir, 'public')
-            file_path = os.path.join(public_dir, path.lstrip('/'))
-            
-            if not os.path.exists(file_path):
-                self.send_error_response("Файл не найден", 404)
-                return
-            
-            # Определяем MIME тип
-            mime_types = {
-                '.html': 'text/html',
-                '.css': 'text/css',
-                '.js': 'application/javascript',
-                '.json': 'application/json',
-                '.png': 'image/png',
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.gif': 'image/gif',
-                '.ico': 'image/x-icon'
-            }
-            
-            ext = os.path.splitext(file_path)[1].lower()
-            content_type = mime_types.get(ext, 'text/plain')
-            
-            with open(file_path, 'rb') as f:
-                content = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', str(len(content)))
-            self.end_headers()
-            self.wfile.write(content)
+            # Кэш сканирований по запросу; состояние сканера хранится в снимках
+            self.scanner.on_demand.invalidate()
+            self.response_cache.clear()
+            return self.json_response({
+                'status': 'success',
+                'message': 'Кэш очищен'
+            })
             
         except Exception as e:
-            logger.error(f"❌ Ошибка обработки статического файла: {e}")
-            self.send_error_response("Ошибка обработки файла")
+            logger.error(f"❌ Ошибка очистки кэша: {e}")
+            return self.error_response(f"Ошибка очистки кэша: {str(e)}")
     
-    def send_json_response(self, data):
-        """Отправка JSON ответа"""
-        try:
-            json_data = json.dumps(data, ensure_ascii=False, indent=2)
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Content-Length', str(len(json_data.encode('utf-8'))))
-            self.end_headers()
-            self.wfile.write(json_data.encode('utf-8'))
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки JSON: {e}")
-            self.send_error_response("Ошибка отправки ответа")
+    async def handle_static_files(self, request):
+        """Статические файлы из памяти (static_files.py)"""
+        path = request.path
+        # Убираем /api/static/ из пути
+        if path.startswith('/api/static/'):
+            path = path[11:]
+        
+        file_path = self.static.resolve(path)
+        if file_path is None:
+            return self.error_response("Файл не найден", 404)
+        
+        asset = self.static.cached(file_path)
+        if asset is None:
+            try:
+                asset = await asyncio.get_running_loop().run_in_executor(None, self.static.get, file_path)
+            except OSError as e:
+                logger.error(f"❌ Ошибка обработки статического файла: {e}")
+                return self.error_response("Ошибка обработки файла")
+        if asset is None:
+            return self.error_response("Файл не найден", 404)
+        coding = self.compression.negotiate(request.header('Accept-Encoding')) if self.compression else None
+        return self.static.response(request, asset, coding)
     
-    def send_error_response(self, message, status_code=500):
-        """Отправка ошибки"""
-        try:
-            error_data = {
-                'error': True,
-                'message': message,
-                'status_code': status_code
-            }
-            json_data = json.dumps(error_data, ensure_ascii=False)
-            self.send_response(status_code)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Content-Length', str(len(json_data.encode('utf-8'))))
-            self.end_headers()
-            self.wfile.write(json_data.encode('utf-8'))
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки ошибки: {e}")
+    def json_response(self, data, status=200):
+        """JSON ответ"""
+        return json_response(data, status)
+    
+    def error_response(self, message, status_code=500):
+        """Ответ с ошибкой"""
+        return error_response(message, status_code)
 
 class CS2APIServer:
     def __init__(self, port=8000):
@@ -309,47 +627,71 @@ class CS2APIServer:
         self.is_running = False
     
     def start(self):
-        """Запуск API сервера"""
+        """Запуск API сервера (блокирует до остановки)"""
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.stop()
+    
+    async def serve(self):
+        """HTTP API, статика и WebSocket на одном порту в текущем цикле событий"""
         try:
             # Инициализируем сканер
             self.scanner = CS2ScannerSimple(max_workers=10)
             
-            # Создаем обработчик с передачей сканера
-            def handler(*args, **kwargs):
-                return CS2APIHandler(*args, scanner=self.scanner, **kwargs)
-            
-            # Запускаем HTTP сервер
-            self.server = HTTPServer(('0.0.0.0', self.port), handler)
+            # WebSocket upgrade на любом пути передается обработчику сканера
+            handler = CS2APIHandler(self.scanner)
+            self.server = AsyncHTTPServer(
+                handler,
+                websocket_handler=self.scanner.handle_websocket,
+                websocket_kwargs={**keepalive_kwargs(), **serve_kwargs()},
+                default_headers=CORS_HEADERS,
+                compression=handler.compression
+            )
+            await self.server.start('0.0.0.0', self.port)
             self.is_running = True
             
             logger.info(f"🚀 API сервер запущен на порту {self.port}")
             logger.info(f"📡 Доступен по адресу: http://localhost:{self.port}")
+            logger.info(f"🔌 WebSocket на том же порту: ws://localhost:{self.port}/")
             logger.info(f"🔗 API endpoints:")
             logger.info(f"   GET  /api/status - статус сервера")
-            logger.info(f"   GET  /api/servers - список серверов")
+            logger.info(f"   GET  /metrics - метрики Prometheus")
+            logger.info(f"   GET  /api/servers - список серверов (type, map, mode, region, players_min, players_max, q, sort, limit, cursor)")
             logger.info(f"   GET  /api/saved-servers - сохраненные серверы")
+            logger.info(f"   GET  /api/saved-servers/export - экспорт серверов (CSV/NDJSON)")
+            logger.info(f"   POST /api/saved-servers/import - импорт серверов (CSV/NDJSON)")
+            logger.info(f"   POST /api/batch - несколько запросов на чтение по одному снимку")
             logger.info(f"   GET  /api/scan - запуск сканирования")
             logger.info(f"   GET  /api/maps - список карт")
+            logger.info(f"   GET  /api/top-changing-servers - топ серверов по сменам карт")
+            logger.info(f"   GET  /api/timeseries - история заселенности карт и регионов")
+            logger.info(f"   GET  /api/ws-metrics - задержки обработчиков WebSocket по типам")
+            logger.info(f"   GET  /api/stream - изменения серверов (Server-Sent Events)")
+            logger.info(f"   GET  /api/changes?version= - изменения серверов (long-poll)")
+            logger.info(f"   GET  /api/IGameServersService/GetServerList/v1/ - прокси Steam API (кэш и объединение запросов)")
             logger.info(f"   POST /api/update-settings - обновление настроек")
             logger.info(f"   POST /api/clear-cache - очистка кэша")
+            logger.info(f"   GET/POST /api/auto-save-rules - правила автосохранения")
             
-            # Запускаем сканер в фоновом режиме
-            scanner_thread = threading.Thread(target=self.scanner.start_scanning, daemon=True)
-            scanner_thread.start()
+            # Сканер работает в своих потоках, рассылка WebSocket - в этом цикле событий
+            self.scanner.start_scanning()
             logger.info("🔍 Сканер запущен в фоновом режиме")
             
-            # Запускаем сервер
-            self.server.serve_forever()
+            await self.server.serve_forever()
             
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"❌ Ошибка запуска API сервера: {e}")
             raise
     
     def stop(self):
         """Остановка API сервера"""
-        if self.server:
-            self.server.shutdown()
+        if self.is_running:
             self.is_running = False
+            if self.scanner:
+                self.scanner.stop_scanning()
             logger.info("🛑 API сервер остановлен")
 
 def main():
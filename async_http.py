@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Асинхронный HTTP сервер на aiohttp.web
+Один порт и один цикл событий для API, статики и WebSocket: запросы
+с Upgrade: websocket принимает WebSocketResponse, остальные передаются
+обработчику приложения. Разбор HTTP, keep-alive и chunked тела - aiohttp
+"""
+
+import asyncio
+import json
+import logging
+import os
+import weakref
+from urllib.parse import parse_qs
+
+from aiohttp import WSMsgType, web
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = int(os.environ.get('HTTP_MAX_BODY_SIZE', 64 << 20))
+KEEPALIVE_TIMEOUT = float(os.environ.get('HTTP_KEEPALIVE_TIMEOUT', 15))
+STREAM_CHUNK_SIZE = 64 * 1024  # Размер порции потокового ответа
+
+class HTTPRequest:
+    """Запрос для обработчиков приложения; тело читается целиком (не больше MAX_BODY_SIZE)"""
+
+    __slots__ = ('method', 'path', 'query', 'version', 'headers', 'body', 'remote_address')
+
+    def __init__(self, method, path, query_string='', version='HTTP/1.1', headers=None, body=b'',
+                 remote_address=None):
+        self.method = method
+        self.path = path
+        self.query = parse_qs(query_string)
+        self.version = version
+        self.headers = headers or {}  # Имена в нижнем регистре
+        self.body = body
+        self.remote_address = remote_address
+
+    @classmethod
+    async def read(cls, request):
+        """HTTPRequest из запроса aiohttp (повторяющиеся заголовки объединяются через запятую)"""
+        headers = {}
+        for name, value in request.headers.items():
+            name = name.lower()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+        version = f"HTTP/{request.version.major}.{request.version.minor}"
+        body = await request.read() if request.body_exists else b''
+        peername = request.transport.get_extra_info('peername') if request.transport else None
+        return cls(request.method, request.path, request.query_string, version, headers, body, peername)
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def param(self, name, default=None):
+        """Первое значение параметра строки запроса"""
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8')) if self.body else {}
+
+    def iter_lines(self):
+        """Построчное чтение тела (BOM в начале отбрасывается)"""
+        first_line = True
+        for line in self.body.splitlines(keepends=True):
+            yield line.decode('utf-8-sig' if first_line else 'utf-8', errors='replace')
+            first_line = False
+
+class HTTPResponse:
+    """Ответ: тело целиком (body) или итератор порций (stream)
+
+    stream - синхронный итератор строк или байтов, читается порциями
+    в пуле потоков и отправляется с Transfer-Encoding: chunked; асинхронный
+    генератор отправляется по мере получения порций (SSE). file - (путь,
+    размер) файла, отправляемого через sendfile.
+    """
+
+    __slots__ = ('status', 'headers', 'body', 'stream', 'encoded', 'file')
+
+    def __init__(self, status=200, body=b'', content_type=None, headers=None, stream=None, encoded=None,
+                 file=None):
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers['Content-Type'] = content_type
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.stream = stream
+        self.encoded = {} if encoded is None else encoded  # Кодировка → сжатое тело (http_compression.py)
+        self.file = file
+
+def json_response(data, status=200, headers=None, pretty=False):
+    """JSON ответ: компактный, с отступами только по запросу (?pretty=1)"""
+    if pretty:
+        body = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return HTTPResponse(status, body, 'application/json; charset=utf-8', headers)
+
+def pretty_response(response):
+    """JSON ответ с отступами вместо компактного"""
+    if response.stream is not None or not response.headers.get('Content-Type', '').startswith('application/json'):
+        return response
+    return json_response(json.loads(response.body), response.status, response.headers, pretty=True)
+
+def error_response(message, status=500, headers=None):
+    body = json.dumps({'error': True, 'message': message, 'status_code': status}, ensure_ascii=False,
+                      separators=(',', ':'))
+    return HTTPResponse(status, body, 'application/json; charset=utf-8', headers)
+
+class WebSocketConnection:
+    """WebSocket соединение aiohttp для обработчиков сканера
+
+    send/close/async for и remote_address - тот же интерфейс, что у
+    соединений websockets: str отправляется текстовым кадром, bytes -
+    двоичным, а с text=True - текстовым без повторного кодирования
+    (уже UTF-8). Итерация заканчивается при закрытии соединения.
+    """
+
+    __slots__ = ('response', 'remote_address', 'transport', '__weakref__')
+
+    def __init__(self, response, request):
+        self.response = response
+        self.transport = request.transport
+        self.remote_address = self.transport.get_extra_info('peername') if self.transport else None
+
+    @property
+    def closed(self):
+        return self.response.closed
+
+    @property
+    def extensions(self):
+        return ('permessage-deflate',) if self.response.compress else ()
+
+    async def send(self, message, text=False):
+        if isinstance(message, str):
+            await self.response.send_str(message)
+        elif text:
+            await self.response.send_frame(message, WSMsgType.TEXT)
+        else:
+            await self.response.send_bytes(message)
+
+    async def close(self, code=1000, reason=''):
+        await self.response.close(code=code, message=reason.encode('utf-8'))
+
+    async def __aiter__(self):
+        async for message in self.response:
+            if message.type == WSMsgType.TEXT or message.type == WSMsgType.BINARY:
+                yield message.data
+            elif message.type == WSMsgType.ERROR:
+                logger.info(f"🔌 Ошибка WebSocket соединения: {self.response.exception()}")
+                break
+
+class AsyncHTTPServer:
+    """HTTP и WebSocket сервер на aiohttp.web
+
+    handler - корутина HTTPRequest → HTTPResponse (None - только WebSocket,
+    остальные запросы получают 426). websocket_handler - корутина,
+    принимающая WebSocketConnection; websocket_kwargs - аргументы
+    web.WebSocketResponse (heartbeat, max_msg_size, compress).
+    compression - ResponseCompressor (http_compression.py) для сжатия ответов.
+    """
+
+    def __init__(self, handler, websocket_handler=None, websocket_kwargs=None, default_headers=None,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT, compression=None):
+        self.handler = handler
+        self.compression = compression
+        self.websocket_handler = websocket_handler
+        self.websocket_kwargs = dict(websocket_kwargs or {})
+        self.default_headers = dict(default_headers or {})
+        self.keepalive_timeout = keepalive_timeout
+        self.runner = None
+        self.stopped = None
+        self.websockets = set()
+        self.transports = weakref.WeakSet()  # Соединения, уже обслужившие запрос (keep-alive)
+        self.requests = 0
+        self.reused = 0
+        self.upgrades = 0
+        self.errors = 0
+
+    async def start(self, host, port):
+        app = web.Application(client_max_size=MAX_BODY_SIZE)
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None, keepalive_timeout=self.keepalive_timeout)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port, reuse_address=True, backlog=1024).start()
+        self.stopped = asyncio.Event()
+        return self
+
+    async def handle(self, request):
+        if request.headers.get('Upgrade', '').lower() == 'websocket' and self.websocket_handler is not None:
+            return await self.handle_websocket(request)
+
+        self.requests += 1
+        if request.transport in self.transports:
+            self.reused += 1
+        elif request.transport is not None:
+            self.transports.add(request.transport)
+
+        try:
+            http_request = await HTTPRequest.read(request)
+        except web.HTTPException as e:
+            return self.plain_response(error_response(e.reason, e.status))
+        response = await self.dispatch(http_request)
+        return await self.send(request, response)
+
+    async def handle_websocket(self, request):
+        response = web.WebSocketResponse(**self.websocket_kwargs)
+        if not response.can_prepare(request).ok:
+            return self.plain_response(error_response('Неверный WebSocket запрос', 400))
+        await response.prepare(request)
+        self.upgrades += 1
+        self.websockets.add(response)
+        try:
+            await self.websocket_handler(WebSocketConnection(response, request))
+        finally:
+            self.websockets.discard(response)
+            if not response.closed:
+                await response.close()
+        return response
+
+    async def dispatch(self, request):
+        if self.handler is None:
+            return error_response('Требуется WebSocket соединение', 426, {'Upgrade': 'websocket'})
+        try:
+            response = await self.handler(request)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Ошибка обработки запроса {request.method} {request.path}: {e}")
+            return error_response(f"Ошибка сервера: {str(e)}")
+        if self.compression is not None:
+            response = await self.compression.encode(request, response)
+        return response
+
+    def plain_response(self, response):
+        """Ответ aiohttp для ответа с телом целиком"""
+        return web.Response(status=response.status, body=response.body,
+                            headers={**self.default_headers, **response.headers})
+
+    async def send(self, request, response):
+        headers = {**self.default_headers, **response.headers}
+        if response.file is not None:
+            # FileResponse сам отвечает на HEAD и отправляет файл через sendfile
+            return web.FileResponse(response.file[0], status=response.status, headers=headers)
+        if response.stream is None:
+            return self.plain_response(response)
+        if request.method == 'HEAD':
+            return web.Response(status=response.status, headers=headers)
+
+        stream_response = web.StreamResponse(status=response.status, headers=headers)
+        await stream_response.prepare(request)
+        try:
+            if hasattr(response.stream, '__aiter__'):
+                await self.send_async_stream(stream_response, response.stream)
+            else:
+                await self.send_stream(stream_response, response.stream)
+            await stream_response.write_eof()
+        except ConnectionError:
+            pass  # Клиент отключился, не дождавшись конца потока
+        return stream_response
+
+    async def send_stream(self, stream_response, stream):
+        """Синхронный итератор: порции собираются в пуле потоков"""
+        iterator = iter(stream)
+
+        def take():
+            parts = []
+            size = 0
+            for part in iterator:
+                part = part.encode('utf-8') if isinstance(part, str) else part
+                parts.append(part)
+                size += len(part)
+                if size >= STREAM_CHUNK_SIZE:
+                    return b''.join(parts), False
+            return b''.join(parts), True
+
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            data, done = await loop.run_in_executor(None, take)
+            if data:
+                await stream_response.write(data)
+
+    async def send_async_stream(self, stream_response, stream):
+        """Асинхронный генератор (SSE): каждая порция отправляется сразу"""
+        try:
+            async for part in stream:
+                data = part.encode('utf-8') if isinstance(part, str) else part
+                if data:
+                    await stream_response.write(data)
+        finally:
+            await stream.aclose()
+
+    async def serve_forever(self):
+        await self.stopped.wait()
+
+    async def close(self):
+        for response in list(self.websockets):
+            await response.close(code=1001, message=b'server shutdown')
+        await self.runner.cleanup()
+        self.stopped.set()
+
+    def stats(self):
+        server = self.runner.server if self.runner is not None else None
+        return {
+            'connections': len(server.connections) if server is not None else 0,
+            'websockets': len(self.websockets),
+            'requests': self.requests,
+            'keepalive_reused': self.reused,
+            'websocket_upgrades': self.upgrades,
+            'errors': self.errors
+        }
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Правила автосохранения серверов
+Правило: "N смен карт за окно W" + необязательные шаблоны карты/режима/имени
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import PERSIST_DURATION
+
+logger = logging.getLogger(__name__)
+
+RULES_FILE = 'auto_save_rules.json'
+
+# Причины, по которым сработавшее правило не привело к сохранению
+SUPPRESS_REASONS = ('cooldown', 'already_saved', 'no_address')
+
+class AutoSaveRule:
+    """Одно правило автосохранения
+
+    Для каждого сервера хранится не более N последних отметок времени,
+    поэтому проверка окна на каждое событие стоит O(1).
+    """
+
+    FIELDS = ('rule_id', 'changes', 'window', 'map_pattern', 'mode_pattern', 'name_pattern', 'enabled')
+
+    def __init__(self, rule_id, changes, window=None, map_pattern=None,
+                 mode_pattern=None, name_pattern=None, enabled=True):
+        if not rule_id or not isinstance(rule_id, str):
+            raise ValueError("Не указан идентификатор правила")
+        if not isinstance(changes, int) or isinstance(changes, bool) or changes <= 0:
+            raise ValueError("Количество смен должно быть положительным целым числом")
+        if window is not None and (not isinstance(window, (int, float)) or isinstance(window, bool) or window <= 0):
+            raise ValueError("Окно должно быть положительным числом секунд")
+        for pattern in (map_pattern, mode_pattern, name_pattern):
+            if pattern is not None and not isinstance(pattern, str):
+                raise ValueError("Шаблон должен быть строкой")
+
+        self.rule_id = rule_id
+        self.changes = changes
+        self.window = window
+        self.map_pattern = map_pattern or None
+        self.mode_pattern = mode_pattern or None
+        self.name_pattern = name_pattern or None
+        self.enabled = bool(enabled)
+
+        self.matched = 0
+        self.saved = 0
+        self.suppressed = {reason: 0 for reason in SUPPRESS_REASONS}
+        self._events = {}  # steam_id → deque последних отметок времени
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError("Правило должно быть объектом")
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def stats(self):
+        return {
+            **self.to_dict(),
+            'matched': self.matched,
+            'saved': self.saved,
+            'suppressed': dict(self.suppressed),
+            'suppressed_total': sum(self.suppressed.values()),
+            'tracked_servers': len(self._events)
+        }
+
+    def matches_filters(self, server_name, new_map, mode):
+        """Проверка шаблонов карты, режима и имени (без учета регистра)"""
+        for pattern, value in ((self.map_pattern, new_map),
+                               (self.mode_pattern, mode),
+                               (self.name_pattern, server_name)):
+            if pattern and not fnmatch.fnmatchcase((value or '').lower(), pattern.lower()):
+                return False
+        return True
+
+    def register(self, steam_id, now):
+        """Регистрация смены карты; True, если набралось N смен в окне"""
+        events = self._events.get(steam_id)
+        if events is None:
+            events = self._events[steam_id] = deque(maxlen=self.changes)
+        events.append(now)
+
+        if len(events) < self.changes:
+            return False
+        return self.window is None or now - events[0] <= self.window
+
+    def forget(self, steam_id):
+        """Сброс накопленных смен для сервера (после сохранения)"""
+        self._events.pop(steam_id, None)
+
+class AutoSaveRules:
+    """Набор правил автосохранения с инкрементальной проверкой"""
+
+    DEFAULT_RULE_ID = 'default'
+
+    def __init__(self, rules_file=RULES_FILE):
+        self.rules_file = rules_file
+        self.lock = threading.Lock()
+        self.rules = [self.default_rule()]
+
+    @classmethod
+    def default_rule(cls, changes=3):
+        return AutoSaveRule(cls.DEFAULT_RULE_ID, changes, window=3600)
+
+    def get_rule(self, rule_id):
+        for rule in self.rules:
+            if rule.rule_id == rule_id:
+                return rule
+        return None
+
+    def evaluate(self, steam_id, server_name, new_map, mode, now=None):
+        """Проверка смены карты всеми правилами; возвращает сработавшие правила"""
+        now = time.time() if now is None else now
+        fired = []
+        with self.lock:
+            for rule in self.rules:
+                if not rule.enabled or not rule.matches_filters(server_name, new_map, mode):
+                    continue
+                if rule.register(steam_id, now):
+                    rule.matched += 1
+                    fired.append(rule)
+        return fired
+
+    def record_saved(self, rule, steam_id):
+        with self.lock:
+            rule.saved += 1
+            rule.forget(steam_id)
+
+    def record_suppressed(self, rule, reason):
+        with self.lock:
+            rule.suppressed[reason] += 1
+
+    def get_threshold(self):
+        """Порог правила по умолчанию (для совместимости с auto_save_threshold)"""
+        rule = self.get_rule(self.DEFAULT_RULE_ID)
+        return rule.changes if rule else None
+
+    def set_threshold(self, changes):
+        """Изменение порога правила по умолчанию"""
+        with self.lock:
+            rule = self.get_rule(self.DEFAULT_RULE_ID)
+            if rule is None:
+                self.rules.insert(0, self.default_rule(changes))
+            elif rule.changes != changes:
+                data = rule.to_dict()
+                data['changes'] = changes
+                self.rules[self.rules.index(rule)] = AutoSaveRule.from_dict(data)
+        self.save()
+
+    def set_rules(self, rules_data):
+        """Замена всех правил; счетчики сохраняются у правил с тем же конфигом"""
+        new_rules = [AutoSaveRule.from_dict(data) for data in rules_data]
+        rule_ids = [rule.rule_id for rule in new_rules]
+        if len(rule_ids) != len(set(rule_ids)):
+            raise ValueError("Идентификаторы правил должны быть уникальными")
+
+        with self.lock:
+            for index, rule in enumerate(new_rules):
+                old_rule = self.get_rule(rule.rule_id)
+                if old_rule and old_rule.to_dict() == rule.to_dict():
+                    new_rules[index] = old_rule
+            self.rules = new_rules
+        self.save()
+
+    def upsert_rule(self, rule_data):
+        """Добавление или замена одного правила"""
+        rule = AutoSaveRule.from_dict(rule_data)
+        with self.lock:
+            old_rule = self.get_rule(rule.rule_id)
+            if old_rule:
+                self.rules[self.rules.index(old_rule)] = rule
+            else:
+                self.rules.append(rule)
+        self.save()
+        return rule
+
+    def delete_rule(self, rule_id):
+        with self.lock:
+            rule = self.get_rule(rule_id)
+            if rule is None:
+                return False
+            self.rules.remove(rule)
+        self.save()
+        return True
+
+    def stats(self):
+        with self.lock:
+            rules = [rule.stats() for rule in self.rules]
+        return {
+            'rules': rules,
+            'matched': sum(rule['matched'] for rule in rules),
+            'saved': sum(rule['saved'] for rule in rules),
+            'suppressed': sum(rule['suppressed_total'] for rule in rules)
+        }
+
+    def load(self):
+        """Загрузка правил из файла"""
+        if not os.path.exists(self.rules_file):
+            logger.info(f"⚙️ Не найден файл {self.rules_file}, используются правила по умолчанию")
+            return
+        try:
+            with open(self.rules_file, 'r') as f:
+                rules = [AutoSaveRule.from_dict(data) for data in json.load(f)]
+            with self.lock:
+                self.rules = rules
+            logger.info(f"⚙️ Загружено {len(rules)} правил автосохранения")
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"❌ Ошибка загрузки правил автосохранения: {e}")
+
+    def save(self):
+        """Сохранение правил в файл"""
+        try:
+            with self.lock:
+                data = [rule.to_dict() for rule in self.rules]
+            with PERSIST_DURATION.time('auto_save_rules'), open(self.rules_file, 'w') as f:
+                json.dump(data, f, indent=4)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения правил автосохранения: {e}")
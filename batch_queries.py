@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Пакетные запросы на чтение
+Несколько запросов панели (статус, серверы, сохраненные серверы, карты,
+настройки) выполняются по одному снимку состояния и возвращаются одним
+ответом: POST /api/batch и WebSocket сообщение batch
+"""
+
+from server_query import ServerQuery
+
+MAX_BATCH_QUERIES = 32
+
+class QueryParams:
+    """Параметры запроса из JSON объекта с тем же интерфейсом, что у HTTPRequest.param"""
+
+    def __init__(self, params):
+        self.params = params or {}
+
+    def param(self, name, default=None):
+        value = self.params.get(name)
+        return default if value is None else str(value)
+
+def servers_page(snapshot, params):
+    """Страница /api/servers (фильтры и курсор - server_query.py); ValueError для неверных параметров"""
+    query = ServerQuery(params)
+    servers, candidates, next_cursor = query.run(snapshot.server_query)
+    return {
+        'servers': servers,
+        'count': len(servers),
+        'type': params.param('type', 'all'),
+        'sort': query.sort,
+        'limit': query.limit,
+        'candidates': candidates,
+        'next_cursor': next_cursor,
+        'version': snapshot.version_of('server_query')
+    }
+
+def saved_servers_list(snapshot, classify_maps):
+    """Сохраненные серверы с режимом по истории карт, больше смен карт - выше"""
+    saved_servers = []
+    for server_data in snapshot.saved_servers.values():
+        # Определяем режим сервера по картам (копия: записи снимка не изменяются)
+        mode = classify_maps(server_data.get('map_history', []))
+        if mode != 'unknown':
+            server_data = {**server_data, 'mode': mode}
+        saved_servers.append(server_data)
+    saved_servers.sort(key=lambda x: x.get('map_changes', 0), reverse=True)
+    return {
+        'saved_servers': saved_servers,
+        'count': len(saved_servers),
+        'version': snapshot.version_of('saved_servers')
+    }
+
+def status_summary(scanner, snapshot):
+    return {
+        'scanner_running': scanner.is_scanning,
+        'servers_count': len(snapshot.game_servers) + len(snapshot.disappeared_servers),
+        'saved_servers_count': len(snapshot.saved_servers),
+        'mode_counts': snapshot.stats.get('mode_counts', {}),
+        'status_counts': {status: len(servers) for status, servers in snapshot.server_index.items()
+                          if status != 'all'},
+        'version': snapshot.version
+    }
+
+class BatchQueries:
+    """Таблица запросов на чтение: тип → функция (snapshot, params)"""
+
+    def __init__(self, scanner, classify_maps):
+        self.scanner = scanner
+        self.queries = {
+            'status': lambda snapshot, params: status_summary(self.scanner, snapshot),
+            'servers': servers_page,
+            'saved_servers': lambda snapshot, params: saved_servers_list(snapshot, classify_maps),
+            'maps': lambda snapshot, params: {'maps': self.scanner.maps, 'count': len(self.scanner.maps)},
+            'settings': lambda snapshot, params: {
+                'selected_maps': sorted(self.scanner.selected_maps),
+                'auto_save_threshold': self.scanner.auto_save_threshold,
+                'scan_interval': self.scanner.scan_interval,
+                'api_key_set': bool(self.scanner.api_key)
+            },
+            'auto_save_rules': lambda snapshot, params: self.scanner.auto_save_rules.stats()
+        }
+
+    def run(self, queries, snapshot=None):
+        """Ответы на все запросы по одному снимку
+
+        queries - [{"type": "servers", "id": "game", "params": {"type": "game"}}, ...];
+        ошибка одного запроса не отменяет остальные.
+        """
+        if not isinstance(queries, list) or not queries:
+            raise ValueError("queries должен быть непустым списком")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise ValueError(f"Не больше {MAX_BATCH_QUERIES} запросов в пакете")
+
+        snapshot = snapshot or self.scanner.snapshot
+        results = []
+        for index, query in enumerate(queries):
+            if not isinstance(query, dict):
+                results.append({'id': index, 'status': 'error', 'message': 'Запрос должен быть объектом'})
+                continue
+            query_type = query.get('type')
+            result = {'id': query.get('id', index), 'type': query_type}
+            function = self.queries.get(query_type)
+            params = query.get('params')
+            if function is None:
+                result.update(status='error', message=f'Неизвестный тип запроса: {query_type}')
+            elif params is not None and not isinstance(params, dict):
+                result.update(status='error', message='params должен быть объектом')
+            else:
+                try:
+                    result.update(status='success', data=function(snapshot, QueryParams(params)))
+                except ValueError as e:
+                    result.update(status='error', message=str(e))
+            results.append(result)
+
+        return {
+            'version': snapshot.version,
+            'created_at': snapshot.created_at,
+            'results': results
+        }
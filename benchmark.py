@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки CS2 Tool
+Запуск: python benchmark.py <сценарий> [параметры]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def make_scanner():
+    """Сканер в пустой временной директории (без сохраненных файлов)"""
+    from scanner_simple import CS2ScannerSimple
+    os.chdir(tempfile.mkdtemp(prefix='cs2_bench_'))
+    logging.getLogger().setLevel(logging.WARNING)
+    return CS2ScannerSimple(max_workers=1)
+
+def bench_import(args):
+    """Импорт N сохраненных серверов: массовый импорт против add_saved_server"""
+    from saved_servers_io import iter_records
+
+    records = [
+        {
+            'ip': f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            'port': str(27015 + i % 10),
+            'name': f"Bench Server {i}",
+            'mode': 'Premier/Competitive',
+            'description': 'benchmark'
+        }
+        for i in range(args.count)
+    ]
+    ndjson_lines = [json.dumps(record) + '\n' for record in records]
+    csv_lines = ['ip,port,name,mode,description\n'] + [
+        f"{r['ip']},{r['port']},{r['name']},{r['mode']},{r['description']}\n" for r in records
+    ]
+
+    print(f"📦 Импорт {args.count} серверов")
+
+    for format_name, lines in (('ndjson', ndjson_lines), ('csv', csv_lines)):
+        scanner = make_scanner()
+        started = time.perf_counter()
+        stats = scanner.import_saved_servers(record for _, record in iter_records(lines, format_name))
+        elapsed = time.perf_counter() - started
+        print(f"   {format_name:7} массовый импорт: {elapsed * 1000:9.1f} мс "
+              f"(добавлено {stats['added']}, файл {os.path.getsize('saved_servers.json') // 1024} КБ)")
+
+    # Поштучное добавление дорогое (перезапись файла на каждый сервер) - меряем на части
+    sample = min(args.count, args.sample)
+    scanner = make_scanner()
+    started = time.perf_counter()
+    for record in records[:sample]:
+        scanner.add_saved_server(record['ip'], record['port'], record['name'], record['mode'], record['description'])
+    elapsed = time.perf_counter() - started
+    print(f"   поштучно add_saved_server: {elapsed * 1000:9.1f} мс на {sample} серверов "
+          f"(~{elapsed / sample * args.count:.1f} с на {args.count} при линейной экстраполяции)")
+
+def make_servers(count):
+    """Синтетические записи серверов в формате Steam GetServerList"""
+    maps = ('de_dust2', 'de_mirage', 'de_inferno', 'de_nuke', 'de_ancient', 'graphics_settings')
+    return [
+        {
+            'addr': f"10.0.{i // 256 % 256}.{i % 256}:27015",
+            'gameport': 27015,
+            'steamid': str(90000000000000000 + i),
+            'name': f"CS2 Community Server #{i} | 128 tick",
+            'appid': 730,
+            'gamedir': 'csgo',
+            'version': '1.40.2.1',
+            'product': 'cs2',
+            'region': 3,
+            'players': i % 11,
+            'max_players': 10,
+            'bots': 0,
+            'map': maps[i % len(maps)],
+            'secure': True,
+            'dedicated': True,
+            'os': 'l',
+            'gametype': 'empty,secure',
+            'mode': 'unknown'
+        }
+        for i in range(count)
+    ]
+
+def bench_broadcast(args):
+    """CPU на рассылку и байты на клиента: JSON на клиента, JSON один раз, MessagePack, deflate"""
+    import zlib
+    from wire_format import compression_settings, encode_message, msgpack
+
+    servers = make_servers(args.servers)
+    payload = {'type': 'scan_complete', 'stats': {}, 'game_servers': servers[:args.servers // 2],
+               'disappeared_servers': servers[args.servers // 2:]}
+
+    def cpu(function, repeat=args.repeat):
+        started = time.process_time()
+        for _ in range(repeat):
+            result = function()
+        return (time.process_time() - started) / repeat, result
+
+    def deflate(data, level, mem_level, window_bits):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -window_bits, mem_level)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    print(f"📡 Рассылка {args.servers} серверов на {args.clients} клиентов")
+
+    per_client, message = cpu(lambda: [json.dumps(payload) for _ in range(args.clients)], 1)
+    print(f"   json.dumps на каждого клиента: {per_client * 1000:8.1f} мс CPU, {len(message[0]):9} байт/клиент")
+
+    once, message = cpu(lambda: encode_message(payload))
+    print(f"   JSON один раз:                 {once * 1000:8.1f} мс CPU, {len(message):9} байт/клиент")
+
+    if msgpack is not None:
+        packed_time, packed = cpu(lambda: encode_message(payload, 'msgpack'))
+        print(f"   MessagePack + словарь полей:   {packed_time * 1000:8.1f} мс CPU, {len(packed):9} байт/клиент")
+    else:
+        print("   MessagePack: не установлен (pip install msgpack)")
+
+    settings = compression_settings()
+    for title, level, mem_level, window_bits in (
+        ('deflate по умолчанию (9/8/15)', 9, 8, 15),
+        (f"deflate сервера ({settings['level']}/{settings['mem_level']}/{settings['window_bits']})",
+         settings['level'], settings['mem_level'], settings['window_bits']),
+    ):
+        deflate_time, compressed = cpu(lambda: deflate(message, level, mem_level, window_bits))
+        print(f"   {title:31} {(once + deflate_time * args.clients) * 1000:8.1f} мс CPU, "
+              f"{len(compressed):9} байт/клиент")
+
+def rss_bytes():
+    """Текущий RSS процесса (Linux /proc, иначе пиковый из getrusage)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def raise_file_limit(needed):
+    """Лимит открытых файлов под нужное число сокетов"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < needed:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (needed if hard == resource.RLIM_INFINITY else min(hard, needed), hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def websocket_client_worker(port, count, messages, compression, results):
+    """Процесс с count клиентами: время доставки каждого bench-сообщения"""
+    import asyncio
+    import re
+    import websockets
+
+    raise_file_limit(count + 256)
+    pattern = re.compile(r'"sent_at": ([0-9.]+)')
+
+    async def client(semaphore, latencies):
+        async with semaphore:
+            for _ in range(100):
+                try:
+                    websocket = await websockets.connect(f'ws://127.0.0.1:{port}', max_size=None, ping_interval=None,
+                                                         compression='deflate' if compression else None,
+                                                         open_timeout=60)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.2)
+            else:
+                return
+        try:
+            received = 0
+            while received < messages:
+                message = await asyncio.wait_for(websocket.recv(), 60)
+                now = time.time()
+                match = pattern.search(message, 0, 200) if isinstance(message, str) else None
+                if match:
+                    latencies.append(now - float(match.group(1)))
+                    received += 1
+        finally:
+            await websocket.close()
+
+    async def run():
+        latencies = []
+        semaphore = asyncio.Semaphore(50)  # Одновременных рукопожатий
+        await asyncio.gather(*(client(semaphore, latencies) for _ in range(count)), return_exceptions=True)
+        results.put(latencies)
+
+    asyncio.run(run())
+
+def bench_websocket(args):
+    """Нагрузочный тест рассылки: N клиентов в отдельных процессах против handle_websocket"""
+    import asyncio
+    import multiprocessing
+    import socket
+
+    if not args.compression:
+        os.environ['WS_COMPRESSION'] = 'none'
+    from async_http import AsyncHTTPServer
+    from wire_format import serve_kwargs
+    from ws_connections import keepalive_kwargs
+
+    scanner = make_scanner()
+    scanner.connections.settings.update(max_connections=args.clients, max_per_ip=args.clients)
+    raise_file_limit(args.clients + 256)
+    payload_servers = make_servers(args.servers)
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    # Клиенты запускаются до цикла событий сервера и переподключаются, пока он не поднимется
+    results = multiprocessing.Queue()
+    per_process = [args.clients // args.processes + (1 if i < args.clients % args.processes else 0)
+                   for i in range(args.processes)]
+    workers = [multiprocessing.Process(target=websocket_client_worker,
+                                       args=(port, count, args.messages, args.compression, results), daemon=True)
+               for count in per_process if count]
+    rss_start = rss_bytes()
+    for worker in workers:
+        worker.start()
+
+    print(f"🔌 Рассылка {args.messages} сообщений ({args.servers} серверов) на {args.clients} клиентов "
+          f"в {len(workers)} процессах, сжатие {'вкл' if args.compression else 'выкл'}")
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        server = AsyncHTTPServer(None, websocket_handler=scanner.handle_websocket,
+                                 websocket_kwargs={**keepalive_kwargs(), **serve_kwargs()})
+        await server.start('127.0.0.1', port)
+        try:
+            started = time.perf_counter()
+            while len(scanner.connections.connections) < args.clients and time.perf_counter() - started < 300:
+                await asyncio.sleep(0.2)
+            connected = len(scanner.connections.connections)
+            connect_time = time.perf_counter() - started
+            rss_connected = rss_bytes()
+
+            for seq in range(args.messages):
+                message = {'type': 'bench', 'sent_at': time.time(), 'seq': seq, 'game_servers': payload_servers}
+                # Публикация из другого потока, как из цикла сканера
+                await loop.run_in_executor(None, scanner.broadcast_hub.publish, message)
+                await asyncio.sleep(args.interval)
+
+            latencies = []
+            for _ in workers:
+                latencies.extend(await loop.run_in_executor(None, results.get, True, 120))
+            return connected, connect_time, rss_connected, rss_bytes(), latencies, scanner.connection_stats()
+        finally:
+            await server.close()
+
+    connected, connect_time, rss_connected, rss_end, latencies, stats = asyncio.run(run())
+    for worker in workers:
+        worker.join(5)
+
+    latencies.sort()
+    expected = args.clients * args.messages
+    print(f"   подключено: {connected} за {connect_time:.1f} с")
+    print(f"   доставлено: {len(latencies)} из {expected} сообщений")
+    print(f"   задержка, мс: p50 {percentile(latencies, 0.5) * 1000:.1f}, p95 {percentile(latencies, 0.95) * 1000:.1f}, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f}, max {percentile(latencies, 1.0) * 1000:.1f}")
+    print(f"   RSS сервера: {rss_start / 2**20:.1f} МБ → {rss_connected / 2**20:.1f} МБ после подключения "
+          f"(~{(rss_connected - rss_start) / max(connected, 1) / 1024:.1f} КБ на соединение), "
+          f"{rss_end / 2**20:.1f} МБ после рассылки")
+    print(f"   оценка памяти соединений: {stats['memory_bytes'] / 2**20:.1f} МБ, "
+          f"отброшено сообщений {stats['broadcast']['dropped']}")
+
+def http_client_worker(port, path, connections, duration, results):
+    """Процесс с connections keep-alive соединениями: задержка каждого запроса"""
+    import asyncio
+
+    request = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode('ascii')
+
+    async def client(deadline, latencies):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1 << 24)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                writer.write(request)
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int(head.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - started)
+        finally:
+            writer.close()
+
+    async def run():
+        latencies = []
+        deadline = time.perf_counter() + duration
+        outcomes = await asyncio.gather(*(client(deadline, latencies) for _ in range(connections)),
+                                        return_exceptions=True)
+        errors = sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+        results.put((latencies, errors))
+
+    asyncio.run(run())
+
+def bench_http(args):
+    """Нагрузочный тест /api/servers: запросов в секунду и p99 при 1k и 10k серверов
+    
+    --scan-interval - во время замера сканер обрабатывает циклы, в каждом
+    меняется доля --churn серверов (остальные остаются прежними).
+    """
+    import asyncio
+    import multiprocessing
+    import socket
+    import threading
+    from api_server import CS2APIHandler, CORS_HEADERS
+    from async_http import AsyncHTTPServer
+
+    scanner = make_scanner()
+    now = time.time()
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    def scan_loop(servers, stop, cycles):
+        """Циклы сканирования: меняется число игроков у доли churn серверов"""
+        changed = int(len(servers) * args.churn)
+        while not stop.wait(args.scan_interval):
+            for offset in range(changed):
+                index = (cycles[0] * changed + offset) % len(servers)
+                servers[index] = {**servers[index], 'players': (servers[index]['players'] + 1) % 11}
+            with scanner.process_lock:
+                scanner.process_servers(servers)
+            cycles[0] += 1
+
+    async def run(count):
+        servers = make_servers(count)
+        if args.scan_interval:
+            with scanner.process_lock:
+                scanner.process_servers(servers)
+        else:
+            records = {server['steamid']: {**server, 'last_seen': now - index}
+                       for index, server in enumerate(servers)}
+            statuses = ('game', 'empty', 'disappeared')
+            parts = {}
+            for position, status in enumerate(statuses):
+                parts[f'{status}_servers'] = {steamid: record for index, (steamid, record) in enumerate(records.items())
+                                              if index % len(statuses) == position}
+                scanner.server_view.replace(status, parts[f'{status}_servers'])
+            scanner.publish_snapshot(**parts)
+
+        handler = CS2APIHandler(scanner)
+        server = AsyncHTTPServer(handler, default_headers=CORS_HEADERS, compression=handler.compression)
+        await server.start('127.0.0.1', port)
+        loop = asyncio.get_running_loop()
+        results = multiprocessing.Queue()
+        per_process = [args.connections // args.processes + (1 if i < args.connections % args.processes else 0)
+                       for i in range(args.processes)]
+        workers = [multiprocessing.Process(target=http_client_worker,
+                                           args=(port, args.path, connections, args.duration, results),
+                                           daemon=True)
+                   for connections in per_process if connections]
+        for worker in workers:
+            worker.start()
+        stop, cycles = threading.Event(), [0]
+        scanning = threading.Thread(target=scan_loop, args=(servers, stop, cycles), daemon=True)
+        if args.scan_interval:
+            scanning.start()
+
+        latencies = []
+        errors = 0
+        for _ in workers:
+            worker_latencies, worker_errors = await loop.run_in_executor(None, results.get, True,
+                                                                         args.duration + 120)
+            latencies.extend(worker_latencies)
+            errors += worker_errors
+        for worker in workers:
+            worker.join(5)
+        stop.set()
+        if args.scan_interval:
+            scanning.join()
+        stats = {**server.stats(), 'cycles': cycles[0], 'cache': handler.response_cache.stats()}
+        await server.close()
+        return latencies, errors, stats
+
+    print(f"🌐 GET {args.path}: {args.connections} keep-alive соединений в {args.processes} процессах, "
+          f"{args.duration:.0f} с на каждый размер")
+    if args.scan_interval:
+        print(f"   сканер активен: цикл каждые {args.scan_interval:g} с, меняется {args.churn:.0%} серверов")
+    for count in (int(value) for value in args.servers.split(',')):
+        latencies, errors, stats = asyncio.run(run(count))
+        latencies.sort()
+        print(f"   {count:6} серверов: {len(latencies) / args.duration:8.1f} запр/с, "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.1f} мс, p99 {percentile(latencies, 0.99) * 1000:7.1f} мс, "
+              f"повторно использовано соединений {stats['keepalive_reused']}, ошибок {errors}")
+        if args.scan_interval:
+            print(f"          циклов {stats['cycles']}, кэш ответов: попаданий {stats['cache']['hits']}, "
+                  f"промахов {stats['cache']['misses']}")
+
+def bench_changes(args):
+    """Дельты ленты изменений (SSE, long-poll) и журнала WebSocket за цикл сканирования
+    
+    Первый повторный цикл без изменений должен дать пустые дельты - иначе
+    код возврата 1. Далее в каждом цикле меняется доля --churn серверов.
+    """
+    scanner = make_scanner()
+    servers = make_servers(args.servers)
+    scanner.process_servers(servers)
+    scanner.publish_state({})
+    changed = int(len(servers) * args.churn)
+    failed = False
+
+    print(f"🔁 Дельты за цикл: {args.servers} серверов, меняется {changed} за цикл")
+    for cycle in range(args.cycles + 1):
+        if cycle:
+            for offset in range(changed):
+                index = ((cycle - 1) * changed + offset) % len(servers)
+                servers[index] = {**servers[index], 'players': (servers[index]['players'] + 1) % 11}
+        else:
+            # Те же данные в новых словарях, как после очередного запроса к Steam
+            servers = [dict(server) for server in servers]
+        version = scanner.change_feed.version
+        started = time.perf_counter()
+        scanner.process_servers(servers)
+        delta, _ = scanner.state_journal.commit({
+            'game_servers': scanner.snapshot.game_servers,
+            'disappeared_servers': scanner.snapshot.disappeared_servers
+        })
+        elapsed = time.perf_counter() - started
+        feed = scanner.change_feed.since(version)
+        feed_records = sum(len(feed[name]['upsert']) + len(feed[name]['remove'])
+                           for name in scanner.change_feed.collections if name in feed)
+        journal_records = sum(len(delta[name]['upsert']) + len(delta[name]['remove'])
+                              for name in scanner.state_journal.collections if delta and name in delta)
+        print(f"   цикл {cycle}: {elapsed * 1000:7.1f} мс, версия {scanner.snapshot.version}, "
+              f"лента {feed_records} записей, журнал {journal_records} записей")
+        if not cycle and (feed_records or journal_records or feed['version'] != version):
+            print("❌ Цикл без изменений дал непустую дельту")
+            failed = True
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки CS2 Tool')
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Массовый импорт сохраненных серверов')
+    import_parser.add_argument('--count', type=int, default=10000, help='Количество серверов')
+    import_parser.add_argument('--sample', type=int, default=500, help='Серверов для поштучного добавления')
+    import_parser.set_defaults(func=bench_import)
+
+    broadcast_parser = subparsers.add_parser('broadcast', help='Сериализация и сжатие рассылки')
+    broadcast_parser.add_argument('--servers', type=int, default=2000, help='Количество серверов в сообщении')
+    broadcast_parser.add_argument('--clients', type=int, default=100, help='Количество клиентов')
+    broadcast_parser.add_argument('--repeat', type=int, default=5, help='Повторов для усреднения')
+    broadcast_parser.set_defaults(func=bench_broadcast)
+
+    websocket_parser = subparsers.add_parser('websocket', help='Нагрузочный тест WebSocket рассылки')
+    websocket_parser.add_argument('--clients', type=int, default=1000, help='Количество клиентов (1k-10k)')
+    websocket_parser.add_argument('--processes', type=int, default=4, help='Процессов с клиентами')
+    websocket_parser.add_argument('--messages', type=int, default=20, help='Количество рассылок')
+    websocket_parser.add_argument('--servers', type=int, default=200, help='Серверов в каждой рассылке')
+    websocket_parser.add_argument('--interval', type=float, default=0.5, help='Пауза между рассылками, сек')
+    websocket_parser.add_argument('--compression', action='store_true', help='Включить permessage-deflate')
+    websocket_parser.set_defaults(func=bench_websocket)
+
+    http_parser = subparsers.add_parser('http', help='Нагрузочный тест HTTP API')
+    http_parser.add_argument('--servers', default='1000,10000', help='Размеры списка серверов через запятую')
+    http_parser.add_argument('--path', default='/api/servers', help='Запрашиваемый путь')
+    http_parser.add_argument('--connections', type=int, default=32, help='Одновременных соединений')
+    http_parser.add_argument('--processes', type=int, default=2, help='Процессов с клиентами')
+    http_parser.add_argument('--duration', type=float, default=10, help='Длительность замера, сек')
+    http_parser.add_argument('--scan-interval', type=float, default=0,
+                             help='Пауза между циклами сканирования во время замера, сек (0 - без сканера)')
+    http_parser.add_argument('--churn', type=float, default=0.0,
+                             help='Доля серверов, меняющихся за цикл сканирования')
+    http_parser.set_defaults(func=bench_http)
+
+    changes_parser = subparsers.add_parser('changes', help='Размер дельт за цикл сканирования')
+    changes_parser.add_argument('--servers', type=int, default=10000, help='Количество серверов')
+    changes_parser.add_argument('--cycles', type=int, default=5, help='Циклов с изменениями')
+    changes_parser.add_argument('--churn', type=float, default=0.01, help='Доля серверов, меняющихся за цикл')
+    changes_parser.set_defaults(func=bench_changes)
+
+    args = parser.parse_args()
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
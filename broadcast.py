@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Потокобезопасная рассылка WebSocket обновлений
+Поток сканера передает сообщения в цикл событий сервера, у каждого клиента
+своя ограниченная очередь и собственная задача-писатель
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from metrics import BROADCAST_BYTES, BROADCAST_LATENCY, BROADCAST_MESSAGES
+from wire_format import encode_message, payload_size
+
+logger = logging.getLogger(__name__)
+
+class ClientChannel:
+    """Исходящая очередь одного клиента
+
+    Сообщения с одинаковым ключом объединения заменяют еще не отправленные
+    (клиент получает только последнее состояние). При переполнении
+    отбрасываются самые старые сообщения.
+    """
+
+    def __init__(self, websocket, max_queue, send_timeout):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.queue = OrderedDict()  # ключ → (сообщение в bytes, размер, текстовый кадр)
+        self.queued_at = {}  # ключ → время постановки в очередь (задержка доставки)
+        self.queued_bytes = 0  # Размер сообщений в очереди, байт (учет памяти соединения)
+        self.ready = asyncio.Event()
+        self.protocol = 'full'  # 'full' - полные списки, 'delta' - дельты с seq
+        self.encoding = 'json'  # 'json' или 'msgpack'
+        self.acked_seq = 0
+        self.sequence = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.task = None
+
+    def put(self, message, coalesce_key=None, text=True):
+        """message - сериализованные bytes; text - JSON (текстовый кадр), иначе MessagePack"""
+        if coalesce_key is None:
+            self.sequence += 1
+            key = ('message', self.sequence)
+        else:
+            key = ('state', coalesce_key)
+            if key in self.queue:
+                self.coalesced += 1
+                self.queued_bytes -= self.queue.pop(key)[1]
+
+        size = payload_size(message)
+        self.queue[key] = (message, size, text)
+        self.queued_at[key] = time.monotonic()
+        self.queued_bytes += size
+        while len(self.queue) > self.max_queue:
+            dropped_key, (_, dropped_size, _) = self.queue.popitem(last=False)
+            self.queued_at.pop(dropped_key, None)
+            self.queued_bytes -= dropped_size
+            self.dropped += 1
+        self.ready.set()
+
+    async def run(self, on_closed):
+        """Задача-писатель: отправляет сообщения из очереди по одному"""
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    key, (message, size, text) = self.queue.popitem(last=False)
+                    queued_at = self.queued_at.pop(key, None)
+                    self.queued_bytes -= size
+                    # Один и тот же буфер для всех клиентов, без повторного кодирования в UTF-8
+                    await asyncio.wait_for(self.websocket.send(message, text=text), self.send_timeout)
+                    self.sent += 1
+                    BROADCAST_MESSAGES.inc()
+                    BROADCAST_BYTES.inc(amount=size)
+                    if queued_at is not None:
+                        BROADCAST_LATENCY.observe(time.monotonic() - queued_at)
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Клиент не принимает данные {self.send_timeout} сек, соединение закрывается")
+            asyncio.ensure_future(self.websocket.close(code=1013, reason='slow consumer'))
+        except Exception as e:
+            logger.info(f"🔌 Отправка клиенту прекращена: {e}")
+        on_closed(self.websocket)
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'queued_bytes': self.queued_bytes,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped
+        }
+
+class BroadcastHub:
+    """Рассылка сообщений всем подключенным клиентам
+
+    publish() можно вызывать из любого потока: сообщение сериализуется
+    один раз в вызывающем потоке и передается в цикл событий через
+    call_soon_threadsafe. Медленный клиент никогда не блокирует сканер
+    и других клиентов.
+    """
+
+    def __init__(self, max_queue=32, send_timeout=30):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.loop = None
+        self.channels = {}
+
+    def register(self, websocket):
+        """Регистрация клиента (вызывается внутри цикла событий)"""
+        self.loop = asyncio.get_running_loop()
+        channel = ClientChannel(websocket, self.max_queue, self.send_timeout)
+        channel.task = self.loop.create_task(channel.run(self._on_writer_closed))
+        self.channels[websocket] = channel
+        return channel
+
+    def unregister(self, websocket):
+        channel = self.channels.pop(websocket, None)
+        if channel and channel.task and not channel.task.done():
+            channel.task.cancel()
+
+    def _on_writer_closed(self, websocket):
+        self.channels.pop(websocket, None)
+
+    def has_clients(self, protocol=None):
+        return any(protocol is None or channel.protocol == protocol for channel in list(self.channels.values()))
+
+    def send_to(self, websocket, data, coalesce_key=None):
+        """Отправка одному клиенту через его очередь (сохраняет порядок с рассылками)"""
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        if isinstance(data, str):
+            channel.put(data.encode('utf-8'), coalesce_key)
+        else:
+            channel.put(encode_message(data, channel.encoding), coalesce_key, text=channel.encoding == 'json')
+        return True
+
+    def _targets(self, protocol, clients):
+        """Каналы получателей: все клиенты или только указанные"""
+        if clients is None:
+            channels = list(self.channels.values())
+        else:
+            channels = [self.channels[websocket] for websocket in clients if websocket in self.channels]
+        return [channel for channel in channels if protocol is None or channel.protocol == protocol]
+
+    def _encode(self, data, targets):
+        """Сериализация в bytes один раз на каждый формат, используемый получателями"""
+        if isinstance(data, str):
+            return {'json': data.encode('utf-8')}
+        encodings = {channel.encoding for channel in targets}
+        return {encoding: encode_message(data, encoding) for encoding in encodings or ('json',)}
+
+    def publish(self, data, coalesce_key=None, protocol=None, clients=None):
+        """Отправка всем клиентам; data - словарь или уже сериализованная JSON строка
+
+        Сообщение сериализуется в bytes один раз для каждого формата, и один
+        и тот же буфер ставится в очереди всех клиентов и отправляется им
+        без повторного кодирования.
+        protocol - только клиентам с указанным протоколом ('full' или 'delta')
+        clients - только указанным соединениям (группа подписки)
+        """
+        if self.loop is None:
+            return False
+        targets = self._targets(protocol, clients)
+        if not targets:
+            return False
+
+        message = (data, self._encode(data, targets))
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            self._enqueue(message, coalesce_key, protocol, clients)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._enqueue, message, coalesce_key, protocol, clients)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                return False
+        return True
+
+    def _enqueue(self, message, coalesce_key, protocol, clients):
+        data, payloads = message
+        for channel in self._targets(protocol, clients):
+            encoding = 'json' if isinstance(data, str) else channel.encoding
+            payload = payloads.get(encoding)
+            if payload is None:
+                # Клиент сменил формат после сериализации
+                payload = payloads[encoding] = encode_message(data, encoding)
+            channel.put(payload, coalesce_key, text=encoding == 'json')
+
+    def stats(self):
+        channels = list(self.channels.values())
+        return {
+            'clients': len(channels),
+            'queued': sum(len(channel.queue) for channel in channels),
+            'queued_bytes': sum(channel.queued_bytes for channel in channels),
+            'coalesced': sum(channel.coalesced for channel in channels),
+            'dropped': sum(channel.dropped for channel in channels)
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Лента изменений серверов по версиям снимка состояния
+Для HTTP клиентов без WebSocket: Server-Sent Events и long-poll получают
+изменения сразу после публикации снимка и продолжают с последней
+полученной версии
+"""
+
+import asyncio
+import threading
+from collections import deque
+
+from state_journal import same_record
+
+FEED_COLLECTIONS = ('game_servers', 'empty_servers', 'disappeared_servers')
+
+class ChangeFeed:
+    """Дельты коллекций серверов между опубликованными снимками
+
+    Дельта: {'version', 'base_version', коллекция: {'upsert': [записи],
+    'remove': [steamid]}}; после добавления не изменяется. version ленты -
+    версия последнего учтенного снимка, она может быть новее последней
+    дельты. Записи сравниваются по значению без изменчивых полей
+    (state_journal.VOLATILE_FIELDS): цикл, в котором серверы не изменились,
+    не дает дельты, даже если записи собраны заново. Ожидающие корутины
+    будятся из потока сканера через call_soon_threadsafe.
+    """
+
+    def __init__(self, max_deltas=200, collections=FEED_COLLECTIONS):
+        self.collections = collections
+        self.lock = threading.Lock()
+        self.deltas = deque(maxlen=max_deltas)
+        self.state = {name: {} for name in collections}
+        self.version = 0
+        self.loop = None
+        self.waiters = set()
+        self.published = 0
+
+    def update(self, snapshot):
+        """Фиксация снимка: дельта относительно предыдущего, если серверы изменились"""
+        with self.lock:
+            if snapshot.version <= self.version:
+                return None
+            delta = {'version': snapshot.version, 'base_version': self.version}
+            changed = False
+            for name in self.collections:
+                old = self.state[name]
+                new = getattr(snapshot, name)
+                upsert = [record for key, record in new.items() if not same_record(old.get(key), record)]
+                remove = [key for key in old if key not in new]
+                if upsert or remove:
+                    delta[name] = {'upsert': upsert, 'remove': remove}
+                    changed = True
+
+            # Изменились только другие части снимка: сдвигается лишь версия головы ленты,
+            # уже выданные дельты не меняются (клиент с их версией не получит их повторно)
+            self.version = snapshot.version
+            if not changed:
+                return None
+
+            self.state = {name: getattr(snapshot, name) for name in self.collections}
+            self.deltas.append(delta)
+            self.published += 1
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake)
+        return delta
+
+    def since(self, version):
+        """Объединенная дельта от version до текущей версии или None, если история утеряна"""
+        with self.lock:
+            if version >= self.version:
+                return {'version': self.version, 'base_version': version}
+            if not self.deltas or version < self.deltas[0]['base_version']:
+                return None
+
+            upserts = {name: {} for name in self.collections}
+            removes = {name: set() for name in self.collections}
+            for delta in self.deltas:
+                if delta['version'] <= version:
+                    continue
+                for name in self.collections:
+                    change = delta.get(name)
+                    if not change:
+                        continue
+                    for record in change['upsert']:
+                        key = record.get('steamid')
+                        upserts[name][key] = record
+                        removes[name].discard(key)
+                    for key in change['remove']:
+                        upserts[name].pop(key, None)
+                        removes[name].add(key)
+
+            merged = {'version': self.version, 'base_version': version}
+            for name in self.collections:
+                if upserts[name] or removes[name]:
+                    merged[name] = {'upsert': list(upserts[name].values()), 'remove': list(removes[name])}
+            return merged
+
+    def _wake(self):
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.waiters.clear()
+
+    async def wait(self, version, timeout):
+        """Ожидание версии новее version; True - появились изменения"""
+        self.loop = asyncio.get_running_loop()
+        if self.version > version:
+            return True
+        waiter = self.loop.create_future()
+        self.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.waiters.discard(waiter)
+        return self.version > version
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'deltas': len(self.deltas),
+            'oldest_version': self.deltas[0]['base_version'] if self.deltas else self.version,
+            'published': self.published,
+            'waiting': len(self.waiters)
+        }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Внутренняя шина событий сканера
+process_servers только публикует типизированные события, а сохранение,
+автосохранение, логирование и рассылка обрабатывают их в своих потоках пачками
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Событий в очереди одного потребителя; при переполнении отбрасываются самые старые
+MAX_QUEUED_EVENTS = int(os.environ.get('EVENT_QUEUE_LIMIT', 100000))
+
+EVENT_TYPES = ('map_changed', 'disappeared', 'returned', 'appeared', 'cycle_completed')
+
+# record - запись сервера; data - дополнительные данные (статистика цикла)
+ScanEvent = namedtuple('ScanEvent', 'type steamid name old_map new_map record data timestamp')
+
+def make_event(event_type, steamid=None, name=None, old_map=None, new_map=None, record=None, data=None,
+               timestamp=None):
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Неизвестный тип события: {event_type}")
+    return ScanEvent(event_type, steamid, name, old_map, new_map, record, data,
+                     time.time() if timestamp is None else timestamp)
+
+class EventConsumer:
+    """Потребитель с собственной очередью и потоком обработки
+
+    handler получает список событий (не больше batch_size); события
+    накапливаются до max_delay секунд, чтобы обрабатываться пачкой.
+    Очередь ограничена max_queued: зависший потребитель теряет самые
+    старые события (счетчик dropped), а не память процесса.
+    """
+
+    def __init__(self, name, handler, types=None, batch_size=500, max_delay=0.5, max_queued=MAX_QUEUED_EVENTS):
+        self.name = name
+        self.handler = handler
+        self.types = frozenset(types) if types else None
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = deque(maxlen=max_queued)
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.busy = False
+        self.delivered = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_batch_seconds = 0.0
+        self.thread = threading.Thread(target=self.run, name=f'events-{name}', daemon=True)
+
+    def accepts(self, event):
+        return self.types is None or event.type in self.types
+
+    def put(self, events):
+        with self.condition:
+            overflow = len(self.queue) + len(events) - self.queue.maxlen
+            self.queue.extend(events)  # deque с maxlen вытесняет самые старые
+            self.max_depth = max(self.max_depth, len(self.queue))
+            if overflow > 0:
+                self.dropped += overflow
+            self.condition.notify()
+        if overflow > 0:
+            logger.warning(f"⚠️ Очередь потребителя {self.name} переполнена, отброшено событий: {overflow}")
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                first_at = time.monotonic()
+
+            # Небольшая задержка собирает пачку событий одного цикла
+            if self.max_delay and len(self.queue) < self.batch_size:
+                time.sleep(max(0.0, self.max_delay - (time.monotonic() - first_at)))
+
+            with self.condition:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+                self.busy = True
+
+            started = time.perf_counter()
+            try:
+                self.handler(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Ошибка обработчика событий {self.name}: {e}")
+            self.last_batch_seconds = time.perf_counter() - started
+            self.delivered += len(batch)
+            self.batches += 1
+
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def idle(self):
+        return not self.queue and not self.busy
+
+    def stats(self):
+        return {
+            'queued': len(self.queue),
+            'max_queued': self.max_depth,
+            'dropped': self.dropped,
+            'delivered': self.delivered,
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_batch_ms': round(self.last_batch_seconds * 1000, 2)
+        }
+
+class EventBus:
+    """Рассылка событий потребителям
+
+    emit() только добавляет события во входную очередь, раздачу по
+    очередям потребителей выполняет отдельный поток: задержка публикации
+    не зависит от числа потребителей и скорости их обработки.
+    """
+
+    def __init__(self):
+        self.consumers = []
+        self.inbox = deque()
+        self.condition = threading.Condition()
+        self.emitted = 0
+        self.dispatching = False
+        self.thread = threading.Thread(target=self.dispatch, name='events-dispatch', daemon=True)
+        self.thread.start()
+
+    def subscribe(self, name, handler, types=None, batch_size=500, max_delay=0.5):
+        consumer = EventConsumer(name, handler, types, batch_size, max_delay)
+        self.consumers.append(consumer)
+        consumer.thread.start()
+        return consumer
+
+    def emit(self, events):
+        """Публикация события или списка событий (из любого потока)"""
+        if isinstance(events, ScanEvent):
+            events = (events,)
+        with self.condition:
+            self.inbox.extend(events)
+            self.emitted += len(events)
+            self.condition.notify()
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while not self.inbox:
+                    self.condition.wait()
+                events = list(self.inbox)
+                self.inbox.clear()
+                self.dispatching = True
+
+            for consumer in list(self.consumers):
+                accepted = [event for event in events if consumer.accepts(event)]
+                if accepted:
+                    consumer.put(accepted)
+
+            with self.condition:
+                self.dispatching = False
+                self.condition.notify_all()
+
+    def drain(self, timeout=5):
+        """Ожидание обработки всех опубликованных событий (при остановке)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.condition:
+                pending = self.inbox or self.dispatching
+            if not pending and all(consumer.idle() for consumer in self.consumers):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self):
+        return {
+            'emitted': self.emitted,
+            'inbox': len(self.inbox),
+            'consumers': {consumer.name: consumer.stats() for consumer in self.consumers}
+        }
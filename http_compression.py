@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Сжатие HTTP ответов по Accept-Encoding
+gzip всегда, brotli и zstd - если установлены пакеты brotli / zstandard.
+Сжатые варианты хранятся в самом ответе, поэтому ответ из кэша версий
+сжимается один раз для всех клиентов
+"""
+
+import asyncio
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Порядок предпочтения сервера при равном q
+PREFERRED_CODINGS = ('br', 'zstd', 'gzip')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson',
+                      'image/svg+xml')
+
+# Тела больше этого сжимаются в пуле потоков, чтобы не задерживать цикл событий
+OFFLOAD_SIZE = 64 * 1024
+
+def available_codings():
+    codings = ['gzip']
+    if zstandard is not None:
+        codings.insert(0, 'zstd')
+    if brotli is not None:
+        codings.insert(0, 'br')
+    return tuple(codings)
+
+def parse_accept_encoding(header):
+    """Кодировка → q из заголовка Accept-Encoding"""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+def is_compressible(response):
+    content_type = response.headers.get('Content-Type', '')
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def encoded_etag(etag, coding):
+    """ETag варианта: "v12" → "v12-gzip" (слабая метка остается слабой)"""
+    if not etag or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+class ResponseCompressor:
+    """Выбор кодировки и сжатие тела ответа
+
+    min_size - тела меньше порога не сжимаются (выигрыш меньше заголовков).
+    Сжатые тела кэшируются в response.encoded; одновременные запросы
+    одного варианта ждут одно сжатие.
+    """
+
+    def __init__(self, min_size=None, gzip_level=None, brotli_quality=None, zstd_level=None, codings=None):
+        self.min_size = int(os.environ.get('HTTP_COMPRESSION_MIN_SIZE', 1024)) if min_size is None else min_size
+        self.gzip_level = int(os.environ.get('HTTP_GZIP_LEVEL', 6)) if gzip_level is None else gzip_level
+        self.brotli_quality = int(os.environ.get('HTTP_BROTLI_QUALITY', 5)) if brotli_quality is None else brotli_quality
+        self.zstd_level = int(os.environ.get('HTTP_ZSTD_LEVEL', 3)) if zstd_level is None else zstd_level
+        self.codings = codings or available_codings()
+        self.compressed = {coding: 0 for coding in self.codings}
+        self.cached = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def negotiate(self, header):
+        """Лучшая доступная кодировка для Accept-Encoding или None (без сжатия)"""
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get('*', 0.0)
+        best, best_q = None, 0.0
+        for coding in self.codings:
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body, coding):
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        if coding == 'zstd':
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(body)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def encode(self, request, response):
+        """Ответ в согласованной кодировке (исходный, если сжатие не нужно)"""
+        if (response.stream is not None or not response.body or 'Content-Encoding' in response.headers
+                or not is_compressible(response)):
+            return response
+
+        headers = response.headers
+        vary = headers.get('Vary')
+        headers['Vary'] = f'{vary}, Accept-Encoding' if vary and 'accept-encoding' not in vary.lower() else (vary or 'Accept-Encoding')
+        if len(response.body) < self.min_size:
+            return response
+        coding = self.negotiate(request.header('Accept-Encoding'))
+        if coding is None:
+            return response
+
+        encoded = response.encoded
+        body = encoded.get(coding)
+        if body is None:
+            future = asyncio.get_running_loop().create_future()
+            encoded[coding] = future
+            try:
+                if len(response.body) > OFFLOAD_SIZE:
+                    data = await asyncio.get_running_loop().run_in_executor(None, self.compress, response.body, coding)
+                else:
+                    data = self.compress(response.body, coding)
+            except BaseException as e:
+                encoded.pop(coding, None)
+                future.set_exception(e)
+                future.exception()  # Ошибку получают ожидающие, не цикл событий
+                raise
+            encoded[coding] = data
+            future.set_result(data)
+            body = data
+            self.compressed[coding] += 1
+            self.bytes_in += len(response.body)
+            self.bytes_out += len(data)
+        elif isinstance(body, asyncio.Future):
+            body = await asyncio.shield(body)
+        else:
+            self.cached += 1
+
+        result = type(response)(response.status, body, headers={**headers, 'Content-Encoding': coding})
+        if 'ETag' in headers:
+            result.headers['ETag'] = encoded_etag(headers['ETag'], coding)
+        return result
+
+    def stats(self):
+        return {
+            'codings': list(self.codings),
+            'min_size': self.min_size,
+            'compressed': dict(self.compressed),
+            'cached': self.cached,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Метрики в формате Prometheus (text exposition 0.0.4)
+Счетчики и гистограммы в памяти процесса: запись - одна блокировка и
+несколько сложений, поэтому метрики можно держать включенными постоянно.
+Текст собирается только при запросе /metrics
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# Границы корзин по умолчанию, секунды
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Метрика с метками: значения по кортежу значений меток"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labels}")
+        return tuple(str(value) for value in labels)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f'{self.name}{format_labels(self.labels, key)} {format_value(value)}' for key, value in items]
+
+class Gauge(Metric):
+    """Значение по запросу: function() → число или {кортеж меток: число}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function, labels=()):
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []  # Источник еще не готов (например, сканер не запущен)
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{format_labels(self.labels, key if isinstance(key, tuple) else (key,))} '
+                f'{format_value(number)}' for key, number in sorted(value.items(), key=lambda item: str(item[0]))]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def render(self):
+        with self.lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self.values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(round(total, 6))}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {count}')
+        return lines
+
+class Timer:
+    """with HISTOGRAM.time(метки): - длительность блока в секундах"""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class LatencyCollector(Metric):
+    """Экспорт гистограмм ws_dispatch.LatencyHistogram (корзины в мс) как гистограммы в секундах
+
+    function() → {значение метки: LatencyHistogram}
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, function, label):
+        super().__init__(name, documentation, (label,))
+        self.function = function
+
+    def render(self):
+        try:
+            histograms = self.function()
+        except Exception:
+            return []
+        lines = []
+        for value, histogram in sorted(histograms.items()):
+            if not histogram.count:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip((*histogram.buckets, float('inf')), histogram.counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound / 1000)}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, (value,), le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, (value,))} {format_value(round(histogram.total / 1000, 6))}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, (value,))} {histogram.count}')
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, function, labels=()):
+        """Повторная регистрация заменяет функцию (новый экземпляр сканера или сервера)"""
+        metric = Gauge(name, documentation, function, labels)
+        with self.lock:
+            self.metrics[name] = metric
+        return metric
+
+    def collector(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+# Сканирование
+SCAN_DURATION = REGISTRY.histogram(
+    'cs2_scan_cycle_duration_seconds', 'Длительность фаз цикла сканирования (fetch - запросы карт, process - сравнение)',
+    ('phase',), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+MAP_FETCH_DURATION = REGISTRY.histogram(
+    'cs2_map_fetch_duration_seconds', 'Длительность запроса GetServerList для карты (включая ожидание очереди)',
+    ('map',), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+MAP_FETCH_SERVERS = REGISTRY.histogram(
+    'cs2_map_fetch_servers', 'Количество серверов в ответе GetServerList для карты', ('map',), buckets=SIZE_BUCKETS)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    'cs2_upstream_responses_total', 'Ответы Steam API по HTTP статусу (error - ошибка соединения)', ('status',))
+SCAN_CHANGES = REGISTRY.histogram(
+    'cs2_scan_changes', 'Изменения за цикл сканирования по типу', ('kind',), buckets=SIZE_BUCKETS)
+PERSIST_DURATION = REGISTRY.histogram(
+    'cs2_persistence_flush_duration_seconds', 'Длительность записи файла состояния', ('store',))
+
+# WebSocket
+BROADCAST_BYTES = REGISTRY.counter(
+    'cs2_broadcast_payload_bytes_total', 'Байты сообщений клиентам WebSocket (UTF-8, до сжатия permessage-deflate)')
+BROADCAST_MESSAGES = REGISTRY.counter('cs2_broadcast_messages_total', 'Сообщения, отправленные клиентам WebSocket')
+BROADCAST_LATENCY = REGISTRY.histogram(
+    'cs2_broadcast_latency_seconds', 'Время от постановки сообщения в очередь клиента до завершения отправки')
+
+# HTTP API
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'cs2_http_request_duration_seconds', 'Длительность обработки HTTP запроса по маршруту', ('method', 'route', 'status'))
@@ -8,6 +8,7 @@ class CS2Tool {
         this.savedServers = new Map();
         this.isLoading = false;
         this.autoRefresh = true;
+        this.stateVersions = {};  // Версия состояния последнего отрисованного ответа API
         this.region = '44';
         this.maxThreads = 50;
         this.autoConnectEnabled = false;
@@ -1108,25 +1109,128 @@ class CS2Tool {
     }
     
     startDataPolling() {
+        // Изменения серверов приходят через SSE; сохраненные серверы дешево опрашиваются по ETag
+        if (window.EventSource && !this.eventSource) {
+            this.startEventStream();
+        }
+        
         // Обновляем данные каждые 5 секунд
         this.pollingInterval = setInterval(() => {
-            this.fetchServers();
+            if (!this.eventSource) this.fetchServers();
             this.fetchSavedServers();
         }, 5000);
         
         // Первоначальная загрузка
-        this.fetchServers();
-        this.fetchSavedServers();
+        this.fetchInitialState();
+    }
+    
+    async fetchInitialState() {
+        // Один запрос вместо нескольких: все панели получают данные одной версии состояния
+        const queries = [{ type: 'saved_servers', id: 'saved' }];
+        if (!this.eventSource) {
+            queries.push({ type: 'servers', id: 'servers', params: { type: 'all', limit: 1000 } });
+        }
+        
+        try {
+            const response = await fetch(`${this.apiBaseUrl}/api/batch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ queries })
+            });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            
+            const data = await response.json();
+            data.results.forEach(result => {
+                if (result.status !== 'success') return;
+                if (result.id === 'saved') {
+                    this.stateVersions.saved = result.data.version;
+                    this.updateSavedServersList(result.data.saved_servers);
+                } else if (result.id === 'servers') {
+                    if (result.data.next_cursor) {
+                        this.fetchServers();  // Больше одной страницы - догружаем постранично
+                    } else {
+                        this.stateVersions['servers:all'] = result.data.version;
+                        this.updateServersList(result.data.servers, 'all');
+                    }
+                }
+            });
+        } catch (error) {
+            console.error('❌ Ошибка пакетного запроса, загружаем по отдельности:', error);
+            if (!this.eventSource) this.fetchServers();
+            this.fetchSavedServers();
+        }
+    }
+    
+    startEventStream() {
+        const collections = {
+            game_servers: 'game',
+            empty_servers: 'empty',
+            disappeared_servers: 'disappeared'
+        };
+        const streamServers = {};
+        Object.keys(collections).forEach(name => streamServers[name] = new Map());
+        
+        const render = (data) => {
+            this.stateVersions['servers:all'] = data.version;
+            const servers = [];
+            Object.entries(collections).forEach(([name, status]) => {
+                streamServers[name].forEach(server => servers.push({ ...server, status }));
+            });
+            servers.sort((a, b) => (b.last_seen || 0) - (a.last_seen || 0));
+            this.updateServersList(servers, 'all');
+        };
+        
+        this.eventSource = new EventSource(`${this.apiBaseUrl}/api/stream`);
+        
+        this.eventSource.addEventListener('snapshot', (event) => {
+            const data = JSON.parse(event.data);
+            Object.keys(collections).forEach(name => {
+                streamServers[name].clear();
+                (data[name] || []).forEach(server => streamServers[name].set(server.steamid, server));
+            });
+            render(data);
+        });
+        
+        this.eventSource.addEventListener('delta', (event) => {
+            const data = JSON.parse(event.data);
+            Object.keys(collections).forEach(name => {
+                const change = data[name];
+                if (!change) return;
+                change.remove.forEach(steamid => streamServers[name].delete(steamid));
+                change.upsert.forEach(server => streamServers[name].set(server.steamid, server));
+            });
+            render(data);
+        });
+        
+        this.eventSource.onerror = () => {
+            // Браузер переподключается сам (с Last-Event-ID); CLOSED - поток недоступен, возвращаемся к опросу
+            if (this.eventSource.readyState === EventSource.CLOSED) {
+                console.warn('⚠️ Поток изменений недоступен, используется периодический опрос');
+                this.eventSource = null;
+                this.fetchServers();
+            }
+        };
     }
     
     async fetchServers(type = 'all') {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/api/servers?type=${type}`);
+            const url = `${this.apiBaseUrl}/api/servers?type=${type}&limit=1000`;
+            const response = await fetch(url);
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
             
+            // Без изменений сервер отвечает 304, браузер отдает сохраненный ответ - не перерисовываем
             const data = await response.json();
-            if (data.servers) {
-                this.updateServersList(data.servers, type);
+            if (data.servers && data.version !== this.stateVersions[`servers:${type}`]) {
+                // Ответ ограничен страницей: догружаем остальные по next_cursor
+                const servers = [...data.servers];
+                let cursor = data.next_cursor;
+                while (cursor) {
+                    const page = await (await fetch(`${url}&cursor=${encodeURIComponent(cursor)}`)).json();
+                    servers.push(...(page.servers || []));
+                    cursor = page.next_cursor;
+                }
+                this.stateVersions[`servers:${type}`] = data.version;
+                this.updateServersList(servers, type);
             }
         } catch (error) {
             console.error('❌ Ошибка получения серверов:', error);
@@ -1140,7 +1244,8 @@ class CS2Tool {
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
             
             const data = await response.json();
-            if (data.saved_servers) {
+            if (data.saved_servers && data.version !== this.stateVersions.saved) {
+                this.stateVersions.saved = data.version;
                 this.updateSavedServersList(data.saved_servers);
             }
         } catch (error) {
@@ -1218,6 +1323,15 @@ class CS2Tool {
                 console.log('✅ Обработка завершения сканирования');
                 this.handleScanComplete(data);
                 break;
+            case 'state_delta':
+                this.handleStateDelta(data);
+                break;
+            case 'state_seq':
+                // Периодическая сверка номера последовательности
+                if (this.stateSeq !== undefined && data.seq !== this.stateSeq) {
+                    this.sendWebSocketMessage('resync', { since: this.stateSeq });
+                }
+                break;
             case 'empty_servers_update':
                 console.log('🎮 Обработка обновления пустых серверов');
                 this.handleEmptyServersUpdate(data);
@@ -1252,7 +1366,7 @@ class CS2Tool {
         if (data.status === 'success') {
             console.log('🔑 API ключ успешно установлен в нативном сканере');
             this.showNotification('Нативный сканер запущен', 'success');
-            this.sendWebSocketMessage('get_initial_state');
+            this.sendWebSocketMessage('get_initial_state', { delta: true });
         } else {
             console.error('❌ Ошибка установки API ключа:', data.message);
             this.showNotification(`Ошибка установки API ключа: ${data.message}`, 'error');
@@ -1270,12 +1384,18 @@ class CS2Tool {
         
         if (data.disappeared_servers) {
             disappearedServers = data.disappeared_servers;
+            gameServers = data.game_servers || [];
         } else if (data.servers) {
             // Если данные приходят в формате servers с фильтрацией
             disappearedServers = data.servers.filter(server => server.map === 'graphics_settings');
             gameServers = data.servers.filter(server => server.map !== 'graphics_settings');
         }
         
+        // Номер последовательности для дельта-обновлений
+        if (data.seq !== undefined) {
+            this.stateSeq = data.seq;
+        }
+        
         if (data.stats) {
             stats = data.stats;
         } else {
@@ -1378,6 +1498,47 @@ class CS2Tool {
         console.log(`📊 Статистика: ${stats.disappeared_count} исчезло, ${stats.returned_count} вернулось, ${stats.total_current} всего`);
     }
     
+    handleStateDelta(data) {
+        // Устаревшая дельта (уже учтена в снимке)
+        if (this.stateSeq === undefined || data.seq <= this.stateSeq) {
+            return;
+        }
+        
+        // Пропущена дельта - запрашиваем пересинхронизацию
+        if (data.base_seq !== this.stateSeq) {
+            console.warn(`⚠️ Пропуск дельты: ожидался base_seq ${this.stateSeq}, получен ${data.base_seq}`);
+            this.sendWebSocketMessage('resync', { since: this.stateSeq });
+            return;
+        }
+        
+        const applyChanges = (target, changes) => {
+            if (!changes) return;
+            changes.remove.forEach(steamId => target.delete(steamId));
+            changes.upsert.forEach(server => target.set(server.steamid, server));
+        };
+        
+        applyChanges(this.servers, data.disappeared_servers);
+        applyChanges(this.gameServers, data.game_servers);
+        this.stateSeq = data.seq;
+        this.sendWebSocketMessage('ack', { seq: data.seq });
+        
+        this.updateServersDisplay();
+        this.updateGameServersDisplay();
+        
+        const stats = data.stats || {};
+        if (!data.resync && stats.disappeared_count > 0) {
+            this.showNotification(`${stats.disappeared_count} серверов перешли на graphics_settings`, 'warning');
+            
+            const newServers = data.disappeared_servers ? data.disappeared_servers.upsert : [];
+            if (this.autoConnectEnabled && newServers.length > 0) {
+                this.autoConnectToServer(newServers[0]);
+            }
+        }
+        if (!data.resync && stats.returned_count > 0) {
+            this.showNotification(`${stats.returned_count} серверов вернулись с graphics_settings`, 'success');
+        }
+    }
+    
     handleEmptyServersUpdate(data) {
         console.log('🎮 Обновление пустых серверов от нативного сканера');
         
@@ -14,6 +14,8 @@ import time
 
 # Импортируем наш сканер
 from scanner_simple import CS2ScannerSimple
+from wire_format import serve_kwargs
+from ws_connections import keepalive_kwargs
 
 # Настройка логирования
 logging.basicConfig(
@@ -68,25 +70,23 @@ class RailwayApp:
     def start_websocket_server_background(self):
         """Запуск WebSocket сервера в фоновом режиме"""
         try:
-            import websockets
-            import asyncio
+            from async_http import AsyncHTTPServer
             
             async def run_websocket():
                 try:
                     # Запускаем WebSocket сервер
                     host = '0.0.0.0'
-                    self.websocket_server = await websockets.serve(
-                        self.scanner.handle_websocket, 
-                        host, 
-                        self.websocket_port, 
-                        ping_interval=None, 
-                        ping_timeout=None
+                    self.websocket_server = AsyncHTTPServer(
+                        None,
+                        websocket_handler=self.scanner.handle_websocket,
+                        websocket_kwargs={**keepalive_kwargs(), **serve_kwargs()}
                     )
+                    await self.websocket_server.start(host, self.websocket_port)
                     
                     logger.info(f"🔌 WebSocket сервер запущен на ws://{host}:{self.websocket_port}")
                     
                     # Держим WebSocket сервер запущенным
-                    await self.websocket_server.wait_closed()
+                    await self.websocket_server.serve_forever()
                     
                 except Exception as e:
                     logger.error(f"❌ Ошибка запуска WebSocket сервера: {e}")
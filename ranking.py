@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Рейтинг серверов по количеству смен карт
+Топ-K без полной сортировки + скользящие окна на бакетах
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Окна рейтинга: название → длительность в секундах
+RANKING_WINDOWS = {
+    '10m': 600,
+    '1h': 3600,
+    '24h': 86400,
+}
+
+class TopKCounter:
+    """Счетчики с поддерживаемой кучей для запросов топ-K
+
+    Каждое изменение счетчика добавляет в кучу новую запись, устаревшие
+    записи отбрасываются лениво при запросе. Запрос топ-K стоит
+    O(K log N) плюс амортизированное удаление устаревших записей.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get(self, key):
+        return self.counts.get(key, 0)
+
+    def add(self, key, delta=1):
+        """Изменение счетчика на delta"""
+        value = self.counts.get(key, 0) + delta
+        if value > 0:
+            self.counts[key] = value
+            heapq.heappush(self._heap, (-value, key))
+        else:
+            self.counts.pop(key, None)
+
+        # Компактируем кучу, если устаревших записей стало слишком много
+        if len(self._heap) > 2 * len(self.counts) + 64:
+            self._heap = [(-value, key) for key, value in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k):
+        """Топ-K ключей по убыванию счетчика: список (key, count)"""
+        result = []
+        popped = []
+        seen = set()
+
+        while self._heap and len(result) < k:
+            entry = heapq.heappop(self._heap)
+            value, key = -entry[0], entry[1]
+            if key in seen or self.counts.get(key) != value:
+                continue  # Устаревшая запись
+            seen.add(key)
+            popped.append(entry)
+            result.append((key, value))
+
+        # Возвращаем актуальные записи обратно в кучу
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+
+        return result
+
+class SlidingWindowCounter:
+    """Счетчики за скользящее окно на основе бакетов фиксированной ширины"""
+
+    def __init__(self, window_seconds, buckets=60):
+        self.window_seconds = window_seconds
+        self.bucket_width = window_seconds / buckets
+        self.buckets_count = buckets
+        self.buckets = deque()  # (индекс бакета, {key: count})
+        self.totals = TopKCounter()
+
+    def _expire(self, now):
+        """Удаление бакетов, вышедших за пределы окна"""
+        oldest_allowed = int(now // self.bucket_width) - self.buckets_count + 1
+        while self.buckets and self.buckets[0][0] < oldest_allowed:
+            _, counts = self.buckets.popleft()
+            for key, value in counts.items():
+                self.totals.add(key, -value)
+
+    def _bucket(self, bucket_index):
+        """Бакет с указанным индексом (создается при необходимости)"""
+        if not self.buckets or self.buckets[-1][0] < bucket_index:
+            self.buckets.append((bucket_index, {}))
+            return self.buckets[-1][1]
+
+        # Событие из прошлого (например, при загрузке истории)
+        for position in range(len(self.buckets) - 1, -1, -1):
+            index, counts = self.buckets[position]
+            if index == bucket_index:
+                return counts
+            if index < bucket_index:
+                self.buckets.insert(position + 1, (bucket_index, {}))
+                return self.buckets[position + 1][1]
+
+        self.buckets.appendleft((bucket_index, {}))
+        return self.buckets[0][1]
+
+    def add(self, key, timestamp=None):
+        """Регистрация события для ключа"""
+        now = time.time()
+        bucket_index = int((now if timestamp is None else timestamp) // self.bucket_width)
+
+        # Событие уже вне окна
+        if bucket_index <= int(now // self.bucket_width) - self.buckets_count:
+            return
+
+        counts = self._bucket(bucket_index)
+        counts[key] = counts.get(key, 0) + 1
+        self.totals.add(key)
+        self._expire(now)
+
+    def get(self, key):
+        self._expire(time.time())
+        return self.totals.get(key)
+
+    def top(self, k):
+        self._expire(time.time())
+        return self.totals.top(k)
+
+class MapChangeRanking:
+    """Рейтинг серверов по сменам карт: за все время и за окна
+
+    Запись идет из потока сканирования, чтение - из WebSocket и HTTP,
+    поэтому все операции выполняются под блокировкой.
+    """
+
+    def __init__(self, windows=None):
+        self.lock = threading.Lock()
+        self.lifetime = TopKCounter()
+        self.windows = {
+            name: SlidingWindowCounter(seconds)
+            for name, seconds in (windows or RANKING_WINDOWS).items()
+        }
+
+    def record_change(self, steam_id, timestamp=None):
+        """Регистрация смены карты"""
+        with self.lock:
+            self.lifetime.add(steam_id)
+            for counter in self.windows.values():
+                counter.add(steam_id, timestamp)
+
+    def load(self, server_map_changes):
+        """Инициализация из сохраненных данных о сменах карт"""
+        lifetime = TopKCounter()
+        windows = {name: SlidingWindowCounter(counter.window_seconds) for name, counter in self.windows.items()}
+
+        events = []
+        for steam_id, stats in server_map_changes.items():
+            count = stats.get('changes_count', 0)
+            if count > 0:
+                lifetime.add(steam_id, count)
+
+            # Восстанавливаем окна по сохраненной истории смен
+            for record in stats.get('changes_history', []):
+                try:
+                    timestamp = datetime.fromisoformat(record['timestamp']).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                events.append((timestamp, steam_id))
+
+        events.sort()
+        for timestamp, steam_id in events:
+            for counter in windows.values():
+                counter.add(steam_id, timestamp)
+
+        with self.lock:
+            self.lifetime = lifetime
+            self.windows = windows
+
+    def top(self, limit=10, window=None):
+        """Топ серверов: список (steam_id, количество смен)"""
+        if window is None or window == 'all':
+            counter = self.lifetime
+        elif window in self.windows:
+            counter = self.windows[window]
+        else:
+            raise ValueError(f"Неизвестное окно: {window}")
+
+        with self.lock:
+            return counter.top(limit)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Кэш сериализованных ответов HTTP API по версии снимка состояния
+Пока версия не изменилась, повторный запрос с теми же параметрами
+отдает готовые байты без сериализации
+"""
+
+import threading
+from collections import OrderedDict
+
+def query_key(query):
+    """Нормализованные параметры запроса (порядок не важен)"""
+    return tuple(sorted((name, tuple(values)) for name, values in query.items()))
+
+# Суффиксы ETag сжатых вариантов ответа (http_compression.py)
+ENCODING_SUFFIXES = ('-gzip"', '-br"', '-zstd"')
+
+def etag_matches(header, etag):
+    """Проверка If-None-Match (список меток, *, слабые метки W/, сжатые варианты)"""
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip().removeprefix('W/')
+        for suffix in ENCODING_SUFFIXES:
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)] + '"'
+                break
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+class ResponseCache:
+    """Ответ для каждой пары (путь, параметры) - только последней версии
+
+    Записи старых версий заменяются при первом запросе новой; число
+    ключей ограничено (LRU), чтобы произвольные параметры не росли без границ.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # ключ → (версия, ответ)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, response):
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None and current[0] > version:
+                return  # Уже есть ответ более новой версии
+            self.entries[key] = (version, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': sum(len(response.body) for _, response in self.entries.values()),
+                'encoded_bytes': sum(len(body) for _, response in self.entries.values()
+                                     for body in response.encoded.values() if isinstance(body, bytes)),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified
+            }
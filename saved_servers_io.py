@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Импорт и экспорт сохраненных серверов в форматах CSV и NDJSON
+"""
+
+import csv
+import io
+import json
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_FIELDS = ('ip', 'port', 'name', 'mode', 'description', 'added_at', 'updated_at')
+
+def detect_format(format_name=None, content_type=None):
+    """Определение формата по явному параметру или Content-Type"""
+    if format_name:
+        format_name = format_name.lower()
+        if format_name not in EXPORT_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {format_name}")
+        return format_name
+    if content_type and 'csv' in content_type.lower():
+        return 'csv'
+    return 'ndjson'
+
+def iter_records(lines, format_name):
+    """Разбор потока строк в словари
+
+    Возвращает пары (номер строки, запись или None при ошибке разбора).
+    """
+    if format_name == 'csv':
+        reader = csv.DictReader(line for line in lines if line.strip())
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield line_number, None
+            continue
+        yield line_number, record if isinstance(record, dict) else None
+
+def validate_record(record):
+    """Проверка записи сервера; возвращает нормализованную запись или None"""
+    if not isinstance(record, dict):
+        return None
+
+    ip = str(record.get('ip') or '').strip()
+    port = str(record.get('port') or '').strip()
+    name = str(record.get('name') or '').strip()
+    mode = str(record.get('mode') or '').strip()
+
+    # Допускаем адрес одной колонкой: addr = "ip:port"
+    if not ip and record.get('addr') and ':' in str(record['addr']):
+        ip, port = str(record['addr']).strip().rsplit(':', 1)
+
+    if not ip or not name or not mode or not port.isdigit() or not 0 < int(port) < 65536:
+        return None
+
+    return {
+        'ip': ip,
+        'port': port,
+        'name': name,
+        'mode': mode,
+        'description': str(record.get('description') or '')
+    }
+
+def iter_export(servers, format_name):
+    """Потоковый экспорт серверов: генератор строк выбранного формата"""
+    if format_name == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for server in servers:
+            writer.writerow(server)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.getvalue():
+            yield buffer.getvalue()
+        return
+
+    for server in servers:
+        yield json.dumps(server, ensure_ascii=False) + '\n'
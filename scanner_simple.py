@@ -4,6 +4,8 @@ CS2 Server Scanner - Упрощенная версия
 Использует requests вместо aiohttp для совместимости
 """
 
+import asyncio
+import hashlib
 import json
 import logging
 import os
@@ -14,14 +16,35 @@ from urllib.parse import urlencode
 import argparse
 from concurrent.futures import ThreadPoolExecutor
 
+from ranking import MapChangeRanking, RANKING_WINDOWS
+from auto_save import AutoSaveRules
+from saved_servers_io import detect_format, iter_export, iter_records, validate_record
+from timeseries import TimeSeriesStore
+from broadcast import BroadcastHub
+from state_journal import StateJournal, same_record
+from wire_format import FIELD_DICTIONARY, available_encodings, serve_kwargs
+from subscriptions import Subscription, SubscriptionIndex, record_attributes
+from single_flight import SingleFlight
+from state_snapshot import SnapshotPublisher
+from server_view import STATUSES, ServerView
+from server_query import QueryIndex
+from batch_queries import BatchQueries
+from metrics import (MAP_FETCH_DURATION, MAP_FETCH_SERVERS, PERSIST_DURATION, REGISTRY, SCAN_CHANGES,
+                     SCAN_DURATION, UPSTREAM_RESPONSES, LatencyCollector)
+from change_feed import ChangeFeed
+from event_bus import EventBus, make_event
+from upstream_scheduler import UpstreamScheduler
+from ws_connections import ConnectionManager, keepalive_kwargs
+from ws_dispatch import MessageDispatcher
+
 try:
     import requests
     import websocket
     from websocket import create_connection
-    import websockets
+    import aiohttp
 except ImportError:
     print("❌ Необходимо установить зависимости:")
-    print("pip install requests websocket-client websockets")
+    print("pip install requests websocket-client aiohttp")
     exit(1)
 
 # Настройка логирования
@@ -32,18 +55,101 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+STEAM_SERVER_LIST_URL = "https://api.steampowered.com/IGameServersService/GetServerList/v1/"
+SERVER_LIST_LIMIT = 100  # Серверов в одном запросе GetServerList (страница обхода)
+
+def filter_pairs(server_filter):
+    """Пары фильтра \\ключ\\значение: порядок пар и регистр ключей не важны"""
+    parts = server_filter.strip('\\').split('\\')
+    return tuple(sorted((name.lower(), value) for name, value in zip(parts[::2], parts[1::2])))
+
+def map_filter(map_name):
+    """Фильтр GetServerList, которым сканер обходит карту"""
+    return f'appid\\730\\region\\44\\map\\{map_name}'
+
+def server_list_key(server_filter, offset=0, limit=SERVER_LIST_LIMIT, api_key=''):
+    """Ключ запроса GetServerList; ответы с разными API ключами не смешиваются (в ключе - хэш, не сам ключ)"""
+    key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    return ('GetServerList', filter_pairs(server_filter), int(offset), int(limit), key_hash)
+
+# Единый каталог карт CS2 по категориям
+MAP_CATALOG = {
+    # Активные карты CS2 (Premier/Competitive)
+    'premier': ('de_ancient', 'de_dust2', 'de_inferno', 'de_mirage', 'de_nuke',
+                'de_overpass', 'de_train', 'de_vertigo', 'de_anubis', 'de_grail', 'de_jura'),
+    # Карты для Wingman
+    'wingman': ('de_brewery', 'de_dogtown'),
+    # Устаревшие карты (для совместимости)
+    'legacy': ('de_cache', 'de_dust', 'de_aztec', 'de_italy', 'de_cobblestone', 'de_office'),
+}
+
+# Таблица карта → категория, строится один раз при импорте
+MAP_CATEGORY = {map_name: category for category, maps in MAP_CATALOG.items() for map_name in maps}
+
+def classify_maps(maps_visited):
+    """Определение режима сервера по набору посещенных карт"""
+    categories = {MAP_CATEGORY.get(map_name, 'other') for map_name in maps_visited}
+    
+    if not categories:
+        return 'unknown'
+    
+    # Если сервер посещал только Wingman карты
+    if categories == {'wingman'}:
+        return 'Wingman'
+    
+    # Если сервер посещал Premier карты
+    if 'premier' in categories:
+        if 'wingman' in categories:
+            return 'Mixed (Premier + Wingman)'
+        return 'Premier/Competitive'
+    
+    # Если сервер посещал только Legacy карты
+    if categories == {'legacy'}:
+        return 'Legacy'
+    
+    # Если смешанные карты
+    return 'Mixed'
+
 class CS2ScannerSimple:
     def __init__(self, max_workers=10):
         self.api_key = None
         self.max_workers = max_workers
         self.server_history = {}
+        self.last_seen_at = {}  # steamid → время последнего обнаружения (вне записей, не меняет версию)
         self.disappeared_servers = {}
         self.game_servers = {}
         self.empty_servers = {}
         self.saved_servers = {}
         self.is_scanning = False
         self.websocket_clients = set()
+        self.broadcast_hub = BroadcastHub()  # Очереди отправки для каждого клиента
+        self.connections = ConnectionManager(on_stale=self.forget_client)  # Лимиты и очистка соединений
+        self.dispatcher = self.build_dispatcher()  # Обработчики WebSocket сообщений по типам
+        self.state_journal = StateJournal()  # Дельты состояния с номерами последовательности
+        self.subscriptions = SubscriptionIndex()  # Подписки клиентов по картам/режимам/регионам
+        self.snapshots = SnapshotPublisher()  # Неизменяемые снимки состояния для читателей
+        self.server_view = ServerView()  # Серверы по статусам в порядке last_seen
+        self.query_index = QueryIndex()  # Индексы /api/servers, обновляемые по изменениям server_view
+        self.change_feed = ChangeFeed()  # Дельты серверов по версиям для SSE и long-poll
+        self.events = EventBus()  # События сканирования для потребителей побочных эффектов
+        self.batch = BatchQueries(self, classify_maps)  # Пакетные запросы на чтение (HTTP и WebSocket)
+        
+        # Сканирования по запросу: вне цикла событий, одинаковые запросы объединяются
+        self.on_demand = SingleFlight()
+        self.on_demand_ttl = 10  # Секунд, в течение которых результат переиспользуется
+        self.process_lock = threading.Lock()  # Один цикл обработки серверов одновременно
+        
+        # Общий бюджет запросов к Steam API с приоритетом запросов пользователя
+        self.upstream = UpstreamScheduler(rate=float(os.environ.get('STEAM_API_RATE', 10)))
+        self.http = requests.Session()  # Пул соединений к Steam API
+        self.http.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(max_workers, 10)))
+        
+        # Списки GetServerList по (фильтр, offset, limit): прокси /api/IGameServersService/...
+        # объединяет одинаковые запросы, фоновый обход кладет сюда свежие результаты карт
+        self.server_lists = SingleFlight(max_workers=4, name='steam-proxy')
+        self.server_list_ttl = float(os.environ.get('STEAM_PROXY_TTL', 10))
         self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Записи saved_servers.json по порядку снятия копий
         
         self.admin_password = "admin123"
         self.admin_authenticated = False
@@ -54,28 +160,121 @@ class CS2ScannerSimple:
         # Новые переменные для отслеживания смены карт
         self.server_map_changes = {}  # Счетчик смен карт для каждого сервера
         self.server_map_history = {}  # История карт для каждого сервера
-        self.auto_save_threshold = 3  # Порог для автоматического сохранения (смен карт)
+        self.auto_save_rules = AutoSaveRules()  # Правила автосохранения ("N смен за окно W")
+        self.auto_save_rules.load()
         self.auto_save_cooldown = {}  # Кулдаун для автосохранения (чтобы не спамить)
         
+        # Кэш режимов по steamid (пересчитывается только при смене истории карт)
+        self.server_modes = {}
+        self.mode_counts = {}  # Количество серверов в каждом режиме
+        
+        # Рейтинг серверов по сменам карт (за все время и за окна)
+        self.map_change_ranking = MapChangeRanking()
+        
+        # История заселенности карт и регионов (кольцевые буферы с агрегацией)
+        self.population_history = TimeSeriesStore()
+        self.population_history.load()
+        
         self.load_saved_servers()
         self.load_map_changes_data()
         
-        self.maps = [
-            # Активные карты CS2 (Premier/Competitive)
-            'de_ancient', 'de_dust2', 'de_inferno', 'de_mirage', 'de_nuke', 
-            'de_overpass', 'de_train', 'de_vertigo', 'de_anubis', 'de_grail', 'de_jura',
-            
-            # Карты для Wingman
-            'de_brewery', 'de_dogtown',
-            
-            # Устаревшие карты (для совместимости)
-            'de_cache', 'de_dust', 'de_aztec', 'de_italy', 'de_cobblestone', 'de_office'
-        ]
+        self.maps = [map_name for maps in MAP_CATALOG.values() for map_name in maps]
         self.selected_maps = set(self.maps)  # По умолчанию все карты выбраны
         self.scan_interval = 2  # seconds
+        
+        self.publish_snapshot(saved_servers=self.saved_servers, server_modes=self.server_modes,
+                              stats=self.snapshot_stats(), server_index=self.server_view.freeze(),
+                              server_query=self.query_index.freeze())
+        
+        # Потребители событий: каждый в своем потоке, события обрабатываются пачками
+        self.events.subscribe('map_changes', self.handle_map_change_events, types=('map_changed',))
+        self.events.subscribe('log', self.log_events, types=('map_changed', 'disappeared', 'returned', 'appeared'),
+                              batch_size=1000, max_delay=0)
+        self.events.subscribe('broadcast', self.broadcast_events, types=('cycle_completed',), max_delay=0)
+        self.events.subscribe('notifications', self.notify_events, types=('map_changed', 'disappeared', 'returned'))
+        self.events.subscribe('timeseries', self.save_population_events, types=('cycle_completed',), max_delay=0)
+        self.register_metrics()
+
+    @property
+    def snapshot(self):
+        """Последний опубликованный снимок состояния (чтение без блокировок)"""
+        return self.snapshots.current
+
+    def register_metrics(self):
+        """Показатели состояния для /metrics (вычисляются при запросе)"""
+        REGISTRY.gauge('cs2_websocket_clients', 'Подключенные клиенты WebSocket', lambda: len(self.websocket_clients))
+        REGISTRY.gauge('cs2_state_version', 'Версия опубликованного снимка состояния', lambda: self.snapshot.version)
+        REGISTRY.gauge('cs2_servers', 'Серверы по статусу в текущем снимке', lambda: {
+            status: len(servers) for status, servers in self.snapshot.server_index.items() if status != 'all'
+        }, ('status',))
+        REGISTRY.gauge('cs2_saved_servers', 'Сохраненные серверы', lambda: len(self.snapshot.saved_servers))
+        REGISTRY.gauge('cs2_event_queue_depth', 'События в очереди потребителя шины', lambda: {
+            name: consumer['queued'] for name, consumer in self.events.stats()['consumers'].items()
+        }, ('consumer',))
+        REGISTRY.gauge('cs2_event_dropped', 'События, отброшенные при переполнении очереди потребителя', lambda: {
+            name: consumer['dropped'] for name, consumer in self.events.stats()['consumers'].items()
+        }, ('consumer',))
+        REGISTRY.gauge('cs2_upstream_queued', 'Запросы к Steam API в очереди планировщика', lambda: {
+            name: data['queued'] for name, data in self.upstream.stats()['classes'].items()
+        }, ('priority',))
+        REGISTRY.collector(LatencyCollector('cs2_ws_handler_duration_seconds',
+                                            'Длительность обработки WebSocket сообщений по типу',
+                                            lambda: self.dispatcher.metrics, 'type'))
+
+    def publish_snapshot(self, **parts):
+        """Публикация нового снимка; версия растет только при изменении данных
+        
+        Вместе с коллекциями статусов публикуются индекс server_view и
+        вторичные индексы запросов /api/servers (server_query.py) - server_view
+        нужно обновить до вызова (под self.lock).
+        """
+        if not any(f'{status}_servers' in parts for status in STATUSES):
+            return self.snapshots.publish(**parts)
+        index = self.server_view.freeze()
+        current = self.snapshots.current
+        # Состав и порядок не изменились - индекс статусов прежний
+        parts['server_index'] = current.server_index if index == current.server_index else index
+        # Вторичные индексы обновляются только по записям, измененным в этом цикле
+        parts['server_query'] = self.query_index.update(self.server_view.members, self.server_view.drain_changes())
+        snapshot = self.snapshots.publish(**parts)
+        self.change_feed.update(snapshot)
+        return snapshot
+
+    def snapshot_stats(self):
+        return {
+            'total_tracked': len(self.server_history),
+            'mode_counts': self.get_mode_counts()
+        }
+
+    @property
+    def selected_maps(self):
+        """Выбранные для сканирования карты (множество)"""
+        return self._selected_maps
+
+    @selected_maps.setter
+    def selected_maps(self, maps):
+        """Замена выбора: любой список или множество известных карт; иначе ValueError"""
+        if isinstance(maps, (str, bytes, dict)) or not hasattr(maps, '__iter__'):
+            raise ValueError("selected_maps должен быть списком карт")
+        maps = set(maps)
+        unknown = maps - set(self.maps)
+        if unknown:
+            raise ValueError(f"Неизвестные карты: {', '.join(sorted(map(str, unknown)))}")
+        self._selected_maps = maps
+        # /api/maps версионируется по этой части снимка
+        self.snapshots.publish(maps={'catalog': tuple(self.maps), 'selected': tuple(sorted(maps))})
+
+    @property
+    def auto_save_threshold(self):
+        """Порог автосохранения (количество смен в правиле по умолчанию)"""
+        return self.auto_save_rules.get_threshold()
 
-    def fetch_servers(self, map_name, offset=0):
-        """Получение серверов для конкретной карты"""
+    @auto_save_threshold.setter
+    def auto_save_threshold(self, value):
+        self.auto_save_rules.set_threshold(value)
+
+    def fetch_servers(self, map_name, offset=0, priority='background'):
+        """Получение серверов для конкретной карты (запрос в очереди класса priority)"""
         if not self.api_key:
             logger.warning(f"⚠️ API ключ не установлен, пропускаем запрос для карты {map_name}")
             return []
@@ -99,19 +298,15 @@ class CS2ScannerSimple:
             return []
             
         try:
-            url = "https://api.steampowered.com/IGameServersService/GetServerList/v1/"
-            params = {
-                'key': self.api_key,
-                'filter': f'appid\\730\\region\\44\\map\\{map_name}',
-                'limit': 100,
-                'offset': offset
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            return data.get('response', {}).get('servers', [])
+            server_filter = map_filter(map_name)
+            with MAP_FETCH_DURATION.time(map_name):
+                body = self.fetch_server_list(self.api_key, server_filter, offset, SERVER_LIST_LIMIT, priority)
+            servers = json.loads(body).get('response', {}).get('servers', [])
+            # В кэш прокси - исходные байты: разобранные записи сканер дальше обрабатывает сам
+            self.server_lists.put(server_list_key(server_filter, offset, SERVER_LIST_LIMIT, self.api_key), body,
+                                  self.server_list_ttl)
+            MAP_FETCH_SERVERS.observe(len(servers), map_name)
+            return servers
             
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ Ошибка запроса для карты {map_name}: {e}")
@@ -120,30 +315,54 @@ class CS2ScannerSimple:
             logger.error(f"❌ Ошибка JSON для карты {map_name}: {e}")
             return []
 
-    def scan_map_with_offsets(self, map_name, max_offset=0):
-        """Сканирование карты с оффсетами"""
+    def is_map_filter(self, server_filter):
+        """Фильтр совпадает с фильтром обхода одной из карт сканера (map_filter)"""
+        pairs = filter_pairs(server_filter)
+        map_name = dict(pairs).get('map')
+        return map_name in self.maps and pairs == filter_pairs(map_filter(map_name))
+
+    def fetch_server_list(self, api_key, server_filter, offset=0, limit=SERVER_LIST_LIMIT, priority='interactive'):
+        """Тело ответа GetServerList (байты JSON) как есть, в очереди класса priority; ошибки HTTP - исключением"""
+        params = {'key': api_key, 'filter': server_filter, 'limit': limit, 'offset': offset}
+        self.upstream.acquire(priority)
+        try:
+            response = self.http.get(STEAM_SERVER_LIST_URL, params=params, timeout=10)
+        except requests.exceptions.RequestException:
+            UPSTREAM_RESPONSES.inc('error')
+            raise
+        UPSTREAM_RESPONSES.inc(response.status_code)
+        response.raise_for_status()
+        return response.content
+
+    def scan_map_with_offsets(self, map_name, max_offset=0, priority='background'):
+        """Сканирование карты с оффсетами (частоту запросов ограничивает self.upstream)"""
         all_servers = []
         
         for offset in range(0, max_offset + 1, 100):
-            servers = self.fetch_servers(map_name, offset)
+            servers = self.fetch_servers(map_name, offset, priority)
             if not servers:
                 break
             all_servers.extend(servers)
-            time.sleep(0.1)  # Небольшая задержка между запросами
         
         logger.info(f"🗺️ Карта {map_name}: найдено {len(all_servers)} серверов")
         return all_servers
 
-    def scan_all_maps(self):
-        """Сканирование всех карт"""
+    def scan_all_maps(self, priority='background'):
+        """Сканирование всех карт
+        
+        При фоновом обходе карты из подписок клиентов идут классом watchlist.
+        """
         all_servers = []
+        watched = self.subscriptions.subscribed_maps() if priority == 'background' else set()
+        started = time.perf_counter()
         
         # Создаем пул потоков
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Запускаем сканирование только выбранных карт в отдельном потоке
             future_to_map = {
-                executor.submit(self.scan_map_with_offsets, map_name, 0): map_name 
-                for map_name in self.selected_maps
+                executor.submit(self.scan_map_with_offsets, map_name, 0,
+                                'watchlist' if map_name in watched else priority): map_name
+                for map_name in self.get_scan_maps()
             }
             
             for future in future_to_map:
@@ -154,42 +373,81 @@ class CS2ScannerSimple:
                     map_name = future_to_map[future]
                     logger.error(f"❌ Ошибка сканирования карты {map_name}: {e}")
         
+        SCAN_DURATION.observe(time.perf_counter() - started, 'fetch')
         logger.info(f"📊 Всего найдено серверов: {len(all_servers)}")
         return all_servers
 
+    async def request_scan(self, key, function):
+        """Сканирование по запросу без блокировки цикла событий: (результат, источник)"""
+        future, source = self.on_demand.submit(key, function, self.on_demand_ttl)
+        return await asyncio.wrap_future(future), source
+
+    def get_scan_maps(self):
+        """Карты для сканирования: выбранные + карты из подписок клиентов"""
+        return set(self.selected_maps) | (self.subscriptions.subscribed_maps() & set(self.maps))
+
     def scan_graphics_settings(self):
-        """Сканирование graphics_settings"""
-        servers = self.scan_map_with_offsets('graphics_settings', 1000)
-        return servers
+        """Сканирование graphics_settings (запрос пользователя)"""
+        return self.scan_map_with_offsets('graphics_settings', 1000, 'interactive')
+
+    def current_record(self, previous, record, now):
+        """Запись для состояния: прежний объект, если отслеживаемые поля не изменились
+        
+        last_seen получает только новая или измененная запись (время, когда
+        сервер был замечен в этом состоянии). Цикл без изменений не меняет
+        ни записи, ни версию снимка, ни дельты; точное время последнего
+        обнаружения хранится в self.last_seen_at.
+        """
+        if previous is not None and same_record(previous, record):
+            return previous
+        record['last_seen'] = now
+        return record
 
     def process_servers(self, current_servers):
-        """Обработка найденных серверов"""
+        """Обработка найденных серверов
+        
+        Только сравнение с предыдущим состоянием: смены карт, исчезновения и
+        возвраты публикуются событиями в self.events, побочные эффекты
+        (сохранение, автосохранение, логирование, рассылка) выполняют
+        потребители шины.
+        """
+        started = time.perf_counter()
         current_ids = {server['steamid'] for server in current_servers if server.get('steamid')}
+        current_records = {}
+        events = []
+        now = time.time()
         
         # Обновляем историю серверов и добавляем информацию о режиме
         for server in current_servers:
             steam_id = server.get('steamid')
             if steam_id:
-                # Добавляем информацию о режиме сервера
+                # Добавляем информацию о режиме сервера (в копию: ответ Steam не изменяется)
+                mode = 'unknown'
                 addr = server.get('addr', '')
                 if addr:
                     ip_port = addr.split(':')
                     if len(ip_port) == 2:
                         ip, port = ip_port[0], ip_port[1]
-                        server['mode'] = self.get_server_mode(ip, port)
-                    else:
-                        server['mode'] = 'unknown'
-                else:
-                    server['mode'] = 'unknown'
+                        mode = self.get_server_mode(ip, port)
+                
+                # Вернувшийся сервер получает новую запись, неизмененный - прежнюю
+                previous = self.server_history.get(steam_id)
+                self.last_seen_at[steam_id] = now
+                server = self.current_record(None if steam_id in self.disappeared_servers else previous,
+                                             {**server, 'mode': mode}, now)
+                current_records[steam_id] = server
                 
                 # Отслеживаем смену карт
-                if steam_id in self.server_history:
-                    old_map = self.server_history[steam_id].get('map', 'unknown')
+                if previous is not None:
+                    old_map = previous.get('map', 'unknown')
                     new_map = server.get('map', 'unknown')
-                    server_name = server.get('name', steam_id)
                     
                     if old_map != new_map:
-                        self.track_map_change(steam_id, server_name, old_map, new_map)
+                        events.append(make_event('map_changed', steam_id, server.get('name', steam_id),
+                                                 old_map, new_map, server))
+                else:
+                    events.append(make_event('appeared', steam_id, server.get('name', steam_id),
+                                             new_map=server.get('map'), record=server))
                 
                 self.server_history[steam_id] = server
         
@@ -200,6 +458,8 @@ class CS2ScannerSimple:
                 # Сервер исчез - добавляем в список исчезнувших
                 disappeared_server = {
                     **old_server,
+                    'last_seen': self.last_seen_at.get(steam_id, old_server.get('last_seen')),
+                    'last_map': old_server.get('map'),
                     'map': 'graphics_settings',
                     'players': 0,
                     'max_players': 0,
@@ -210,435 +470,912 @@ class CS2ScannerSimple:
                 
                 with self.lock:
                     self.disappeared_servers[steam_id] = disappeared_server
+                    self.server_view.put('disappeared', steam_id, disappeared_server)
                 
                 disappeared_count += 1
-                logger.info(f"🔴 Сервер {old_server.get('name', steam_id)} исчез с карты {old_server.get('map')}")
+                events.append(make_event('disappeared', steam_id, old_server.get('name', steam_id),
+                                         old_map=old_server.get('map'), record=disappeared_server))
         
         # Дополнительная диагностика
-        logger.info(f"🔍 Диагностика исчезнувших серверов:")
-        logger.info(f"   - Всего в истории: {len(self.server_history)}")
-        logger.info(f"   - Текущих серверов: {len(current_ids)}")
-        logger.info(f"   - Уже в исчезнувших: {len(self.disappeared_servers)}")
-        logger.info(f"   - Новых исчезнувших: {disappeared_count}")
+        logger.debug(f"🔍 Диагностика исчезнувших серверов: в истории {len(self.server_history)}, "
+                     f"текущих {len(current_ids)}, уже исчезнувших {len(self.disappeared_servers)}, "
+                     f"новых исчезнувших {disappeared_count}")
         
-        # Проверяем вернувшиеся серверы
+        # Проверяем вернувшиеся серверы и удаляем их из исчезнувших
         returned_count = 0
-        disappeared_to_remove = []
-        for steam_id in list(self.disappeared_servers.keys()):
-            if steam_id in current_ids:
-                # Сервер вернулся - удаляем из исчезнувших
-                disappeared_to_remove.append(steam_id)
-                returned_count += 1
-                server_name = self.disappeared_servers[steam_id].get('name', steam_id)
-                logger.info(f"🟢 Сервер {server_name} вернулся на карту {self.server_history[steam_id].get('map', 'Unknown')}")
-        
-        # Удаляем вернувшиеся серверы
         with self.lock:
-            for steam_id in disappeared_to_remove:
-                server_name = self.disappeared_servers[steam_id].get('name', steam_id)
-                del self.disappeared_servers[steam_id]
-                logger.info(f"✅ Сервер {server_name} удален из списка исчезнувших")
+            for steam_id in [steam_id for steam_id in self.disappeared_servers if steam_id in current_ids]:
+                disappeared_server = self.disappeared_servers.pop(steam_id)
+                self.server_view.remove('disappeared', steam_id)
+                returned_count += 1
+                events.append(make_event('returned', steam_id, disappeared_server.get('name', steam_id),
+                                         old_map=disappeared_server.get('last_map'),
+                                         new_map=self.server_history[steam_id].get('map', 'Unknown'),
+                                         record=self.server_history[steam_id]))
         
         # Обновляем игровые серверы
         with self.lock:
             self.game_servers.clear()
-            for server in current_servers:
-                steam_id = server.get('steamid')
-                if steam_id and server.get('map') != 'graphics_settings':
+            for steam_id, server in current_records.items():
+                if server.get('map') != 'graphics_settings':
                     self.game_servers[steam_id] = server
-        
-        if disappeared_count > 0:
-            logger.info(f"📊 Найдено {disappeared_count} исчезнувших серверов")
-        if returned_count > 0:
-            logger.info(f"📊 Найдено {returned_count} вернувшихся серверов")
+            self.server_view.replace('game', self.game_servers)
         
         # Дополнительная диагностика
-        logger.info(f"📊 Статистика: отслеживается {len(self.server_history)}, исчезнувших {len(self.disappeared_servers)}, текущих {len(current_servers)}")
+        logger.info(f"📊 Статистика: отслеживается {len(self.server_history)}, исчезнувших {len(self.disappeared_servers)}, "
+                    f"текущих {len(current_servers)}, исчезло {disappeared_count}, вернулось {returned_count}")
         
-        return {
+        self.record_population(current_servers)
+        
+        with self.lock:
+            self.publish_snapshot(
+                game_servers=self.game_servers,
+                disappeared_servers=self.disappeared_servers,
+                server_modes=self.server_modes,
+                addresses={server.get('addr'): steam_id for steam_id, server in self.server_history.items()
+                           if server.get('addr')},
+                stats=self.snapshot_stats()
+            )
+        
+        stats = {
             'disappeared_count': disappeared_count,
             'returned_count': returned_count,
             'total_current': len(current_servers),
             'total_tracked': len(self.server_history)
         }
+        changes = dict.fromkeys(('appeared', 'disappeared', 'returned', 'map_changed'), 0)
+        for event in events:
+            if event.type in changes:
+                changes[event.type] += 1
+        for kind, count in changes.items():
+            SCAN_CHANGES.observe(count, kind)
+        SCAN_DURATION.observe(time.perf_counter() - started, 'process')
+        
+        events.append(make_event('cycle_completed', data=stats))
+        self.events.emit(events)
+        return stats
+
+    def record_population(self, current_servers):
+        """Запись количества серверов и игроков по картам и регионам за цикл"""
+        values = {}
+        for map_name in self.selected_maps:
+            values[f'map:{map_name}:servers'] = 0
+            values[f'map:{map_name}:players'] = 0
+        
+        for server in current_servers:
+            players = server.get('players', 0) or 0
+            for key in (f"map:{server.get('map', 'unknown')}", f"region:{server.get('region', 'unknown')}"):
+                values[f'{key}:servers'] = values.get(f'{key}:servers', 0) + 1
+                values[f'{key}:players'] = values.get(f'{key}:players', 0) + players
+        
+        # Исчезнувшие серверы числятся на graphics_settings
+        values['map:graphics_settings:servers'] = values.get('map:graphics_settings:servers', 0) + len(self.disappeared_servers)
+        
+        try:
+            self.population_history.record(values)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи временных рядов: {e}")
+
+    def save_population_events(self, events):
+        """Потребитель записи временных рядов: файл раз в save_interval вне потока сканирования"""
+        self.population_history.save_if_due()
 
     async def handle_websocket(self, websocket):
         """Обработка WebSocket соединений"""
+        admitted, reason = self.connections.admit(websocket)
+        if not admitted:
+            logger.warning(f"⛔ WebSocket соединение отклонено: {reason}")
+            await websocket.close(code=1013, reason=reason)
+            return
+        
         try:
             # Добавляем соединение в список клиентов
             self.websocket_clients.add(websocket)
+            self.broadcast_hub.register(websocket)
+            self.subscriptions.subscribe(websocket, Subscription())
             logger.info("🔌 Новое WebSocket соединение установлено")
             
             async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    logger.info(f"📨 Получено сообщение типа: {data.get('type')}")
-                    logger.info(f"📨 Полные данные: {data}")
-                    
-                    if data.get('type') == 'set_api_key':
-                        api_key = data.get('api_key')
-                        logger.info(f"🔑 Получен запрос на установку API ключа: {api_key[:10] if api_key else 'None'}...")
-                        if api_key:
-                            self.api_key = api_key
-                            logger.info("🔑 API ключ установлен")
-                            # Устанавливаем флаг, что API ключ получен
-                            self.api_key_set_flag.set()
-                            response = {
-                                'type': 'api_key_set',
-                                'status': 'success'
-                            }
-                            await websocket.send(json.dumps(response))
-                            logger.info("📤 Отправлен ответ об успешной установке API ключа")
-                        else:
-                            response = {
-                                'type': 'api_key_set',
-                                'status': 'error',
-                                'message': 'API ключ не предоставлен'
-                            }
-                            await websocket.send(json.dumps(response))
-                            logger.info("📤 Отправлен ответ об ошибке установки API ключа")
-                    
-                    elif data.get('type') == 'get_initial_state':
-                        with self.lock:
-                            await websocket.send(json.dumps({
-                                'type': 'initial_state',
-                                'disappeared_servers': list(self.disappeared_servers.values()),
-                                'game_servers': list(self.game_servers.values()),
-                                'stats': {
-                                    'total_tracked': len(self.server_history),
-                                    'total_disappeared': len(self.disappeared_servers),
-                                    'total_game': len(self.game_servers)
-                                }
-                            }))
-                    
-                    elif data.get('type') == 'scan_graphics_settings':
-                        servers = self.scan_graphics_settings()
-                        with self.lock:
-                            self.empty_servers = {server['steamid']: server for server in servers}
-                        await websocket.send(json.dumps({
-                            'type': 'empty_servers_update',
-                            'empty_servers': list(self.empty_servers.values())
-                        }))
-                    
-                    elif data.get('type') == 'get_game_servers':
-                        with self.lock:
-                            await websocket.send(json.dumps({
-                                'type': 'game_servers_update',
-                                'game_servers': list(self.game_servers.values())
-                            }))
-                    
-                    elif data.get('type') == 'start_scan':
-                        logger.info("🚀 Запуск сканирования по запросу от веб-интерфейса")
-                        # Запускаем сканирование в отдельном потоке
-                        import threading
-                        scan_thread = threading.Thread(target=self.run_single_scan)
-                        scan_thread.daemon = True
-                        scan_thread.start()
-                        
-                        await websocket.send(json.dumps({
-                            'type': 'scan_started',
-                            'status': 'success'
-                        }))
-                    
-                    elif data.get('type') == 'force_update':
-                        logger.info("📤 Принудительная отправка данных по запросу")
-                        with self.lock:
-                            await websocket.send(json.dumps({
-                                'type': 'scan_complete',
-                                'stats': {
-                                    'disappeared_count': len(self.disappeared_servers),
-                                    'returned_count': 0,
-                                    'total_current': len(self.game_servers),
-                                    'total_tracked': len(self.server_history)
-                                },
-                                'disappeared_servers': list(self.disappeared_servers.values()),
-                                'game_servers': list(self.game_servers.values())
-                            }))
-                        logger.info(f"📤 Принудительно отправлено: {len(self.disappeared_servers)} исчезнувших серверов")
-                    
-                    elif data.get('type') == 'update_maps':
-                        maps = data.get('maps', [])
-                        logger.info(f"🗺️ Обновление списка карт для сканирования: {maps}")
-                        self.selected_maps = set(maps)
-                        response = {
-                            'type': 'maps_updated',
-                            'status': 'success',
-                            'maps': list(self.selected_maps)
-                        }
-                        await websocket.send(json.dumps(response))
-                        logger.info(f"✅ Список карт обновлен: {len(self.selected_maps)} карт")
-                    
-                    elif data.get('type') == 'authenticate_admin':
-                        password = data.get('password')
-                        if self.authenticate_admin(password):
-                            await websocket.send(json.dumps({
-                                'type': 'admin_authenticated',
-                                'status': 'success'
-                            }))
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'admin_authenticated',
-                                'status': 'error',
-                                'message': 'Неверный пароль администратора'
-                            }))
-                    
-                    elif data.get('type') == 'get_saved_servers':
-                        # Обогащаем данные сохраненных серверов информацией о сменах карт и режиме
-                        enriched_servers = []
-                        logger.info(f"📦 Обработка {len(self.saved_servers)} сохраненных серверов")
-                        logger.info(f"📊 Доступно {len(self.server_map_changes)} записей о сменах карт")
-                        
-                        for server in self.saved_servers.values():
-                            # Ищем steam_id для этого сервера в истории
-                            steam_id = None
-                            server_addr = f"{server['ip']}:{server['port']}"
-                            server_name = server['name']
-                            
-                            # Ищем по адресу в истории серверов
-                            for sid, srv in self.server_history.items():
-                                if srv.get('addr') == server_addr:
-                                    steam_id = sid
-                                    break
-                            
-                            # Если не нашли по адресу, ищем по имени сервера в map_changes
-                            if not steam_id:
-                                for sid, map_data in self.server_map_changes.items():
-                                    map_server_name = map_data.get('server_name', '')
-                                    if map_server_name and server_name in map_server_name:
-                                        steam_id = sid
-                                        break
-                            
-                            enriched_server = server.copy()
-                            
-                            # Добавляем информацию о сменах карт
-                            if steam_id and steam_id in self.server_map_changes:
-                                map_stats = self.server_map_changes[steam_id]
-                                enriched_server['map_changes_count'] = map_stats['changes_count']
-                                enriched_server['last_map_change'] = map_stats.get('last_change', 'unknown')
-                            else:
-                                enriched_server['map_changes_count'] = 0
-                                enriched_server['last_map_change'] = 'unknown'
-                            
-                            # Определяем режим на основе карт
-                            if steam_id:
-                                determined_mode = self.determine_server_mode_from_maps(steam_id)
-                                if determined_mode != 'unknown':
-                                    enriched_server['mode'] = determined_mode
-                                logger.info(f"🔍 Сервер {server['name']} ({server_addr}): steam_id={steam_id}, режим={determined_mode}, смен карт={enriched_server.get('map_changes_count', 0)}")
-                            else:
-                                logger.warning(f"⚠️ Не найден steam_id для сервера {server['name']} ({server_addr})")
-                            
-                            enriched_servers.append(enriched_server)
-                        
-                        await websocket.send(json.dumps({
-                            'type': 'saved_servers_update',
-                            'saved_servers': enriched_servers
-                        }))
-                    
-                    elif data.get('type') == 'add_saved_server':
-                        ip = data.get('ip')
-                        port = data.get('port')
-                        name = data.get('name')
-                        mode = data.get('mode')
-                        description = data.get('description', '')
-                        if ip and port and name and mode:
-                            self.add_saved_server(ip, port, name, mode, description)
-                            await websocket.send(json.dumps({
-                                'type': 'add_saved_server',
-                                'status': 'success',
-                                'message': f'Сервер {name} ({ip}:{port}) добавлен'
-                            }))
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'add_saved_server',
-                                'status': 'error',
-                                'message': 'Не все данные для добавления сервера предоставлены'
-                            }))
-                    
-                    elif data.get('type') == 'update_saved_server':
-                        ip = data.get('ip')
-                        port = data.get('port')
-                        name = data.get('name')
-                        mode = data.get('mode')
-                        description = data.get('description', '')
-                        if ip and port and name and mode:
-                            if self.update_saved_server(ip, port, name, mode, description):
-                                await websocket.send(json.dumps({
-                                    'type': 'update_saved_server',
-                                    'status': 'success',
-                                    'message': f'Сервер {name} ({ip}:{port}) обновлен'
-                                }))
-                            else:
-                                await websocket.send(json.dumps({
-                                    'type': 'update_saved_server',
-                                    'status': 'error',
-                                    'message': f'Сервер ({ip}:{port}) не найден'
-                                }))
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'update_saved_server',
-                                'status': 'error',
-                                'message': 'Не все данные для обновления сервера предоставлены'
-                            }))
-                    
-                    elif data.get('type') == 'delete_saved_server':
-                        ip = data.get('ip')
-                        port = data.get('port')
-                        if ip and port:
-                            if self.delete_saved_server(ip, port):
-                                await websocket.send(json.dumps({
-                                    'type': 'delete_saved_server',
-                                    'status': 'success',
-                                    'message': f'Сервер ({ip}:{port}) удален'
-                                }))
-                            else:
-                                await websocket.send(json.dumps({
-                                    'type': 'delete_saved_server',
-                                    'status': 'error',
-                                    'message': f'Сервер ({ip}:{port}) не найден'
-                                }))
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'delete_saved_server',
-                                'status': 'error',
-                                'message': 'Не все данные для удаления сервера предоставлены'
-                            }))
-                    
-                    elif data.get('type') == 'get_map_changes_stats':
-                        # Получение статистики смен карт
-                        steam_id = data.get('steam_id')
-                        if steam_id:
-                            stats = self.get_server_map_stats(steam_id)
-                            if stats:
-                                await websocket.send(json.dumps({
-                                    'type': 'map_changes_stats',
-                                    'status': 'success',
-                                    'stats': stats
-                                }))
-                            else:
-                                await websocket.send(json.dumps({
-                                    'type': 'map_changes_stats',
-                                    'status': 'error',
-                                    'message': 'Статистика для сервера не найдена'
-                                }))
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'map_changes_stats',
-                                'status': 'error',
-                                'message': 'steam_id не предоставлен'
-                            }))
-                    
-                    elif data.get('type') == 'get_top_changing_servers':
-                        # Получение топ серверов по смене карт
-                        limit = data.get('limit', 10)
-                        top_servers = self.get_top_changing_servers(limit)
-                        await websocket.send(json.dumps({
-                            'type': 'top_changing_servers',
-                            'status': 'success',
-                            'servers': top_servers
-                        }))
-                    
-                    elif data.get('type') == 'set_auto_save_threshold':
-                        # Установка порога для автосохранения
-                        threshold = data.get('threshold')
-                        if threshold is not None and isinstance(threshold, int) and threshold > 0:
-                            self.auto_save_threshold = threshold
-                            await websocket.send(json.dumps({
-                                'type': 'auto_save_threshold_updated',
-                                'status': 'success',
-                                'threshold': self.auto_save_threshold
-                            }))
-                            logger.info(f"⚙️ Порог автосохранения установлен: {threshold} смен карт")
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'auto_save_threshold_updated',
-                                'status': 'error',
-                                'message': 'Неверное значение порога'
-                            }))
-                    
-                    elif data.get('type') == 'get_auto_save_threshold':
-                        # Получение текущего порога автосохранения
-                        await websocket.send(json.dumps({
-                            'type': 'auto_save_threshold',
-                            'status': 'success',
-                            'threshold': self.auto_save_threshold
-                        }))
-                    
-                    elif data.get('type') == 'force_cleanup':
-                        # Принудительная очистка списка исчезнувших серверов
-                        removed_count = self.force_cleanup_disappeared_servers()
-                        await websocket.send(json.dumps({
-                            'type': 'force_cleanup',
-                            'status': 'success',
-                            'message': f'Очищено {removed_count} серверов из списка исчезнувших'
-                        }))
-                        
-                        # Отправляем обновленное состояние
-                        await websocket.send(json.dumps({
-                            'type': 'scan_complete',
-                            'stats': {
-                                'disappeared_count': 0,
-                                'returned_count': removed_count,
-                                'total_current': len(self.game_servers),
-                                'total_tracked': len(self.server_history)
-                            },
-                            'disappeared_servers': [],
-                            'game_servers': list(self.game_servers.values())
-                        }))
+                self.connections.touch(websocket, len(message))
+                await self.dispatcher.dispatch(websocket, message)
                 
-                except Exception as e:
-                    logger.error(f"❌ Ошибка обработки сообщения: {e}")
-                
-        except websockets.exceptions.InvalidMessage as e:
-            logger.warning(f"⚠️ Неверный HTTP запрос к WebSocket: {e}")
-        except websockets.exceptions.ConnectionClosed as e:
+        except ConnectionError as e:
             logger.info(f"🔌 WebSocket соединение закрыто клиентом: {e}")
         except Exception as e:
             logger.error(f"❌ Ошибка в WebSocket обработчике: {e}")
         finally:
-            self.websocket_clients.discard(websocket)
+            self.dispatcher.close(websocket)
+            self.connections.release(websocket)
+            self.forget_client(websocket)
             logger.info("🔌 WebSocket соединение удалено из списка клиентов")
 
-    async def broadcast_update(self, data):
-        """Отправка обновлений всем подключенным клиентам"""
-        if not self.websocket_clients:
+    async def ws_set_api_key(self, websocket, data):
+        """Установка API ключа Steam"""
+        api_key = data.get('api_key')
+        logger.info(f"🔑 Получен запрос на установку API ключа: {api_key[:10] if api_key else 'None'}...")
+        if api_key:
+            self.api_key = api_key
+            logger.info("🔑 API ключ установлен")
+            # Устанавливаем флаг, что API ключ получен
+            self.api_key_set_flag.set()
+            response = {
+                'type': 'api_key_set',
+                'status': 'success'
+            }
+            await websocket.send(json.dumps(response))
+            logger.info("📤 Отправлен ответ об успешной установке API ключа")
+        else:
+            response = {
+                'type': 'api_key_set',
+                'status': 'error',
+                'message': 'API ключ не предоставлен'
+            }
+            await websocket.send(json.dumps(response))
+            logger.info("📤 Отправлен ответ об ошибке установки API ключа")
+
+    async def ws_get_initial_state(self, websocket, data):
+        """Полное состояние при подключении"""
+        if not data.get('delta'):
+            snapshot = self.snapshot
+            await websocket.send(json.dumps({
+                'type': 'initial_state',
+                'version': snapshot.version,
+                'disappeared_servers': snapshot.server_index['disappeared'],
+                'game_servers': snapshot.server_index['game'],
+                'stats': {
+                    **snapshot.stats,
+                    'total_disappeared': len(snapshot.disappeared_servers),
+                    'total_game': len(snapshot.game_servers)
+                }
+            }))
             return
         
-        message = json.dumps(data)
-        disconnected = set()
+        # Клиент поддерживает дельта-протокол: полный снимок с seq, далее только изменения
+        channel = self.broadcast_hub.channels.get(websocket)
+        state = self.snapshot
+        snapshot = self.filter_snapshot(websocket, self.state_journal.full())
+        if channel:
+            channel.protocol = 'delta'
+            channel.acked_seq = snapshot['seq']
+        self.broadcast_hub.send_to(websocket, {
+            'type': 'initial_state',
+            **snapshot,
+            'stats': {
+                **state.stats,
+                'total_disappeared': len(snapshot['disappeared_servers']),
+                'total_game': len(snapshot['game_servers']),
+                'version': state.version
+            }
+        })
+
+    async def ws_resync(self, websocket, data):
+        """Пересинхронизация после пропуска дельты"""
+        channel = self.broadcast_hub.channels.get(websocket)
+        since = data.get('since')
+        if not isinstance(since, int):
+            since = channel.acked_seq if channel else 0
+        delta = self.state_journal.since(since)
+        if delta is not None:
+            self.broadcast_hub.send_to(websocket, {
+                'type': 'state_delta',
+                'resync': True,
+                **self.filter_delta(websocket, delta)
+            })
+        else:
+            self.broadcast_hub.send_to(websocket, {
+                'type': 'initial_state',
+                **self.filter_snapshot(websocket, self.state_journal.full())
+            })
+
+    async def ws_set_encoding(self, websocket, data):
+        """Переключение формата сообщений (json или компактный msgpack)"""
+        encoding = data.get('encoding', 'json')
+        channel = self.broadcast_hub.channels.get(websocket)
+        if channel and encoding in available_encodings():
+            # Ответ уходит еще в старом формате, следующие сообщения - в новом
+            self.broadcast_hub.send_to(websocket, {
+                'type': 'encoding_set',
+                'status': 'success',
+                'encoding': encoding,
+                'fields': FIELD_DICTIONARY
+            })
+            channel.encoding = encoding
+        else:
+            await websocket.send(json.dumps({
+                'type': 'encoding_set',
+                'status': 'error',
+                'message': f'Формат {encoding} недоступен',
+                'encodings': list(available_encodings())
+            }))
+
+    async def ws_ack(self, websocket, data):
+        """Подтверждение применения дельты клиентом"""
+        channel = self.broadcast_hub.channels.get(websocket)
+        if channel and isinstance(data.get('seq'), int):
+            channel.acked_seq = data['seq']
+
+    async def ws_scan_graphics_settings(self, websocket, data):
+        """Сканирование graphics_settings по запросу"""
+        # Сканирование в пуле потоков; одновременные запросы ждут один результат
+        servers, source = await self.request_scan('graphics_settings', self.scan_graphics_settings)
+        if source == 'started':
+            now = time.time()
+            with self.lock:
+                self.empty_servers = {
+                    server['steamid']: self.current_record(self.empty_servers.get(server['steamid']), dict(server), now)
+                    for server in servers if server.get('steamid')
+                }
+                self.server_view.replace('empty', self.empty_servers)
+                self.publish_snapshot(empty_servers=self.empty_servers)
+        await websocket.send(json.dumps({
+            'type': 'empty_servers_update',
+            'source': source,
+            'empty_servers': self.snapshot.server_index['empty']
+        }))
+
+    async def ws_get_empty_servers(self, websocket, data):
+        """Последний результат сканирования graphics_settings"""
+        await websocket.send(json.dumps({
+            'type': 'empty_servers_update',
+            'empty_servers': self.snapshot.server_index['empty']
+        }))
+
+    async def ws_get_game_servers(self, websocket, data):
+        """Текущие игровые серверы"""
+        await websocket.send(json.dumps({
+            'type': 'game_servers_update',
+            'game_servers': self.snapshot.server_index['game']
+        }))
+
+    async def ws_start_scan(self, websocket, data):
+        """Внеочередное сканирование по запросу"""
+        logger.info("🚀 Запуск сканирования по запросу от веб-интерфейса")
+        # Результат придет общей рассылкой; повторные запросы присоединяются к текущему
+        _, source = self.on_demand.submit('full_scan', self.run_single_scan, self.on_demand_ttl)
         
-        for websocket in self.websocket_clients:
-            try:
-                await websocket.send(message)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(websocket)
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки WebSocket: {e}")
-                disconnected.add(websocket)
+        await websocket.send(json.dumps({
+            'type': 'scan_started',
+            'status': 'success',
+            'source': source
+        }))
+
+    async def ws_force_update(self, websocket, data):
+        """Принудительная отправка состояния"""
+        logger.info("📤 Принудительная отправка данных по запросу")
+        snapshot = self.snapshot
+        await websocket.send(json.dumps({
+            'type': 'scan_complete',
+            'stats': self.snapshot_cycle_stats(snapshot),
+            'disappeared_servers': snapshot.server_index['disappeared'],
+            'game_servers': snapshot.server_index['game']
+        }))
+        logger.info(f"📤 Принудительно отправлено: {len(snapshot.disappeared_servers)} исчезнувших серверов")
+
+    async def ws_update_maps(self, websocket, data):
+        """Смена карт в подписке клиента"""
+        # Карты меняются только в подписке этого клиента
+        maps = data.get('maps', [])
+        logger.info(f"🗺️ Обновление списка карт клиента: {maps}")
+        current = self.subscriptions.subscription_of(websocket).to_dict()
+        try:
+            subscription = Subscription.from_message({**current, 'maps': maps}, self.maps)
+        except ValueError as e:
+            await websocket.send(json.dumps({
+                'type': 'maps_updated',
+                'status': 'error',
+                'message': str(e)
+            }))
+            return
+        self.subscriptions.subscribe(websocket, subscription)
+        response = {
+            'type': 'maps_updated',
+            'status': 'success',
+            'maps': sorted(subscription.maps or self.maps)
+        }
+        await websocket.send(json.dumps(response))
+        self.send_subscription_snapshot(websocket)
+        logger.info(f"✅ Список карт клиента обновлен: {len(response['maps'])} карт")
+
+    async def ws_subscribe(self, websocket, data):
+        """Подписка клиента: maps, modes, regions, steamids, saved_only"""
+        try:
+            subscription = Subscription.from_message(data, self.maps)
+        except ValueError as e:
+            await websocket.send(json.dumps({
+                'type': 'subscribed',
+                'status': 'error',
+                'message': str(e)
+            }))
+        else:
+            self.subscriptions.subscribe(websocket, subscription)
+            self.broadcast_hub.send_to(websocket, {
+                'type': 'subscribed',
+                'status': 'success',
+                'subscription': subscription.to_dict()
+            })
+            self.send_subscription_snapshot(websocket)
+
+    async def ws_authenticate_admin(self, websocket, data):
+        """Аутентификация администратора"""
+        password = data.get('password')
+        if self.authenticate_admin(password):
+            await websocket.send(json.dumps({
+                'type': 'admin_authenticated',
+                'status': 'success'
+            }))
+        else:
+            await websocket.send(json.dumps({
+                'type': 'admin_authenticated',
+                'status': 'error',
+                'message': 'Неверный пароль администратора'
+            }))
+
+    def ws_batch(self, websocket, data):
+        """Несколько запросов на чтение по одному снимку (как POST /api/batch, в пуле потоков)"""
+        try:
+            return {'type': 'batch', 'status': 'success', 'request_id': data.get('request_id'),
+                    **self.batch.run(data.get('queries'))}
+        except ValueError as e:
+            return {'type': 'batch', 'status': 'error', 'request_id': data.get('request_id'), 'message': str(e)}
+
+    def ws_get_saved_servers(self, websocket, data):
+        """Сохраненные серверы с данными о сменах карт и режиме (в пуле потоков)"""
+        enriched_servers = []
+        snapshot = self.snapshot
+        # Словарь смен карт меняет поток map_changes - берем нужные поля под self.lock
+        with self.lock:
+            map_changes = {sid: (map_data.get('server_name', ''), map_data['changes_count'],
+                                 map_data.get('last_change', 'unknown'))
+                           for sid, map_data in self.server_map_changes.items()}
+        logger.debug(f"📦 Обработка {len(snapshot.saved_servers)} сохраненных серверов, "
+                     f"{len(map_changes)} записей о сменах карт")
+        
+        for server in snapshot.saved_servers.values():
+            server_addr = f"{server['ip']}:{server['port']}"
+            server_name = server['name']
+            
+            # Ищем steam_id по адресу в снимке
+            steam_id = snapshot.addresses.get(server_addr)
+            
+            # Если не нашли по адресу, ищем по имени сервера в map_changes
+            if not steam_id:
+                for sid, (map_server_name, _, _) in map_changes.items():
+                    if map_server_name and server_name in map_server_name:
+                        steam_id = sid
+                        break
+            
+            enriched_server = server.copy()
+            
+            # Добавляем информацию о сменах карт
+            if steam_id and steam_id in map_changes:
+                _, changes_count, last_change = map_changes[steam_id]
+                enriched_server['map_changes_count'] = changes_count
+                enriched_server['last_map_change'] = last_change
+            else:
+                enriched_server['map_changes_count'] = 0
+                enriched_server['last_map_change'] = 'unknown'
+            
+            # Определяем режим на основе карт
+            if steam_id:
+                determined_mode = snapshot.server_modes.get(steam_id, 'unknown')
+                if determined_mode != 'unknown':
+                    enriched_server['mode'] = determined_mode
+                logger.debug(f"🔍 Сервер {server['name']} ({server_addr}): steam_id={steam_id}, режим={determined_mode}, смен карт={enriched_server.get('map_changes_count', 0)}")
+            else:
+                logger.debug(f"⚠️ Не найден steam_id для сервера {server['name']} ({server_addr})")
+            
+            enriched_servers.append(enriched_server)
+        
+        return {
+            'type': 'saved_servers_update',
+            'saved_servers': enriched_servers
+        }
+
+    def ws_add_saved_server(self, websocket, data):
+        """Добавление сохраненного сервера (в пуле потоков)"""
+        ip = data.get('ip')
+        port = data.get('port')
+        name = data.get('name')
+        mode = data.get('mode')
+        description = data.get('description', '')
+        if ip and port and name and mode:
+            self.add_saved_server(ip, port, name, mode, description)
+            return {
+                'type': 'add_saved_server',
+                'status': 'success',
+                'message': f'Сервер {name} ({ip}:{port}) добавлен'
+            }
+        else:
+            return {
+                'type': 'add_saved_server',
+                'status': 'error',
+                'message': 'Не все данные для добавления сервера предоставлены'
+            }
+
+    def ws_update_saved_server(self, websocket, data):
+        """Обновление сохраненного сервера (в пуле потоков)"""
+        ip = data.get('ip')
+        port = data.get('port')
+        name = data.get('name')
+        mode = data.get('mode')
+        description = data.get('description', '')
+        if ip and port and name and mode:
+            if self.update_saved_server(ip, port, name, mode, description):
+                return {
+                    'type': 'update_saved_server',
+                    'status': 'success',
+                    'message': f'Сервер {name} ({ip}:{port}) обновлен'
+                }
+            else:
+                return {
+                    'type': 'update_saved_server',
+                    'status': 'error',
+                    'message': f'Сервер ({ip}:{port}) не найден'
+                }
+        else:
+            return {
+                'type': 'update_saved_server',
+                'status': 'error',
+                'message': 'Не все данные для обновления сервера предоставлены'
+            }
+
+    def ws_import_saved_servers(self, websocket, data):
+        """Массовый импорт: servers - список объектов или data - строка CSV/NDJSON (в пуле потоков)"""
+        try:
+            if isinstance(data.get('servers'), list):
+                records = data['servers']
+            else:
+                format_name = detect_format(data.get('format'))
+                records = (record for _, record in iter_records(
+                    str(data.get('data') or '').splitlines(), format_name))
+            stats = self.import_saved_servers(records)
+            return {
+                'type': 'import_saved_servers',
+                'status': 'success',
+                'stats': stats
+            }
+        except ValueError as e:
+            return {
+                'type': 'import_saved_servers',
+                'status': 'error',
+                'message': str(e)
+            }
+
+    async def ws_export_saved_servers(self, websocket, data):
+        """Потоковый экспорт частями по 500 строк"""
+        try:
+            format_name = detect_format(data.get('format'))
+        except ValueError as e:
+            await websocket.send(json.dumps({
+                'type': 'export_saved_servers',
+                'status': 'error',
+                'message': str(e)
+            }))
+        else:
+            chunk = []
+            chunk_index = 0
+            for line in self.export_saved_servers(format_name):
+                chunk.append(line)
+                if len(chunk) >= 500:
+                    await websocket.send(json.dumps({
+                        'type': 'export_saved_servers',
+                        'status': 'success',
+                        'format': format_name,
+                        'chunk': chunk_index,
+                        'data': ''.join(chunk),
+                        'done': False
+                    }))
+                    chunk = []
+                    chunk_index += 1
+            await websocket.send(json.dumps({
+                'type': 'export_saved_servers',
+                'status': 'success',
+                'format': format_name,
+                'chunk': chunk_index,
+                'data': ''.join(chunk),
+                'done': True
+            }))
+
+    def ws_delete_saved_server(self, websocket, data):
+        """Удаление сохраненного сервера (в пуле потоков)"""
+        ip = data.get('ip')
+        port = data.get('port')
+        if ip and port:
+            if self.delete_saved_server(ip, port):
+                return {
+                    'type': 'delete_saved_server',
+                    'status': 'success',
+                    'message': f'Сервер ({ip}:{port}) удален'
+                }
+            else:
+                return {
+                    'type': 'delete_saved_server',
+                    'status': 'error',
+                    'message': f'Сервер ({ip}:{port}) не найден'
+                }
+        else:
+            return {
+                'type': 'delete_saved_server',
+                'status': 'error',
+                'message': 'Не все данные для удаления сервера предоставлены'
+            }
+
+    def ws_get_map_changes_stats(self, websocket, data):
+        """Статистика смен карт сервера (в пуле потоков)"""
+        steam_id = data.get('steam_id')
+        if steam_id:
+            stats = self.get_server_map_stats(steam_id)
+            if stats:
+                return {
+                    'type': 'map_changes_stats',
+                    'status': 'success',
+                    'stats': stats
+                }
+            else:
+                return {
+                    'type': 'map_changes_stats',
+                    'status': 'error',
+                    'message': 'Статистика для сервера не найдена'
+                }
+        else:
+            return {
+                'type': 'map_changes_stats',
+                'status': 'error',
+                'message': 'steam_id не предоставлен'
+            }
+
+    def ws_get_top_changing_servers(self, websocket, data):
+        """Топ серверов по сменам карт (в пуле потоков)"""
+        limit = data.get('limit', 10)
+        window = data.get('window')
+        try:
+            top_servers = self.get_top_changing_servers(limit, window)
+            return {
+                'type': 'top_changing_servers',
+                'status': 'success',
+                'window': window or 'all',
+                'servers': top_servers
+            }
+        except ValueError as e:
+            return {
+                'type': 'top_changing_servers',
+                'status': 'error',
+                'message': str(e),
+                'windows': ['all', *RANKING_WINDOWS]
+            }
+
+    async def ws_set_auto_save_threshold(self, websocket, data):
+        """Установка порога для автосохранения"""
+        threshold = data.get('threshold')
+        if threshold is not None and isinstance(threshold, int) and threshold > 0:
+            self.auto_save_threshold = threshold
+            await websocket.send(json.dumps({
+                'type': 'auto_save_threshold_updated',
+                'status': 'success',
+                'threshold': self.auto_save_threshold
+            }))
+            logger.info(f"⚙️ Порог автосохранения установлен: {threshold} смен карт")
+        else:
+            await websocket.send(json.dumps({
+                'type': 'auto_save_threshold_updated',
+                'status': 'error',
+                'message': 'Неверное значение порога'
+            }))
+
+    async def ws_get_auto_save_threshold(self, websocket, data):
+        """Текущий порог автосохранения"""
+        # Получение текущего порога автосохранения
+        await websocket.send(json.dumps({
+            'type': 'auto_save_threshold',
+            'status': 'success',
+            'threshold': self.auto_save_threshold
+        }))
+
+    async def ws_get_auto_save_rules(self, websocket, data):
+        """Правила автосохранения и статистика срабатываний"""
+        await websocket.send(json.dumps({
+            'type': 'auto_save_rules',
+            'status': 'success',
+            **self.auto_save_rules.stats()
+        }))
+
+    async def ws_change_auto_save_rules(self, websocket, data):
+        """Изменение правил автосохранения (set/upsert/delete)"""
+        # Изменение правил автосохранения
+        try:
+            if data['type'] == 'set_auto_save_rules':
+                self.auto_save_rules.set_rules(data.get('rules') or [])
+            elif data['type'] == 'upsert_auto_save_rule':
+                self.auto_save_rules.upsert_rule(data.get('rule'))
+            elif not self.auto_save_rules.delete_rule(data.get('rule_id')):
+                raise ValueError(f"Правило {data.get('rule_id')} не найдено")
+            
+            await websocket.send(json.dumps({
+                'type': 'auto_save_rules',
+                'status': 'success',
+                **self.auto_save_rules.stats()
+            }))
+            logger.info(f"⚙️ Правила автосохранения обновлены: {len(self.auto_save_rules.rules)}")
+        except (ValueError, TypeError) as e:
+            await websocket.send(json.dumps({
+                'type': 'auto_save_rules',
+                'status': 'error',
+                'message': str(e)
+            }))
+
+    async def ws_get_connection_stats(self, websocket, data):
+        """Соединения, лимиты и оценка памяти"""
+        await websocket.send(json.dumps({
+            'type': 'connection_stats',
+            'stats': self.connection_stats(),
+            'self': self.connections.memory(websocket, self.broadcast_hub.channels.get(websocket))
+        }))
+
+    async def ws_get_handler_metrics(self, websocket, data):
+        """Задержки и ошибки обработчиков по типам сообщений"""
+        await websocket.send(json.dumps({
+            'type': 'handler_metrics',
+            'metrics': self.dispatcher.stats()
+        }))
+
+    async def ws_force_cleanup(self, websocket, data):
+        """Принудительная очистка списка исчезнувших серверов"""
+        # Ждет завершения текущей обработки - выполняется вне цикла событий
+        removed_count = await asyncio.get_running_loop().run_in_executor(
+            None, self.force_cleanup_disappeared_servers)
+        snapshot = self.snapshot
+        stats = {
+            **self.snapshot_cycle_stats(snapshot),
+            'disappeared_count': 0,
+            'returned_count': removed_count
+        }
+        self.publish_state(stats, full=False)
+        await websocket.send(json.dumps({
+            'type': 'force_cleanup',
+            'status': 'success',
+            'message': f'Очищено {removed_count} серверов из списка исчезнувших'
+        }))
         
-        # Удаляем отключенные соединения
-        self.websocket_clients -= disconnected
+        # Отправляем обновленное состояние
+        await websocket.send(json.dumps({
+            'type': 'scan_complete',
+            'stats': stats,
+            'disappeared_servers': [],
+            'game_servers': snapshot.server_index['game']
+        }))
+
+    def build_dispatcher(self):
+        """Таблица обработчиков WebSocket сообщений
+        
+        Обработчики, меняющие состояние соединения или данные, выполняются
+        по порядку; только читающие - параллельно (concurrent). Синхронные
+        обработчики с offload выполняются в пуле потоков.
+        """
+        dispatcher = MessageDispatcher()
+        address = {'ip': (str, False), 'port': ((str, int), False)}
+        saved_server = {**address, 'name': (str, False), 'mode': (str, False), 'description': (str, False)}
+        
+        # По порядку
+        dispatcher.register('set_api_key', self.ws_set_api_key, schema={'api_key': (str, False)}, reply_type='api_key_set')
+        dispatcher.register('get_initial_state', self.ws_get_initial_state, schema={'delta': (bool, False)},
+                            reply_type='initial_state')
+        dispatcher.register('resync', self.ws_resync, schema={'since': (int, False)})
+        dispatcher.register('set_encoding', self.ws_set_encoding, schema={'encoding': (str, False)},
+                            reply_type='encoding_set')
+        dispatcher.register('ack', self.ws_ack, schema={'seq': (int, False)})
+        dispatcher.register('update_maps', self.ws_update_maps, schema={'maps': (list, False)}, reply_type='maps_updated')
+        dispatcher.register('subscribe', self.ws_subscribe, reply_type='subscribed')
+        dispatcher.register('authenticate_admin', self.ws_authenticate_admin, schema={'password': (str, False)},
+                            reply_type='admin_authenticated')
+        dispatcher.register('add_saved_server', self.ws_add_saved_server, schema=saved_server, offload=True)
+        dispatcher.register('update_saved_server', self.ws_update_saved_server, schema=saved_server, offload=True)
+        dispatcher.register('delete_saved_server', self.ws_delete_saved_server, schema=address, offload=True)
+        dispatcher.register('import_saved_servers', self.ws_import_saved_servers, offload=True,
+                            schema={'servers': (list, False), 'data': (str, False), 'format': (str, False)})
+        dispatcher.register('set_auto_save_threshold', self.ws_set_auto_save_threshold,
+                            schema={'threshold': (int, True)}, reply_type='auto_save_threshold_updated')
+        for message_type in ('set_auto_save_rules', 'upsert_auto_save_rule', 'delete_auto_save_rule'):
+            dispatcher.register(message_type, self.ws_change_auto_save_rules, reply_type='auto_save_rules',
+                                schema={'rules': (list, False), 'rule': (dict, False), 'rule_id': (str, False)})
+        dispatcher.register('force_cleanup', self.ws_force_cleanup)
+        
+        # Только чтение - параллельно с другими сообщениями соединения
+        dispatcher.register('scan_graphics_settings', self.ws_scan_graphics_settings, concurrent=True,
+                            reply_type='empty_servers_update')
+        dispatcher.register('start_scan', self.ws_start_scan, concurrent=True, reply_type='scan_started')
+        dispatcher.register('get_game_servers', self.ws_get_game_servers, concurrent=True)
+        dispatcher.register('get_empty_servers', self.ws_get_empty_servers, concurrent=True)
+        dispatcher.register('force_update', self.ws_force_update, concurrent=True)
+        dispatcher.register('batch', self.ws_batch, concurrent=True, offload=True,
+                            schema={'queries': (list, True), 'request_id': ((str, int), False)})
+        dispatcher.register('get_saved_servers', self.ws_get_saved_servers, concurrent=True, offload=True,
+                            reply_type='saved_servers_update')
+        dispatcher.register('export_saved_servers', self.ws_export_saved_servers, concurrent=True,
+                            schema={'format': (str, False)})
+        dispatcher.register('get_map_changes_stats', self.ws_get_map_changes_stats, concurrent=True, offload=True,
+                            schema={'steam_id': (str, False)}, reply_type='map_changes_stats')
+        dispatcher.register('get_top_changing_servers', self.ws_get_top_changing_servers, concurrent=True,
+                            offload=True, schema={'limit': (int, False), 'window': (str, False)},
+                            reply_type='top_changing_servers')
+        dispatcher.register('get_auto_save_threshold', self.ws_get_auto_save_threshold, concurrent=True)
+        dispatcher.register('get_auto_save_rules', self.ws_get_auto_save_rules, concurrent=True)
+        dispatcher.register('get_connection_stats', self.ws_get_connection_stats, concurrent=True)
+        dispatcher.register('get_handler_metrics', self.ws_get_handler_metrics, concurrent=True)
+        return dispatcher
+
+    def forget_client(self, websocket):
+        """Удаление клиента из списков рассылки и подписок"""
+        self.websocket_clients.discard(websocket)
+        self.broadcast_hub.unregister(websocket)
+        self.subscriptions.unsubscribe(websocket)
+
+    def connection_stats(self):
+        """Соединения, лимиты и оценка памяти клиентов"""
+        return {
+            **self.connections.stats(self.broadcast_hub.channels),
+            'broadcast': self.broadcast_hub.stats()
+        }
+
+    async def broadcast_update(self, data):
+        """Отправка обновлений всем подключенным клиентам"""
+        self.broadcast_update_sync(data)
 
     def broadcast_update_sync(self, data):
-        """Синхронная версия отправки обновлений"""
-        if not self.websocket_clients:
-            return
+        """Отправка обновлений из любого потока
         
-        message = json.dumps(data)
-        disconnected = set()
+        Сообщение ставится в очереди клиентов в цикле событий WebSocket
+        сервера; неотправленное состояние того же типа заменяется новым.
+        """
+        self.broadcast_hub.publish(data, coalesce_key=data.get('type'))
+
+    def subscription_attributes(self, record):
+        """Атрибуты записи для сопоставления с подписками"""
+        steam_id = record.get('steamid')
+        mode = self.server_modes.get(steam_id) or record.get('mode', 'unknown')
+        return record_attributes(record, mode, record.get('addr') in self.snapshot.saved_servers)
+
+    def filter_records(self, subscription, records):
+        if subscription.is_wildcard():
+            return list(records)
+        return [record for record in records if subscription.matches(self.subscription_attributes(record))]
+
+    def filter_snapshot(self, websocket, snapshot):
+        """Снимок состояния с учетом подписки клиента"""
+        subscription = self.subscriptions.subscription_of(websocket)
+        return {
+            **snapshot,
+            'game_servers': self.filter_records(subscription, snapshot['game_servers']),
+            'disappeared_servers': self.filter_records(subscription, snapshot['disappeared_servers'])
+        }
+
+    def filter_delta(self, websocket, delta):
+        """Дельта с учетом подписки: неподходящие записи становятся удалениями"""
+        subscription = self.subscriptions.subscription_of(websocket)
+        if subscription.is_wildcard():
+            return delta
         
-        for websocket in self.websocket_clients:
-            try:
-                # Используем asyncio.run для выполнения асинхронной операции
-                asyncio.run(websocket.send(message))
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(websocket)
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки WebSocket: {e}")
-                disconnected.add(websocket)
+        filtered = {'seq': delta['seq'], 'base_seq': delta['base_seq']}
+        for name in self.state_journal.collections:
+            change = delta.get(name)
+            if not change:
+                continue
+            upsert, remove = [], list(change['remove'])
+            for record in change['upsert']:
+                if subscription.matches(self.subscription_attributes(record)):
+                    upsert.append(record)
+                else:
+                    remove.append(record.get('steamid'))
+            filtered[name] = {'upsert': upsert, 'remove': remove}
+        return filtered
+
+    def send_subscription_snapshot(self, websocket):
+        """Снимок состояния после смены подписки"""
+        snapshot = self.filter_snapshot(websocket, self.state_journal.full())
+        channel = self.broadcast_hub.channels.get(websocket)
+        if channel:
+            channel.acked_seq = snapshot['seq']
+        self.broadcast_hub.send_to(websocket, {'type': 'initial_state', **snapshot})
+
+    def route_changes(self, changes):
+        """Распределение изменений по группам подписок через индекс
+        
+        Запись уходит только группам, которым она интересна; группа, которой
+        запись перестала подходить, получает ее удаление.
+        """
+        routed = {}
+        
+        def target(group, name):
+            changes_by_name = routed.setdefault(group, {})
+            if name not in changes_by_name:
+                changes_by_name[name] = {'upsert': [], 'remove': []}
+            return changes_by_name[name]
+        
+        for name, pairs in changes.items():
+            for key, old, new in pairs:
+                new_groups = self.subscriptions.groups_for(self.subscription_attributes(new)) if new is not None else set()
+                old_groups = self.subscriptions.groups_for(self.subscription_attributes(old)) if old is not None else set()
+                for group in new_groups:
+                    target(group, name)['upsert'].append(new)
+                for group in old_groups - new_groups:
+                    target(group, name)['remove'].append(key)
+        return routed
+
+    def publish_state(self, stats, full=True):
+        """Рассылка результатов цикла
+        
+        Клиентам дельта-протокола уходят только изменения с seq, остальным
+        (full=True) - полные списки как раньше. При наличии подписок каждая
+        группа клиентов получает только подходящие ей записи.
+        """
+        snapshot = self.snapshot
+        state = {
+            'game_servers': snapshot.game_servers,
+            'disappeared_servers': snapshot.disappeared_servers
+        }
+        
+        delta, changes = self.state_journal.commit(state)
+        wildcard_only = self.subscriptions.only_wildcard()
+        groups = [] if wildcard_only else self.subscriptions.snapshot_groups()
+        
+        if delta is not None and self.broadcast_hub.has_clients('delta'):
+            if wildcard_only:
+                self.broadcast_hub.publish({'type': 'state_delta', 'stats': stats, **delta}, protocol='delta')
+            else:
+                routed = self.route_changes(changes)
+                for group, clients in groups:
+                    group_changes = routed.get(group, {})
+                    disappeared = group_changes.get('disappeared_servers', {'upsert': [], 'remove': []})
+                    # Пустая дельта тоже нужна - она сохраняет непрерывность seq
+                    self.broadcast_hub.publish({
+                        'type': 'state_delta',
+                        'stats': {
+                            **stats,
+                            'disappeared_count': len(disappeared['upsert']),
+                            'returned_count': len(disappeared['remove'])
+                        },
+                        'seq': delta['seq'],
+                        'base_seq': delta['base_seq'],
+                        **group_changes
+                    }, protocol='delta', clients=clients)
+        
+        if full:
+            self.publish_full_state(stats, snapshot)
+
+    def publish_full_state(self, stats, snapshot=None):
+        """Полные списки клиентам без дельта-протокола (с учетом подписок)"""
+        if not self.broadcast_hub.has_clients('full'):
+            return
+        
+        snapshot = snapshot or self.snapshot
+        state = {
+            'game_servers': snapshot.game_servers,
+            'disappeared_servers': snapshot.disappeared_servers
+        }
         
-        # Удаляем отключенные соединения
-        self.websocket_clients -= disconnected
+        if self.subscriptions.only_wildcard():
+            self.broadcast_hub.publish({
+                'type': 'scan_complete',
+                'stats': stats,
+                'disappeared_servers': snapshot.server_index['disappeared'],
+                'game_servers': snapshot.server_index['game']
+            }, coalesce_key='scan_complete', protocol='full')
+        else:
+            for group, clients in self.subscriptions.snapshot_groups():
+                self.broadcast_hub.publish({
+                    'type': 'scan_complete',
+                    'stats': stats,
+                    'disappeared_servers': self.filter_records(group.subscription, state['disappeared_servers'].values()),
+                    'game_servers': self.filter_records(group.subscription, state['game_servers'].values())
+                }, coalesce_key='scan_complete', protocol='full', clients=clients)
+
+    def snapshot_cycle_stats(self, snapshot):
+        """Статистика цикла для повторной отправки состояния из снимка"""
+        return {
+            'disappeared_count': len(snapshot.disappeared_servers),
+            'returned_count': 0,
+            'total_current': len(snapshot.game_servers),
+            'total_tracked': snapshot.stats.get('total_tracked', 0)
+        }
 
     def continuous_scan(self):
         """Непрерывное сканирование"""
@@ -670,7 +1407,8 @@ class CS2ScannerSimple:
                     first_scan = False
                 else:
                     current_servers = self.scan_all_maps()
-                    stats = self.process_servers(current_servers)
+                    with self.process_lock:
+                        self.process_servers(current_servers)
                     
                     # Дополнительная проверка возвращения серверов
                     current_ids = {server['steamid'] for server in current_servers if server.get('steamid')}
@@ -683,18 +1421,7 @@ class CS2ScannerSimple:
                             logger.warning(f"⚠️ Сервер {self.disappeared_servers[steam_id].get('name', steam_id)} все еще в списке исчезнувших, но найден в текущем сканировании!")
                     
                     logger.info(f"📊 После обработки: исчезнувших {len(still_disappeared)} из {len(self.disappeared_servers)}")
-                    
-                    # Отправляем обновления в браузер
-                    try:
-                        self.broadcast_update_sync({
-                            'type': 'scan_complete',
-                            'stats': stats,
-                            'disappeared_servers': list(self.disappeared_servers.values()),
-                            'game_servers': list(self.game_servers.values())
-                        })
-                        logger.info(f"📤 Отправлено обновление в браузер: {len(self.disappeared_servers)} исчезнувших серверов")
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка отправки в браузер: {e}")
+                    # Обновления в браузер отправляет потребитель события cycle_completed
                 
                 time.sleep(self.scan_interval)
                 
@@ -703,18 +1430,14 @@ class CS2ScannerSimple:
                     if time.time() - self._last_force_send > 10:
                         self._last_force_send = time.time()
                         try:
-                            self.broadcast_update_sync({
-                                'type': 'scan_complete',
-                                'stats': {
-                                    'disappeared_count': len(self.disappeared_servers),
-                                    'returned_count': 0,
-                                    'total_current': len(self.game_servers),
-                                    'total_tracked': len(self.server_history)
-                                },
-                                'disappeared_servers': list(self.disappeared_servers.values()),
-                                'game_servers': list(self.game_servers.values())
-                            })
-                            logger.info(f"📤 Принудительная отправка: {len(self.disappeared_servers)} исчезнувших серверов")
+                            # Клиентам дельта-протокола достаточно номера последовательности
+                            self.broadcast_hub.publish({
+                                'type': 'state_seq',
+                                'seq': self.state_journal.seq
+                            }, coalesce_key='state_seq', protocol='delta')
+                            
+                            self.publish_full_state(self.snapshot_cycle_stats(self.snapshot))
+                            logger.info(f"📤 Принудительная отправка: {len(self.snapshot.disappeared_servers)} исчезнувших серверов")
                         except Exception as e:
                             logger.error(f"❌ Ошибка принудительной отправки: {e}")
                 else:
@@ -739,13 +1462,24 @@ class CS2ScannerSimple:
             self.saved_servers = {}
 
     def save_servers(self):
-        """Сохранение сохраненных серверов в файл"""
-        try:
-            with open('saved_servers.json', 'w') as f:
-                json.dump(self.saved_servers, f, indent=4)
-            logger.info(f"📦 Сохранено {len(self.saved_servers)} сохраненных серверов")
-        except Exception as e:
-            logger.error(f"❌ Ошибка сохранения сохраненных серверов: {e}")
+        """Сохранение сохраненных серверов в файл и публикация снимка
+        
+        Копия берется под self.lock (записи заменяются целиком, поэтому
+        достаточно поверхностной), файл записывается через временный и
+        os.replace - при сбое остается предыдущая версия. save_lock не дает
+        более старой копии из другого потока перезаписать более новую.
+        """
+        with self.save_lock:
+            with self.lock:
+                saved_servers = dict(self.saved_servers)
+                self.publish_snapshot(saved_servers=saved_servers)
+            try:
+                with PERSIST_DURATION.time('saved_servers'), open('saved_servers.json.tmp', 'w') as f:
+                    json.dump(saved_servers, f, indent=4)
+                os.replace('saved_servers.json.tmp', 'saved_servers.json')
+                logger.info(f"📦 Сохранено {len(saved_servers)} сохраненных серверов")
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения сохраненных серверов: {e}")
 
     def load_map_changes_data(self):
         """Загрузка данных о смене карт серверов"""
@@ -764,25 +1498,103 @@ class CS2ScannerSimple:
             logger.info("📊 Не найден файл map_changes_data.json, создание нового...")
             self.server_map_changes = {}
             self.server_map_history = {}
+        
+        self.rebuild_server_modes()
+        self.map_change_ranking.load(self.server_map_changes)
 
     def save_map_changes_data(self):
-        """Сохранение данных о смене карт серверов"""
+        """Сохранение данных о смене карт серверов
+        
+        Вызывается из потока потребителя map_changes - единственного, кто
+        меняет эти словари, поэтому сериализация идет без self.lock.
+        """
         try:
             data = {
                 'changes': self.server_map_changes,
                 'history': self.server_map_history
             }
-            with open('map_changes_data.json', 'w') as f:
+            with PERSIST_DURATION.time('map_changes'), open('map_changes_data.json.tmp', 'w') as f:
                 json.dump(data, f, indent=4)
+            os.replace('map_changes_data.json.tmp', 'map_changes_data.json')
             logger.info(f"📊 Сохранены данные о смене карт для {len(self.server_map_changes)} серверов")
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения данных о смене карт: {e}")
 
-    def track_map_change(self, steam_id, server_name, old_map, new_map):
-        """Отслеживание смены карты сервера"""
+    def handle_map_change_events(self, events):
+        """Потребитель map_changed: учет смен и автосохранение, одна запись файлов на пачку"""
+        auto_saved = 0
+        for event in events:
+            if self.track_map_change(event.steamid, event.name, event.old_map, event.new_map, event.timestamp):
+                auto_saved += 1
+        
+        if auto_saved:
+            self.save_servers()
+        
+        # Режимы серверов могли измениться - обновляем снимок
+        with self.lock:
+            self.publish_snapshot(server_modes=self.server_modes, stats=self.snapshot_stats())
+        self.save_map_changes_data()
+
+    def log_events(self, events):
+        """Потребитель логирования событий сканирования"""
+        for event in events:
+            if event.type == 'map_changed':
+                logger.info(f"🔄 Сервер {event.name} сменил карту: {event.old_map} → {event.new_map}")
+            elif event.type == 'disappeared':
+                logger.info(f"🔴 Сервер {event.name} исчез с карты {event.old_map}")
+            elif event.type == 'returned':
+                logger.info(f"🟢 Сервер {event.name} вернулся на карту {event.new_map}")
+            else:
+                logger.debug(f"🆕 Новый сервер {event.name} на карте {event.new_map}")
+
+    def broadcast_events(self, events):
+        """Потребитель рассылки: состояние уходит клиентам после цикла
+        
+        Несколько циклов в одной пачке объединяются: снимок уже содержит
+        итоговое состояние, счетчики суммируются.
+        """
+        stats = dict(events[-1].data)
+        stats['disappeared_count'] = sum(event.data['disappeared_count'] for event in events)
+        stats['returned_count'] = sum(event.data['returned_count'] for event in events)
+        self.publish_state(stats)
+        logger.info(f"📤 Отправлено обновление в браузер: {len(self.snapshot.disappeared_servers)} исчезнувших серверов")
+
+    def notify_events(self, events):
+        """Потребитель уведомлений: события пачкой одним сообщением клиентам"""
+        if not self.broadcast_hub.has_clients():
+            return
+        self.broadcast_hub.publish({
+            'type': 'server_events',
+            'events': [{
+                'event': event.type,
+                'steamid': event.steamid,
+                'name': event.name,
+                'old_map': event.old_map,
+                'new_map': event.new_map,
+                'timestamp': event.timestamp
+            } for event in events]
+        })
+
+    def track_map_change(self, steam_id, server_name, old_map, new_map, timestamp=None):
+        """Учет смены карты сервера
+        
+        Файлы не записываются - это делает вызывающий один раз на пачку.
+        Возвращает True, если сервер автоматически сохранен.
+        """
         if old_map == new_map:
             return
+        changed_at = datetime.fromtimestamp(timestamp).isoformat() if timestamp else datetime.now().isoformat()
+        
+        # Словари читают поток сканирования и обработчики API - меняем под self.lock
+        with self.lock:
+            self._record_map_change(steam_id, server_name, old_map, new_map, changed_at)
+        self.map_change_ranking.record_change(steam_id, timestamp)
         
+        # Проверяем, нужно ли автоматически сохранить сервер
+        return self.check_auto_save_server(steam_id, server_name, new_map)
+
+    def _record_map_change(self, steam_id, server_name, old_map, new_map, changed_at):
+        """Счетчик, история смен и режим сервера (под self.lock)"""
         # Инициализируем данные для сервера
         if steam_id not in self.server_map_changes:
             self.server_map_changes[steam_id] = {
@@ -797,167 +1609,237 @@ class CS2ScannerSimple:
         
         # Увеличиваем счетчик смен
         self.server_map_changes[steam_id]['changes_count'] += 1
-        self.server_map_changes[steam_id]['last_change'] = datetime.now().isoformat()
+        self.server_map_changes[steam_id]['last_change'] = changed_at
         self.server_map_changes[steam_id]['server_name'] = server_name
         
         # Добавляем в историю
         change_record = {
             'from': old_map,
             'to': new_map,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': changed_at
         }
-        self.server_map_changes[steam_id]['changes_history'].append(change_record)
+        changes_history = self.server_map_changes[steam_id]['changes_history']
+        changes_history.append(change_record)
         
         # Ограничиваем историю последними 10 изменениями
-        if len(self.server_map_changes[steam_id]['changes_history']) > 10:
-            self.server_map_changes[steam_id]['changes_history'] = self.server_map_changes[steam_id]['changes_history'][-10:]
+        if len(changes_history) > 10:
+            del changes_history[0]
         
         # Добавляем в общую историю карт
         self.server_map_history[steam_id].append(new_map)
         if len(self.server_map_history[steam_id]) > 20:  # Ограничиваем историю
-            self.server_map_history[steam_id] = self.server_map_history[steam_id][-20:]
-        
-        logger.info(f"🔄 Сервер {server_name} сменил карту: {old_map} → {new_map} (всего смен: {self.server_map_changes[steam_id]['changes_count']})")
-        
-        # Проверяем, нужно ли автоматически сохранить сервер
-        self.check_auto_save_server(steam_id, server_name)
+            del self.server_map_history[steam_id][0]
         
-        # Сохраняем данные
-        self.save_map_changes_data()
+        # История карт изменилась - пересчитываем режим сервера
+        self.refresh_server_mode(steam_id)
 
-    def check_auto_save_server(self, steam_id, server_name):
-        """Проверка необходимости автоматического сохранения сервера"""
-        if steam_id not in self.server_map_changes:
-            return
+    def check_auto_save_server(self, steam_id, server_name, new_map=None):
+        """Проверка необходимости автоматического сохранения сервера
         
-        changes_count = self.server_map_changes[steam_id]['changes_count']
+        Сервер добавляется только в память; True - вызывающий должен вызвать save_servers().
+        """
+        mode = self.determine_server_mode_from_maps(steam_id)
+        fired_rules = self.auto_save_rules.evaluate(steam_id, server_name, new_map, mode)
+        if not fired_rules:
+            return False
+        
+        rule = fired_rules[0]
         current_time = time.time()
         
         # Проверяем кулдаун (не спамить автосохранением)
-        if steam_id in self.auto_save_cooldown:
-            if current_time - self.auto_save_cooldown[steam_id] < 3600:  # 1 час кулдауна
-                return
-        
-        # Если сервер сменил карту достаточно раз, сохраняем его
-        if changes_count >= self.auto_save_threshold:
-            # Получаем информацию о сервере из истории
-            if steam_id in self.server_history:
-                server_info = self.server_history[steam_id]
-                addr = server_info.get('addr', '')
-                
-                if addr and ':' in addr:
-                    ip, port = addr.split(':', 1)
-                    
-                    # Проверяем, не сохранен ли уже сервер
-                    server_key = f"{ip}:{port}"
-                    if server_key not in self.saved_servers:
-                        # Автоматически сохраняем сервер
-                        mode = self.get_server_mode(ip, port)
-                        description = f"Автосохранен после {changes_count} смен карт"
-                        
-                        self.add_saved_server(ip, port, server_name, mode, description)
-                        logger.info(f"💾 Автоматически сохранен сервер {server_name} после {changes_count} смен карт")
-                        
-                        # Устанавливаем кулдаун
-                        self.auto_save_cooldown[steam_id] = current_time
-                    else:
-                        logger.info(f"ℹ️ Сервер {server_name} уже сохранен, пропускаем автосохранение")
+        if current_time - self.auto_save_cooldown.get(steam_id, 0) < 3600:  # 1 час кулдауна
+            for fired_rule in fired_rules:
+                self.auto_save_rules.record_suppressed(fired_rule, 'cooldown')
+            return False
+        
+        # Получаем информацию о сервере из истории
+        addr = self.server_history.get(steam_id, {}).get('addr', '')
+        if not addr or ':' not in addr:
+            for fired_rule in fired_rules:
+                self.auto_save_rules.record_suppressed(fired_rule, 'no_address')
+            return False
+        
+        ip, port = addr.split(':', 1)
+        window = f" за {rule.window:g} сек" if rule.window else ""
+        description = f"Автосохранен правилом '{rule.rule_id}': {rule.changes} смен карт{window}"
+        
+        # Проверка и добавление под блокировкой: HTTP и WebSocket меняют словарь из других потоков
+        with self.lock:
+            already_saved = addr in self.saved_servers
+            if not already_saved:
+                self._put_saved_server(ip, port, server_name, self.get_server_mode(ip, port), description,
+                                       update=False)
+        
+        if already_saved:
+            for fired_rule in fired_rules:
+                self.auto_save_rules.record_suppressed(fired_rule, 'already_saved')
+            logger.debug(f"ℹ️ Сервер {server_name} уже сохранен, пропускаем автосохранение")
+            return False
+        
+        logger.info(f"💾 Автоматически сохранен сервер {server_name} (правило '{rule.rule_id}')")
+        
+        self.auto_save_rules.record_saved(rule, steam_id)
+        for fired_rule in fired_rules[1:]:
+            self.auto_save_rules.record_suppressed(fired_rule, 'already_saved')
+        
+        # Устанавливаем кулдаун
+        self.auto_save_cooldown[steam_id] = current_time
+        return True
 
     def get_server_map_stats(self, steam_id):
-        """Получение статистики смен карт для сервера"""
-        if steam_id in self.server_map_changes:
-            return self.server_map_changes[steam_id]
-        return None
-
-    def get_top_changing_servers(self, limit=10):
-        """Получение топ серверов по количеству смен карт"""
-        sorted_servers = sorted(
-            self.server_map_changes.items(),
-            key=lambda x: x[1]['changes_count'],
-            reverse=True
-        )
-        return sorted_servers[:limit]
+        """Получение статистики смен карт для сервера (копия, снятая под self.lock)"""
+        with self.lock:
+            stats = self.server_map_changes.get(steam_id)
+            if stats is None:
+                return None
+            return {**stats, 'changes_history': list(stats['changes_history'])}
+
+    def get_top_changing_servers(self, limit=10, window=None):
+        """Получение топ серверов по количеству смен карт
+        
+        window - окно ('10m', '1h', '24h') или None для подсчета за все время
+        """
+        top_servers = []
+        for steam_id, count in self.map_change_ranking.top(limit, window):
+            stats = self.get_server_map_stats(steam_id) or {}
+            if window and window != 'all':
+                stats = {**stats, 'window': window, 'window_changes': count}
+            top_servers.append((steam_id, stats))
+        return top_servers
 
     def get_server_mode(self, ip, port):
         """Получение режима сервера по IP и порту"""
-        server_key = f"{ip}:{port}"
-        if server_key in self.saved_servers:
-            return self.saved_servers[server_key].get('mode', 'unknown')
-        return 'unknown'
+        server = self.saved_servers.get(f"{ip}:{port}")
+        return server.get('mode', 'unknown') if server else 'unknown'
     
     def determine_server_mode_from_maps(self, steam_id):
         """Определение режима сервера на основе карт, которые он посещал"""
-        if steam_id not in self.server_map_history:
-            return 'unknown'
-        
-        maps_visited = set(self.server_map_history[steam_id])
-        
-        # Определяем режим на основе карт
-        premier_maps = {'de_ancient', 'de_dust2', 'de_inferno', 'de_mirage', 'de_nuke', 
-                       'de_overpass', 'de_train', 'de_vertigo', 'de_anubis', 'de_grail', 'de_jura'}
-        wingman_maps = {'de_brewery', 'de_dogtown'}
-        legacy_maps = {'de_cache', 'de_dust', 'de_aztec', 'de_italy', 'de_cobblestone', 'de_office'}
-        
-        # Если сервер посещал только Wingman карты
-        if maps_visited.issubset(wingman_maps) and len(maps_visited) > 0:
-            return 'Wingman'
+        return self.server_modes.get(steam_id, 'unknown')
+
+    def refresh_server_mode(self, steam_id):
+        """Пересчет режима сервера и счетчиков режимов после смены истории карт"""
+        new_mode = classify_maps(self.server_map_history.get(steam_id, ()))
+        old_mode = self.server_modes.get(steam_id)
         
-        # Если сервер посещал Premier карты
-        if maps_visited.intersection(premier_maps):
-            if maps_visited.intersection(wingman_maps):
-                return 'Mixed (Premier + Wingman)'
-            else:
-                return 'Premier/Competitive'
+        if old_mode == new_mode:
+            return new_mode
         
-        # Если сервер посещал только Legacy карты
-        if maps_visited.issubset(legacy_maps) and len(maps_visited) > 0:
-            return 'Legacy'
+        if old_mode is not None:
+            self.mode_counts[old_mode] -= 1
+            if not self.mode_counts[old_mode]:
+                del self.mode_counts[old_mode]
         
-        # Если смешанные карты
-        if len(maps_visited) > 0:
-            return 'Mixed'
+        if new_mode == 'unknown':
+            self.server_modes.pop(steam_id, None)
+        else:
+            self.server_modes[steam_id] = new_mode
+            self.mode_counts[new_mode] = self.mode_counts.get(new_mode, 0) + 1
         
-        return 'unknown'
+        return new_mode
+
+    def rebuild_server_modes(self):
+        """Полный пересчет кэша режимов (после загрузки данных)"""
+        self.server_modes = {}
+        self.mode_counts = {}
+        for steam_id in self.server_map_history:
+            self.refresh_server_mode(steam_id)
+
+    def get_mode_counts(self):
+        """Количество серверов в каждом режиме (вызывается под self.lock)"""
+        return dict(self.mode_counts)
 
     def add_saved_server(self, ip, port, name, mode, description=""):
         """Добавление сохраненного сервера"""
-        server_key = f"{ip}:{port}"
-        self.saved_servers[server_key] = {
-            'ip': ip,
-            'port': port,
-            'name': name,
-            'mode': mode,
-            'description': description,
-            'added_at': datetime.now().isoformat()
-        }
+        with self.lock:
+            self._put_saved_server(ip, port, name, mode, description, update=False)
         self.save_servers()
         logger.info(f"📦 Добавлен сохраненный сервер: {name} ({ip}:{port})")
 
     def update_saved_server(self, ip, port, name, mode, description=""):
         """Обновление сохраненного сервера"""
         server_key = f"{ip}:{port}"
-        if server_key in self.saved_servers:
-            self.saved_servers[server_key].update({
+        with self.lock:
+            if server_key not in self.saved_servers:
+                return False
+            self._put_saved_server(ip, port, name, mode, description)
+        self.save_servers()
+        logger.info(f"📦 Обновлен сохраненный сервер: {name} ({ip}:{port})")
+        return True
+
+    def _put_saved_server(self, ip, port, name, mode, description="", update=True):
+        """Запись сервера в память без сохранения в файл (под self.lock); возвращает 'added' или 'updated'"""
+        server_key = f"{ip}:{port}"
+        if update and server_key in self.saved_servers:
+            # Запись заменяется целиком: старая может входить в опубликованный снимок
+            self.saved_servers[server_key] = {
+                **self.saved_servers[server_key],
                 'name': name,
                 'mode': mode,
                 'description': description,
                 'updated_at': datetime.now().isoformat()
-            })
+            }
+            return 'updated'
+        
+        self.saved_servers[server_key] = {
+            'ip': ip,
+            'port': port,
+            'name': name,
+            'mode': mode,
+            'description': description,
+            'added_at': datetime.now().isoformat()
+        }
+        return 'added'
+
+    def import_saved_servers(self, records):
+        """Массовый импорт сохраненных серверов одной записью в файл
+        
+        records - итерируемые словари (из CSV/NDJSON или WebSocket). Записи
+        проверяются и дедуплицируются за один проход (последняя побеждает).
+        """
+        stats = {'received': 0, 'added': 0, 'updated': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+        unique = {}
+        
+        for index, record in enumerate(records, 1):
+            stats['received'] += 1
+            server = validate_record(record)
+            if server is None:
+                stats['invalid'] += 1
+                if len(stats['errors']) < 20:
+                    stats['errors'].append(f"Запись {index}: нужны ip, port (1-65535), name и mode")
+                continue
+            
+            server_key = f"{server['ip']}:{server['port']}"
+            if server_key in unique:
+                stats['duplicates'] += 1
+            unique[server_key] = server
+        
+        # Слияние под блокировкой: автосохранение меняет тот же словарь из потока шины событий
+        with self.lock:
+            for server in unique.values():
+                result = self._put_saved_server(**server)
+                stats[result] += 1
+        
+        if unique:
             self.save_servers()
-            logger.info(f"📦 Обновлен сохраненный сервер: {name} ({ip}:{port})")
-            return True
-        return False
+        
+        logger.info(f"📦 Импорт серверов: добавлено {stats['added']}, обновлено {stats['updated']}, "
+                    f"дубликатов {stats['duplicates']}, ошибок {stats['invalid']}")
+        return stats
+
+    def export_saved_servers(self, format_name='ndjson'):
+        """Потоковый экспорт сохраненных серверов (генератор строк)"""
+        return iter_export(list(self.snapshot.saved_servers.values()), format_name)
 
     def delete_saved_server(self, ip, port):
         """Удаление сохраненного сервера"""
         server_key = f"{ip}:{port}"
-        if server_key in self.saved_servers:
-            server_name = self.saved_servers[server_key]['name']
-            del self.saved_servers[server_key]
-            self.save_servers()
-            logger.info(f"📦 Удален сохраненный сервер: {server_name} ({ip}:{port})")
-            return True
-        return False
+        with self.lock:
+            server = self.saved_servers.pop(server_key, None)
+        if server is None:
+            return False
+        self.save_servers()
+        logger.info(f"📦 Удален сохраненный сервер: {server['name']} ({ip}:{port})")
+        return True
 
     def authenticate_admin(self, password):
         """Аутентификация администратора"""
@@ -971,9 +1853,11 @@ class CS2ScannerSimple:
 
     def force_cleanup_disappeared_servers(self):
         """Принудительная очистка списка исчезнувших серверов"""
-        with self.lock:
+        with self.process_lock, self.lock:
             old_count = len(self.disappeared_servers)
             self.disappeared_servers.clear()
+            self.server_view.replace('disappeared', self.disappeared_servers)
+            self.publish_snapshot(disappeared_servers=self.disappeared_servers)
             logger.info(f"🧹 Принудительная очистка: удалено {old_count} серверов из списка исчезнувших")
             return old_count
 
@@ -986,30 +1870,23 @@ class CS2ScannerSimple:
     def stop_scanning(self):
         """Остановка сканирования"""
         self.is_scanning = False
+        if not self.events.drain():
+            logger.warning("⚠️ Не все события сканирования обработаны до остановки")
+        self.population_history.save()
         logger.info("🛑 Сканирование остановлено")
     
     def run_single_scan(self):
-        """Выполнение одного сканирования"""
+        """Выполнение одного сканирования по запросу пользователя: число серверов, None при ошибке"""
         try:
             logger.info("🔍 Выполнение сканирования...")
-            current_servers = self.scan_all_maps()
-            stats = self.process_servers(current_servers)
-            
-            # Отправляем результаты через WebSocket
-            import asyncio
-            try:
-                loop = asyncio.get_event_loop()
-                loop.create_task(self.broadcast_update({
-                    'type': 'scan_complete',
-                    'stats': stats,
-                    'disappeared_servers': list(self.disappeared_servers.values()),
-                    'game_servers': list(self.game_servers.values())
-                }))
-                logger.info("📤 Результаты сканирования отправлены в веб-интерфейс")
-            except (RuntimeError, Exception) as e:
-                logger.error(f"❌ Ошибка отправки результатов: {e}")
+            current_servers = self.scan_all_maps('interactive')
+            with self.process_lock:
+                self.process_servers(current_servers)
+            # Результаты в веб-интерфейс отправляет потребитель события cycle_completed
+            return len(current_servers)
         except Exception as e:
             logger.error(f"❌ Ошибка выполнения сканирования: {e}")
+            return None
 
 async def main():
     parser = argparse.ArgumentParser(description='CS2 Server Scanner - Упрощенная версия')
@@ -1026,11 +1903,11 @@ async def main():
     try:
         import requests
         import websocket
-        import websockets
+        from async_http import AsyncHTTPServer
         print("✅ Зависимости установлены")
     except ImportError as e:
         print(f"❌ Отсутствуют зависимости: {e}")
-        print("Установите: pip install requests websocket-client websockets")
+        print("Установите: pip install requests websocket-client aiohttp")
         return
 
     # Создаем сканер
@@ -1043,14 +1920,16 @@ async def main():
 
     try:
         # Запускаем WebSocket сервер с обработкой ошибок
-        async with websockets.serve(scanner.handle_websocket, "0.0.0.0", args.port, ping_interval=None, ping_timeout=None):
-            logger.info(f"🔌 WebSocket сервер запущен на порту {args.port}")
-            
-            # Запускаем сканирование
-            scanner.start_scanning()
-            
-            # Держим программу запущенной
-            await asyncio.Future()  # Бесконечное ожидание
+        server = AsyncHTTPServer(None, websocket_handler=scanner.handle_websocket,
+                                 websocket_kwargs={**keepalive_kwargs(), **serve_kwargs()})
+        await server.start("0.0.0.0", args.port)
+        logger.info(f"🔌 WebSocket сервер запущен на порту {args.port}")
+        
+        # Запускаем сканирование
+        scanner.start_scanning()
+        
+        # Держим программу запущенной
+        await server.serve_forever()
             
     except KeyboardInterrupt:
         print("\n🛑 Остановка сканера...")
@@ -1060,5 +1939,4 @@ async def main():
         scanner.stop_scanning()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main()) 
\ No newline at end of file
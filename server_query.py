@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Фильтрация, сортировка и постраничная выдача серверов для /api/servers
+Сканер при публикации снимка обновляет вторичные индексы (по статусу, карте,
+режиму и региону, в каждом порядке сортировки) по изменениям цикла; запрос
+берет самый узкий список, сужает его по диапазону игроков и позиции курсора
+бинарным поиском и читает одну страницу
+"""
+
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
+
+from server_view import last_seen
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+# Поле записи для каждого индексируемого фильтра
+FACETS = {'type': 'status', 'map': 'map', 'mode': 'mode', 'region': 'region'}
+
+def players(record):
+    return record.get('players') or 0
+
+def identity(record):
+    return str(record.get('steamid', '')), str(record.get('status', ''))
+
+# Ключи сортировки: уникальны (steamid и статус в конце), чтобы курсор однозначно задавал позицию
+SORT_KEYS = {
+    'last_seen': lambda record: (-last_seen(record), *identity(record)),
+    'players': lambda record: (-players(record), -last_seen(record), *identity(record)),
+    'name': lambda record: (str(record.get('name') or '').lower(), *identity(record))
+}
+
+def facet_value(record, field):
+    return str(record.get(field) if record.get(field) is not None else 'unknown')
+
+# Доля изменившихся записей, начиная с которой индекс дешевле построить заново, чем вставлять по одной
+REBUILD_FRACTION = 0.05
+
+class QueryIndex:
+    """Вторичные индексы /api/servers, обновляемые по изменениям цикла
+
+    Каждый список (все серверы или одно значение фильтра) хранится в каждом
+    порядке сортировки как отсортированные ключи и записи: измененная запись
+    удаляется и вставляется бинарным поиском, остальные списки не трогаются.
+    freeze() копирует в кортежи только измененные списки. Изменяется только
+    под блокировкой сканера (вместе с server_view).
+    """
+
+    def __init__(self):
+        self.records = {}  # (статус, steamid) → запись в индексе
+        self.lists = {}  # None (все серверы) или (фильтр, значение) → сортировка → (ключи, записи)
+        self.frozen = {}  # Те же имена → сортировка → кортеж записей
+        self.dirty = set()
+        self.index = None
+
+    @staticmethod
+    def groups(record):
+        return [None] + [(facet, facet_value(record, field)) for facet, field in FACETS.items()]
+
+    def update(self, members, changes):
+        """Применение изменений server_view и новый индекс для снимка
+
+        members - статус → steamid → запись (ServerView.members); changes -
+        измененные (статус, steamid) с прошлого вызова (ServerView.drain_changes).
+        Без изменений возвращается прежний индекс.
+        """
+        if len(changes) > max(len(self.records) * REBUILD_FRACTION, 1):
+            self.rebuild(members)
+        else:
+            for status, steamid in changes:
+                old = self.records.pop((status, steamid), None)
+                new = members[status].get(steamid)
+                if old is not None:
+                    self.remove(old)
+                if new is not None:
+                    self.insert(new)
+                    self.records[(status, steamid)] = new
+        return self.freeze()
+
+    def rebuild(self, members):
+        """Построение всех списков заново: одна сортировка на порядок вместо вставок по одной"""
+        self.records = {(status, steamid): record for status, records in members.items()
+                        for steamid, record in records.items()}
+        # Списки фильтров записи вычисляются один раз и сортируются вместе с записью
+        lists = {}
+        entries = []
+        for record in self.records.values():
+            groups = []
+            for name in self.groups(record):
+                group = lists.get(name)
+                if group is None:
+                    group = lists[name] = {sort: ([], []) for sort in SORT_KEYS}
+                groups.append(group)
+            entries.append((record, groups))
+
+        for sort, key in SORT_KEYS.items():
+            for record, groups in sorted(entries, key=lambda entry: key(entry[0])):
+                record_key = key(record)
+                for group in groups:
+                    group[sort][0].append(record_key)
+                    group[sort][1].append(record)
+
+        self.dirty.update(self.lists, lists)
+        self.lists = lists
+
+    def insert(self, record):
+        for name in self.groups(record):
+            group = self.lists.get(name)
+            if group is None:
+                group = self.lists[name] = {sort: ([], []) for sort in SORT_KEYS}
+            for sort, key in SORT_KEYS.items():
+                keys, records = group[sort]
+                record_key = key(record)
+                position = bisect_right(keys, record_key)
+                keys.insert(position, record_key)
+                records.insert(position, record)
+            self.dirty.add(name)
+
+    def remove(self, record):
+        for name in self.groups(record):
+            group = self.lists[name]
+            for sort, key in SORT_KEYS.items():
+                keys, records = group[sort]
+                position = bisect_left(keys, key(record))  # Ключи уникальны: позиция именно этой записи
+                del keys[position]
+                del records[position]
+            if name is not None and not group['last_seen'][1]:
+                del self.lists[name]
+            self.dirty.add(name)
+
+    def freeze(self):
+        """Неизменяемый индекс: orders - сортировка → записи; facets - (фильтр, значение) → сортировка → записи"""
+        if self.index is not None and not self.dirty:
+            return self.index
+        for name in self.dirty:
+            group = self.lists.get(name)
+            if group is None:
+                self.frozen.pop(name, None)
+            else:
+                self.frozen[name] = MappingProxyType({sort: tuple(records) for sort, (_, records) in group.items()})
+        self.dirty.clear()
+
+        empty = MappingProxyType({sort: () for sort in SORT_KEYS})
+        self.index = MappingProxyType({
+            'orders': self.frozen.get(None, empty),
+            'facets': MappingProxyType({name: group for name, group in self.frozen.items() if name is not None})
+        })
+        return self.index
+
+def build_query_index(records):
+    """Индекс для набора записей целиком (без последующих обновлений)"""
+    query_index = QueryIndex()
+    query_index.rebuild({'all': {index: record for index, record in enumerate(records)}})
+    return query_index.freeze()
+
+def encode_cursor(sort, key):
+    raw = json.dumps([sort, list(key)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """Ключ последней выданной записи; ValueError для чужого или поврежденного курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, key = json.loads(raw)
+    except (binascii.Error, TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Неверный курсор")
+    if cursor_sort != sort or not isinstance(key, list):
+        raise ValueError("Курсор относится к другой сортировке")
+    return key
+
+class ServerQuery:
+    """Параметры запроса /api/servers
+
+    type, map, mode, region - индексируемые фильтры (точное совпадение);
+    players_min, players_max - диапазон игроков; q - подстрока названия;
+    sort - last_seen (новые первыми), players (больше первыми) или name;
+    limit и cursor - размер страницы и продолжение после next_cursor.
+    """
+
+    def __init__(self, request):
+        self.facets = {}
+        for facet in FACETS:
+            value = request.param(facet)
+            if value and not (facet == 'type' and value == 'all'):
+                self.facets[facet] = value
+
+        self.players_min = self.int_param(request, 'players_min')
+        self.players_max = self.int_param(request, 'players_max')
+        self.search = (request.param('q') or '').strip().lower()
+
+        self.sort = request.param('sort', 'last_seen')
+        if self.sort not in SORT_KEYS:
+            raise ValueError(f"Неизвестная сортировка: {self.sort} (доступны: {', '.join(SORT_KEYS)})")
+
+        limit = self.int_param(request, 'limit')
+        self.limit = DEFAULT_PAGE_SIZE if limit is None else max(1, min(limit, MAX_PAGE_SIZE))
+        cursor = request.param('cursor')
+        self.after = decode_cursor(cursor, self.sort) if cursor else None
+
+    @staticmethod
+    def int_param(request, name):
+        value = request.param(name)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Параметр {name} должен быть целым числом")
+
+    def candidates(self, index, sort):
+        """Самый короткий подходящий список индекса в порядке sort"""
+        if not self.facets:
+            return index['orders'][sort]
+        groups = [index['facets'].get((facet, value)) for facet, value in self.facets.items()]
+        if any(group is None for group in groups):
+            return ()
+        return min((group[sort] for group in groups), key=len)
+
+    def players_range(self, ordered):
+        """Границы записей с числом игроков в [players_min, players_max] в порядке players (бинарный поиск)"""
+        key = SORT_KEYS['players']
+        # Ключ начинается с -players: записи диапазона идут подряд
+        low = 0 if self.players_max is None else bisect_left(ordered, (-self.players_max,), key=key)
+        high = len(ordered) if self.players_min is None else bisect_left(ordered, (1 - self.players_min,), key=key)
+        return low, max(low, high)
+
+    def matches(self, record):
+        for facet, value in self.facets.items():
+            if facet_value(record, FACETS[facet]) != value:
+                return False
+        count = players(record)
+        if self.players_min is not None and count < self.players_min:
+            return False
+        if self.players_max is not None and count > self.players_max:
+            return False
+        if self.search and self.search not in str(record.get('name') or '').lower():
+            return False
+        return True
+
+    def run(self, index):
+        """Страница записей, число кандидатов в индексе и курсор следующей страницы"""
+        candidates = self.candidates(index, self.sort)
+        first, end = 0, len(candidates)
+        if self.players_min is not None or self.players_max is not None:
+            if self.sort == 'players':
+                first, end = self.players_range(candidates)
+            else:
+                by_players = self.candidates(index, 'players')
+                low, high = self.players_range(by_players)
+                if (high - low) * 4 < len(candidates):
+                    # Диапазон игроков заметно уже списка: его записи упорядочиваются по сортировке
+                    # запроса, иначе диапазон проверяется при чтении страницы
+                    candidates = sorted(by_players[low:high], key=SORT_KEYS[self.sort])
+                    end = len(candidates)
+
+        key = SORT_KEYS[self.sort]
+        start = first
+        if self.after is not None:
+            try:
+                start = bisect_right(candidates, self.after, start, end, key=lambda record: list(key(record)))
+            except TypeError:
+                raise ValueError("Неверный курсор")
+
+        page = []
+        position = start
+        while position < end and len(page) < self.limit:
+            record = candidates[position]
+            position += 1
+            if self.matches(record):
+                page.append(record)
+
+        # Курсор - ключ последней просмотренной записи: следующая страница не повторяет проверенные
+        next_cursor = None
+        if position < end and page:
+            next_cursor = encode_cursor(self.sort, key(candidates[position - 1]))
+        return page, end - first, next_cursor
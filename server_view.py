@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Представление серверов по статусам
+Сканер поддерживает принадлежность серверов к статусам (игровые, пустые,
+исчезнувшие) и порядок по last_seen во время сравнения циклов; HTTP и
+WebSocket получают готовые отсортированные списки из снимка состояния
+"""
+
+import heapq
+from collections import OrderedDict
+from types import MappingProxyType
+
+STATUSES = ('game', 'empty', 'disappeared')
+
+def last_seen(record):
+    return record.get('last_seen') or 0
+
+class ServerView:
+    """Серверы каждого статуса в порядке last_seen
+
+    Записи хранятся с полем status (копия исходной записи делается один раз,
+    пока сканер не заменит запись). last_seen записи - время, когда сервер
+    замечен в текущем состоянии: сканер заменяет запись только при изменении
+    отслеживаемых полей, поэтому порядок - недавно изменившиеся первыми. Новые записи обычно свежее уже
+    имеющихся и добавляются в конец; если нет - статус пересортировывается
+    при следующем freeze(). Изменяется только под блокировкой сканера.
+    """
+
+    def __init__(self):
+        self.members = {status: OrderedDict() for status in STATUSES}  # steamid → запись со status
+        self.sources = {status: {} for status in STATUSES}  # steamid → исходная запись сканера
+        self.unsorted = set()
+        self.changes = set()  # (статус, steamid), измененные с прошлого drain_changes()
+
+    def put(self, status, steamid, record):
+        sources = self.sources[status]
+        if sources.get(steamid) is record:
+            return
+        members = self.members[status]
+        tail = members[next(reversed(members))] if members else None
+        members[steamid] = {**record, 'status': status}
+        members.move_to_end(steamid)
+        sources[steamid] = record
+        self.changes.add((status, steamid))
+        if tail is not None and last_seen(tail) > last_seen(record):
+            self.unsorted.add(status)
+
+    def remove(self, status, steamid):
+        if self.members[status].pop(steamid, None) is not None:
+            self.changes.add((status, steamid))
+        self.sources[status].pop(steamid, None)
+
+    def drain_changes(self):
+        """Измененные (статус, steamid) с прошлого вызова - для обновления индексов запросов"""
+        changes, self.changes = self.changes, set()
+        return changes
+
+    def replace(self, status, records):
+        """Полная замена состава статуса (steamid → запись)"""
+        for steamid in [steamid for steamid in self.members[status] if steamid not in records]:
+            self.remove(status, steamid)
+        for steamid, record in records.items():
+            self.put(status, steamid, record)
+
+    def status_of(self, steamid):
+        return [status for status in STATUSES if steamid in self.members[status]]
+
+    def freeze(self):
+        """Неизменяемый индекс для снимка: статус → записи, новые первыми; 'all' - все статусы"""
+        for status in self.unsorted:
+            self.members[status] = OrderedDict(sorted(self.members[status].items(),
+                                                      key=lambda item: last_seen(item[1])))
+        self.unsorted.clear()
+
+        index = {status: tuple(reversed(self.members[status].values())) for status in STATUSES}
+        index['all'] = tuple(heapq.merge(*(index[status] for status in STATUSES), key=last_seen, reverse=True))
+        return MappingProxyType(index)
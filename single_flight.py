@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Объединение одинаковых запросов сканирования (single-flight) с кэшем на TTL
+Одновременные запросы с одним ключом получают один и тот же результат
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+MAX_CACHED_KEYS = 512  # Больше - вытесняются давно не запрошенные результаты (LRU)
+
+class SingleFlight:
+    """Выполнение функций по ключу не более одного раза одновременно
+
+    submit() возвращает (concurrent.futures.Future, источник): потоки ждут
+    future.result(), корутины - await asyncio.wrap_future(future).
+    Источник: 'started', 'joined' или 'cache'. Успешный результат
+    кэшируется на ttl секунд; None и исключения не кэшируются - следующий
+    запрос запускает функцию заново.
+    """
+
+    def __init__(self, max_workers=2, name='on-demand', max_entries=MAX_CACHED_KEYS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.inflight = {}  # ключ → Future
+        self.cache = OrderedDict()  # ключ → (время истечения, результат)
+        self.executed = 0
+        self.joined = 0
+        self.cache_hits = 0
+
+    def submit(self, key, function, ttl=0):
+        """Результат из кэша, текущий запрос с тем же ключом или новый запуск"""
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached and cached[0] <= time.monotonic():
+                del self.cache[key]
+            elif cached:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                future = Future()
+                future.set_result(cached[1])
+                return future, 'cache'
+
+            future = self.inflight.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, 'joined'
+
+            self.executed += 1
+            future = self.executor.submit(function)
+            self.inflight[key] = future
+
+        future.add_done_callback(lambda done: self._finish(key, done, ttl))
+        return future, 'started'
+
+    def _finish(self, key, future, ttl):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            if (ttl > 0 and not future.cancelled() and future.exception() is None
+                    and future.result() is not None):
+                self._store(key, future.result(), ttl)
+
+    def put(self, key, result, ttl):
+        """Результат, полученный вне submit() (например, фоновым обходом)"""
+        if ttl > 0 and result is not None:
+            with self.lock:
+                self._store(key, result, ttl)
+
+    def _store(self, key, result, ttl):
+        """Запись в кэш под self.lock; сверх max_entries вытесняются давно не запрошенные"""
+        self.cache[key] = (time.monotonic() + ttl, result)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def is_running(self, key):
+        with self.lock:
+            return key in self.inflight
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'inflight': list(self.inflight),
+                'cached': len(self.cache),
+                'executed': self.executed,
+                'joined': self.joined,
+                'cache_hits': self.cache_hits
+            }
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Журнал изменений состояния сканера для дельта-обновлений WebSocket
+Каждый цикл с изменениями получает номер последовательности (seq)
+"""
+
+import threading
+from collections import deque
+
+STATE_COLLECTIONS = ('game_servers', 'disappeared_servers')
+
+# Поля, которые меняются без изменения состояния сервера (время обнаружения)
+VOLATILE_FIELDS = frozenset(('last_seen',))
+
+def same_record(old, new, volatile=VOLATILE_FIELDS):
+    """Равенство записей без учета изменчивых полей"""
+    if old is new or old == new:
+        return True
+    if old is None or new is None:
+        return False
+    return ({key: value for key, value in old.items() if key not in volatile}
+            == {key: value for key, value in new.items() if key not in volatile})
+
+class StateJournal:
+    """Последние дельты состояния и снимок для сравнения
+
+    Дельта коллекции: {'upsert': [записи], 'remove': [steamid]}.
+    Клиент применяет дельту, если ее base_seq равен его seq, иначе
+    запрашивает пересинхронизацию. Записи сравниваются по значению без
+    VOLATILE_FIELDS: цикл без изменений не дает дельты.
+    """
+
+    def __init__(self, collections=STATE_COLLECTIONS, max_deltas=120):
+        self.collections = collections
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.snapshot = {name: {} for name in collections}
+        self.deltas = deque(maxlen=max_deltas)
+
+    def commit(self, state):
+        """Фиксация нового состояния
+
+        Возвращает (дельта, изменения) или (None, {}) без изменений.
+        Изменения: коллекция → список (steamid, старая запись, новая запись)
+        для маршрутизации по подпискам.
+        """
+        changes = {}
+        delta_changes = {}
+        for name in self.collections:
+            old = self.snapshot[name]
+            new = state[name]
+            pairs = [(key, old.get(key), record) for key, record in new.items() if not same_record(old.get(key), record)]
+            pairs.extend((key, record, None) for key, record in old.items() if key not in new)
+            if pairs:
+                changes[name] = pairs
+                delta_changes[name] = {
+                    'upsert': [record for _, _, record in pairs if record is not None],
+                    'remove': [key for key, _, record in pairs if record is None]
+                }
+
+        if not changes:
+            return None, {}
+
+        with self.lock:
+            self.seq += 1
+            delta = {'seq': self.seq, 'base_seq': self.seq - 1, **delta_changes}
+            self.deltas.append(delta)
+            self.snapshot = {name: dict(state[name]) for name in self.collections}
+        return delta, changes
+
+    def since(self, seq):
+        """Объединенная дельта от seq до текущего состояния или None, если история утеряна"""
+        with self.lock:
+            if seq == self.seq:
+                return {'seq': self.seq, 'base_seq': seq}
+            if seq > self.seq or not self.deltas or seq < self.deltas[0]['base_seq']:
+                return None
+
+            upserts = {name: {} for name in self.collections}
+            removes = {name: set() for name in self.collections}
+            for delta in self.deltas:
+                if delta['seq'] <= seq:
+                    continue
+                for name in self.collections:
+                    change = delta.get(name)
+                    if not change:
+                        continue
+                    for record in change['upsert']:
+                        key = record.get('steamid')
+                        upserts[name][key] = record
+                        removes[name].discard(key)
+                    for key in change['remove']:
+                        upserts[name].pop(key, None)
+                        removes[name].add(key)
+
+            merged = {'seq': self.seq, 'base_seq': seq}
+            for name in self.collections:
+                if upserts[name] or removes[name]:
+                    merged[name] = {'upsert': list(upserts[name].values()), 'remove': list(removes[name])}
+            return merged
+
+    def full(self):
+        """Полный снимок последнего зафиксированного состояния"""
+        with self.lock:
+            return {'seq': self.seq, **{name: list(records.values()) for name, records in self.snapshot.items()}}
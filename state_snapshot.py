@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Неизменяемые версионированные снимки состояния сканера
+Сканер собирает новый снимок в конце цикла и заменяет ссылку целиком,
+читатели (WebSocket, HTTP, экспорт) работают со снимком без блокировок
+"""
+
+import threading
+import time
+from types import MappingProxyType
+
+# Части снимка: коллекции записей (ключ → запись) и производные данные;
+# server_index - статус → записи, упорядоченные по last_seen (server_view.py);
+# maps - каталог карт и выбранные для сканирования карты
+SNAPSHOT_PARTS = ('game_servers', 'disappeared_servers', 'empty_servers', 'saved_servers',
+                  'server_modes', 'addresses', 'stats', 'server_index', 'server_query', 'maps')
+
+class StateSnapshot:
+    """Снимок состояния с номером версии
+
+    Коллекции доступны только для чтения (MappingProxyType). Записи внутри
+    общие с сканером, поэтому сканер никогда не изменяет записи на месте -
+    только заменяет их новыми словарями. part_versions - версия последнего
+    изменения каждой части: ответ, читающий только часть снимка, не
+    устаревает от изменений других частей.
+    """
+
+    __slots__ = ('version', 'created_at', 'part_versions', *SNAPSHOT_PARTS)
+
+    def __init__(self, version=0, part_versions=None, **parts):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'created_at', time.time())
+        object.__setattr__(self, 'part_versions', MappingProxyType(dict(part_versions or {})))
+        for name in SNAPSHOT_PARTS:
+            value = parts.get(name)
+            if not isinstance(value, MappingProxyType):
+                value = MappingProxyType(dict(value or {}))  # Копия: сканер продолжает менять свой словарь
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Снимок состояния неизменяем")
+
+    def evolve(self, **parts):
+        """Новый снимок с замененными частями; без изменений возвращается этот же снимок"""
+        changed = {name: value for name, value in parts.items() if getattr(self, name) != value}
+        if not changed:
+            return self
+        current = {name: getattr(self, name) for name in SNAPSHOT_PARTS}
+        part_versions = {**self.part_versions, **dict.fromkeys(changed, self.version + 1)}
+        return StateSnapshot(self.version + 1, part_versions, **{**current, **changed})
+
+    def version_of(self, *parts):
+        """Версия последнего изменения частей parts (0 - не менялись с начала работы)"""
+        return max((self.part_versions.get(name, 0) for name in parts), default=0)
+
+    def etag(self):
+        return f'"v{self.version}"'
+
+    def summary(self):
+        return {
+            'version': self.version,
+            'created_at': self.created_at,
+            'total_game': len(self.game_servers),
+            'total_disappeared': len(self.disappeared_servers),
+            'total_empty': len(self.empty_servers),
+            'total_saved': len(self.saved_servers),
+            **self.stats
+        }
+
+class SnapshotPublisher:
+    """Публикация снимков атомарной заменой ссылки
+
+    Писатели сериализуются блокировкой, читатели берут current без нее:
+    присваивание атрибута атомарно, а опубликованный снимок не меняется.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = StateSnapshot()
+        self.published = 0
+
+    def publish(self, **parts):
+        with self.lock:
+            snapshot = self.current.evolve(**parts)
+            if snapshot is not self.current:
+                self.current = snapshot
+                self.published += 1
+            return snapshot
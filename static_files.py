@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Статические файлы веб-интерфейса из памяти
+Файлы читаются один раз (и заранее сжимаются gzip), ответы получают
+сильный ETag, Last-Modified и Cache-Control, повторные запросы - 304.
+Большие файлы не кэшируются и отправляются через sendfile
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from async_http import HTTPResponse
+from http_compression import COMPRESSIBLE_TYPES, encoded_etag
+from response_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_SIZE = int(os.environ.get('STATIC_MAX_CACHED_SIZE', 1 << 20))  # Больше - sendfile с диска
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 3600))
+WATCH_INTERVAL = 1.0  # Секунд между проверками изменения файла в режиме разработки
+
+TEXT_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+def content_type(path):
+    guessed = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if guessed == 'text/javascript':
+        guessed = 'application/javascript'
+    return f'{guessed}; charset=utf-8' if guessed.startswith(TEXT_TYPES) else guessed
+
+class StaticAsset:
+    """Файл в памяти (body) или только метаданные для sendfile (body None)"""
+
+    __slots__ = ('path', 'content_type', 'size', 'mtime', 'etag', 'last_modified', 'body', 'encoded', 'checked_at')
+
+    def __init__(self, path, stat, body=None):
+        self.path = path
+        self.content_type = content_type(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.last_modified = formatdate(int(stat.st_mtime), usegmt=True)
+        self.body = body
+        self.encoded = {}
+        if body is not None:
+            self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+            if self.content_type.startswith(COMPRESSIBLE_TYPES):
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(compressed) < len(body):
+                    self.encoded['gzip'] = compressed
+        else:
+            self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'  # Как у web.FileResponse
+        self.checked_at = time.monotonic()
+
+    def changed(self, stat):
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+class StaticFiles:
+    """Кэш файлов каталога root
+
+    watch - режим разработки: перед отдачей файл проверяется на изменение
+    (не чаще WATCH_INTERVAL) и перечитывается. Без watch файлы читаются
+    при первом запросе и не перечитываются до перезапуска.
+    """
+
+    def __init__(self, root, watch=None, max_age=STATIC_MAX_AGE, max_cached_size=MAX_CACHED_SIZE):
+        self.root = os.path.realpath(root)
+        self.watch = os.environ.get('STATIC_WATCH', '').lower() in ('1', 'true', 'on') if watch is None else watch
+        self.max_age = max_age
+        self.max_cached_size = max_cached_size
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.not_modified = 0
+
+    def resolve(self, url_path):
+        """Путь к файлу внутри root или None (выход за пределы каталога, скрытые файлы)"""
+        if url_path in ('', '/'):
+            url_path = '/index.html'
+        if '\x00' in url_path or '\\' in url_path:
+            return None
+        parts = [part for part in url_path.split('/') if part]
+        if any(part in ('.', '..') or part.startswith('.') for part in parts):
+            return None
+        path = os.path.realpath(os.path.join(self.root, *parts))
+        if os.path.commonpath((self.root, path)) != self.root:
+            return None  # Символическая ссылка наружу
+        return path
+
+    def preload(self):
+        """Чтение всех файлов каталога заранее"""
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for name in filenames:
+                if not name.startswith('.'):
+                    self.load(os.path.join(directory, name))
+        logger.info(f"📦 Статика загружена: {len(self.assets)} файлов, "
+                    f"{sum(asset.size for asset in self.assets.values() if asset.body is not None)} байт в памяти")
+
+    def load(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self.lock:
+                self.assets.pop(path, None)
+            return None
+        if not os.path.isfile(path):
+            return None
+        body = None
+        if stat.st_size <= self.max_cached_size:
+            with open(path, 'rb') as f:
+                body = f.read()
+        asset = StaticAsset(path, stat, body)
+        with self.lock:
+            self.assets[path] = asset
+            self.loads += 1
+        return asset
+
+    def cached(self, path):
+        """Файл из памяти без обращения к диску; None - нужен get() в пуле потоков"""
+        asset = self.assets.get(path)
+        if asset is None or (self.watch and time.monotonic() - asset.checked_at >= WATCH_INTERVAL):
+            return None
+        self.hits += 1
+        return asset
+
+    def get(self, path):
+        """Актуальный файл; синхронно (чтение с диска при промахе или изменении)"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return self.load(path)
+        if self.watch and time.monotonic() - asset.checked_at >= WATCH_INTERVAL:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return self.load(path)
+            if asset.changed(stat):
+                logger.info(f"🔄 Файл изменен, перечитываем: {os.path.relpath(path, self.root)}")
+                return self.load(path)
+            asset.checked_at = time.monotonic()
+        self.hits += 1
+        return asset
+
+    def headers(self, asset):
+        cache_control = 'no-cache' if asset.content_type.startswith('text/html') else f'public, max-age={self.max_age}'
+        return {
+            'Content-Type': asset.content_type,
+            'ETag': asset.etag,
+            'Last-Modified': asset.last_modified,
+            'Cache-Control': cache_control
+        }
+
+    def not_modified_since(self, request, asset):
+        if_none_match = request.header('If-None-Match')
+        if if_none_match:
+            return etag_matches(if_none_match, asset.etag)
+        if_modified_since = request.header('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            return int(asset.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def response(self, request, asset, coding=None):
+        """Ответ с файлом или 304; coding - кодировка, согласованная для этого запроса (или None)
+
+        304 повторяет заголовки варианта, который хранит клиент: сжатый
+        вариант получал ETag с суффиксом кодировки (http_compression.encoded_etag),
+        и ответы сжимаемых файлов зависят от Accept-Encoding.
+        """
+        headers = self.headers(asset)
+        if self.not_modified_since(request, asset):
+            self.not_modified += 1
+            if asset.body is not None and asset.content_type.startswith(COMPRESSIBLE_TYPES):
+                headers['Vary'] = 'Accept-Encoding'
+                variant = encoded_etag(asset.etag, coding) if coding else None
+                if variant and variant in (request.header('If-None-Match') or ''):
+                    headers['ETag'] = variant
+            return HTTPResponse(304, headers=headers)
+        if asset.body is None:
+            return HTTPResponse(200, headers=headers, file=(asset.path, asset.size))
+        # Заранее сжатое тело берет ResponseCompressor (http_compression.py)
+        return HTTPResponse(200, asset.body, headers=headers, encoded=asset.encoded)
+
+    def stats(self):
+        with self.lock:
+            cached = [asset for asset in self.assets.values() if asset.body is not None]
+            return {
+                'files': len(self.assets),
+                'cached_bytes': sum(asset.size for asset in cached),
+                'gzip_bytes': sum(len(asset.encoded.get('gzip', b'')) for asset in cached),
+                'hits': self.hits,
+                'loads': self.loads,
+                'not_modified': self.not_modified,
+                'watch': self.watch
+            }
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Подписки WebSocket клиентов и индекс маршрутизации изменений
+Клиенты с одинаковой подпиской объединяются в группу: сообщение
+фильтруется и сериализуется один раз на группу
+"""
+
+import threading
+
+# Измерения подписки: поле подписки → ключ атрибутов записи
+DIMENSIONS = ('maps', 'modes', 'regions', 'steamids')
+
+class Subscription:
+    """Фильтр клиента; пустое измерение (None) означает "все" """
+
+    def __init__(self, maps=None, modes=None, regions=None, steamids=None, saved_only=False):
+        self.maps = self._normalize(maps)
+        self.modes = self._normalize(modes)
+        self.regions = self._normalize(regions)
+        self.steamids = self._normalize(steamids)
+        self.saved_only = bool(saved_only)
+
+    @staticmethod
+    def _normalize(values):
+        if values is None or values == []:
+            return None
+        if isinstance(values, (str, int)):
+            values = [values]
+        if not isinstance(values, (list, tuple, set, frozenset)):
+            raise ValueError("Фильтр подписки должен быть списком")
+        return frozenset(str(value) for value in values)
+
+    @classmethod
+    def from_message(cls, data, known_maps=None):
+        """Подписка из сообщения клиента; карты вне known_maps - ValueError"""
+        subscription = cls(**{field: data.get(field) for field in (*DIMENSIONS, 'saved_only')})
+        if known_maps is not None and subscription.maps is not None:
+            unknown = subscription.maps - set(known_maps)
+            if unknown:
+                raise ValueError(f"Неизвестные карты: {', '.join(sorted(unknown))}")
+        return subscription
+
+    def key(self):
+        return (*(getattr(self, field) for field in DIMENSIONS), self.saved_only)
+
+    def is_wildcard(self):
+        return all(getattr(self, field) is None for field in DIMENSIONS) and not self.saved_only
+
+    def to_dict(self):
+        result = {field: sorted(getattr(self, field)) if getattr(self, field) is not None else None
+                  for field in DIMENSIONS}
+        result['saved_only'] = self.saved_only
+        return result
+
+    def matches(self, attributes):
+        """Проверка записи по атрибутам из record_attributes()"""
+        if self.saved_only and not attributes['saved']:
+            return False
+        for field in DIMENSIONS:
+            allowed = getattr(self, field)
+            if allowed is not None and allowed.isdisjoint(attributes[field]):
+                return False
+        return True
+
+def record_attributes(record, mode, saved):
+    """Значения измерений записи сервера"""
+    maps = {str(record.get('map', ''))}
+    if record.get('last_map'):
+        maps.add(str(record['last_map']))  # Исчезнувший сервер относится и к прежней карте
+    return {
+        'maps': maps,
+        'modes': {str(mode)},
+        'regions': {str(record.get('region', ''))},
+        'steamids': {str(record.get('steamid', ''))},
+        'saved': saved
+    }
+
+class SubscriptionGroup:
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.clients = set()
+
+class SubscriptionIndex:
+    """Индекс групп подписок по значениям измерений
+
+    Для записи находятся только группы, которым она интересна:
+    пересечение (группы со значением ∪ группы без фильтра) по измерениям.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.groups = {}  # ключ подписки → группа
+        self.clients = {}  # клиент → группа
+        self.index = {field: {} for field in DIMENSIONS}  # значение → группы
+        self.wildcard = {field: set() for field in DIMENSIONS}  # группы без фильтра
+
+    def subscribe(self, client, subscription):
+        with self.lock:
+            self._remove(client)
+            group = self.groups.get(subscription.key())
+            if group is None:
+                group = self.groups[subscription.key()] = SubscriptionGroup(subscription)
+                for field in DIMENSIONS:
+                    values = getattr(subscription, field)
+                    if values is None:
+                        self.wildcard[field].add(group)
+                    else:
+                        for value in values:
+                            self.index[field].setdefault(value, set()).add(group)
+            group.clients.add(client)
+            self.clients[client] = group
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self._remove(client)
+
+    def _remove(self, client):
+        group = self.clients.pop(client, None)
+        if group is None:
+            return
+        group.clients.discard(client)
+        if group.clients:
+            return
+
+        # Пустая группа удаляется из индекса
+        subscription = group.subscription
+        del self.groups[subscription.key()]
+        for field in DIMENSIONS:
+            values = getattr(subscription, field)
+            if values is None:
+                self.wildcard[field].discard(group)
+                continue
+            for value in values:
+                groups = self.index[field].get(value)
+                if groups is not None:
+                    groups.discard(group)
+                    if not groups:
+                        del self.index[field][value]
+
+    def subscription_of(self, client):
+        group = self.clients.get(client)
+        return group.subscription if group else Subscription()
+
+    def snapshot_groups(self):
+        """Группы и их клиенты на момент вызова"""
+        with self.lock:
+            return [(group, set(group.clients)) for group in self.groups.values()]
+
+    def only_wildcard(self):
+        with self.lock:
+            return all(group.subscription.is_wildcard() for group in self.groups.values())
+
+    def subscribed_maps(self):
+        with self.lock:
+            return set(self.index['maps'])
+
+    def groups_for(self, attributes):
+        """Группы, которым интересна запись"""
+        with self.lock:
+            candidates = None
+            for field in DIMENSIONS:
+                matched = set(self.wildcard[field])
+                for value in attributes[field]:
+                    matched |= self.index[field].get(value, set())
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return set()
+            if not attributes['saved']:
+                candidates = {group for group in candidates if not group.subscription.saved_only}
+            return candidates
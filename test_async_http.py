@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Тесты HTTP сервера async_http.py: keep-alive, chunked тело, потоковые
+ответы, HEAD и ошибки обработчика
+"""
+
+import asyncio
+import unittest
+
+from async_http import AsyncHTTPServer, HTTPResponse, json_response
+
+async def handler(request):
+    if request.path == '/echo':
+        return json_response({'method': request.method, 'body': request.body.decode('utf-8'),
+                              'name': request.param('name'), 'agent': request.header('User-Agent')})
+    if request.path == '/stream':
+        return HTTPResponse(200, content_type='text/plain', stream=(f"{i}\n" for i in range(1000)))
+    if request.path == '/fail':
+        raise RuntimeError('boom')
+    return json_response({'error': 'not found'}, 404)
+
+async def read_response(reader):
+    """Статус, заголовки (в нижнем регистре) и тело одного ответа"""
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split()[1]), headers, body
+
+class AsyncHTTPServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = AsyncHTTPServer(handler, default_headers={'X-Test': '1'})
+        await self.server.start('127.0.0.1', 0)
+        self.port = self.server.runner.addresses[0][1]
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.server.close()
+
+    async def request(self, raw):
+        self.writer.write(raw)
+        await self.writer.drain()
+        return await read_response(self.reader)
+
+    async def test_keepalive_reuses_connection(self):
+        for _ in range(3):
+            status, headers, body = await self.request(
+                b'GET /echo?name=a%20b HTTP/1.1\r\nHost: test\r\nUser-Agent: t\r\n\r\n')
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['x-test'], '1')
+            self.assertIn(b'"name":"a b"', body)
+        stats = self.server.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['keepalive_reused'], 2)
+
+    async def test_chunked_request_body(self):
+        status, _, body = await self.request(
+            b'POST /echo HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n')
+        self.assertEqual(status, 200)
+        self.assertIn(b'"body":"hello world"', body)
+
+    async def test_stream_response_is_chunked(self):
+        status, headers, body = await self.request(b'GET /stream HTTP/1.1\r\nHost: test\r\n\r\n')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get('transfer-encoding'), 'chunked')
+        self.assertEqual(body, ''.join(f"{i}\n" for i in range(1000)).encode('utf-8'))
+
+    async def test_head_stream_sends_no_body(self):
+        status, headers, body = await self.request(b'HEAD /stream HTTP/1.1\r\nHost: test\r\nContent-Length: 0\r\n\r\n')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'')
+        # Соединение пригодно для следующего запроса
+        status, _, _ = await self.request(b'GET /echo HTTP/1.1\r\nHost: test\r\n\r\n')
+        self.assertEqual(status, 200)
+
+    async def test_handler_error_is_500(self):
+        status, _, body = await self.request(b'GET /fail HTTP/1.1\r\nHost: test\r\n\r\n')
+        self.assertEqual(status, 500)
+        self.assertIn(b'boom', body)
+        self.assertEqual(self.server.stats()['errors'], 1)
+
+    async def test_websocket_only_server_answers_426(self):
+        server = AsyncHTTPServer(None)
+        await server.start('127.0.0.1', 0)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.runner.addresses[0][1])
+            writer.write(b'GET / HTTP/1.1\r\nHost: test\r\n\r\n')
+            status, headers, _ = await read_response(reader)
+            writer.close()
+        finally:
+            await server.close()
+        self.assertEqual(status, 426)
+        self.assertEqual(headers.get('upgrade'), 'websocket')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Тесты запросов /api/servers: страницы по курсору, фильтры, диапазон
+игроков и инкрементальное обновление индекса
+"""
+
+import random
+import unittest
+
+from server_query import SORT_KEYS, QueryIndex, ServerQuery, build_query_index, decode_cursor, encode_cursor
+from server_view import ServerView
+
+class Request:
+    """Параметры строки запроса как у HTTPRequest"""
+
+    def __init__(self, **params):
+        self.params = params
+
+    def param(self, name, default=None):
+        return self.params.get(name, default)
+
+def make_record(index, status='game', players=None, last_seen=None):
+    return {
+        'steamid': f'9000{index:04d}',
+        'name': f'Server {index % 7}',
+        'map': ('de_dust2', 'de_nuke', 'cs_office')[index % 3],
+        'mode': ('competitive', 'casual')[index % 2],
+        'region': index % 4,
+        'players': index % 11 if players is None else players,
+        'last_seen': 1000 + index // 3 if last_seen is None else last_seen,
+        'status': status
+    }
+
+def read_all(index, **params):
+    """Все страницы запроса по next_cursor"""
+    records, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, cursor=cursor) if cursor else params
+        page, _, cursor = ServerQuery(Request(**query)).run(index)
+        records.extend(page)
+        pages += 1
+        if cursor is None:
+            return records, pages
+
+def expected(records, **params):
+    query = ServerQuery(Request(**params))
+    return sorted((record for record in records if query.matches(record)), key=SORT_KEYS[query.sort])
+
+class ServerQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [make_record(i) for i in range(500)]
+        self.index = build_query_index(self.records)
+
+    def test_cursor_pages_cover_every_record_once(self):
+        for sort in SORT_KEYS:
+            records, pages = read_all(self.index, sort=sort, limit='37')
+            self.assertEqual(records, expected(self.records, sort=sort), sort)
+            self.assertEqual(pages, 14)
+
+    def test_filters_and_cursor(self):
+        params = {'map': 'de_nuke', 'mode': 'casual', 'q': 'server 3', 'sort': 'name', 'limit': '5'}
+        records, _ = read_all(self.index, **params)
+        self.assertTrue(records)
+        self.assertEqual(records, expected(self.records, **params))
+
+    def test_players_range(self):
+        for sort in SORT_KEYS:
+            params = {'players_min': '4', 'players_max': '6', 'sort': sort, 'limit': '20'}
+            records, _ = read_all(self.index, **params)
+            self.assertEqual(records, expected(self.records, **params), sort)
+            self.assertTrue(all(4 <= record['players'] <= 6 for record in records))
+
+    def test_players_range_bounds_candidates(self):
+        _, candidates, _ = ServerQuery(Request(sort='players', players_min='10')).run(self.index)
+        self.assertEqual(candidates, sum(1 for record in self.records if record['players'] >= 10))
+
+    def test_unknown_facet_value_is_empty(self):
+        self.assertEqual(ServerQuery(Request(map='de_vertigo')).run(self.index), ([], 0, None))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            ServerQuery(Request(cursor='not-a-cursor'))
+        with self.assertRaises(ValueError):
+            ServerQuery(Request(sort='name', cursor=encode_cursor('players', (0, 0, 'a', 'game'))))
+        self.assertEqual(decode_cursor(encode_cursor('name', ('a', '1', 'game')), 'name'), ['a', '1', 'game'])
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            ServerQuery(Request(sort='map'))
+        with self.assertRaises(ValueError):
+            ServerQuery(Request(limit='many'))
+
+class QueryIndexTest(unittest.TestCase):
+
+    def assert_same_index(self, actual, wanted):
+        self.assertEqual(set(actual['facets']), set(wanted['facets']))
+        for sort in SORT_KEYS:
+            self.assertEqual(actual['orders'][sort], wanted['orders'][sort])
+            for name, group in wanted['facets'].items():
+                self.assertEqual(actual['facets'][name][sort], group[sort])
+
+    def test_incremental_updates_match_rebuild(self):
+        generator = random.Random(7)
+        view = ServerView()
+        query_index = QueryIndex()
+        for cycle in range(30):
+            for _ in range(300 if cycle == 0 else 10):
+                number = generator.randrange(400)
+                status = generator.choice(('game', 'empty', 'disappeared'))
+                if generator.random() < 0.7:
+                    record = make_record(number, status, players=generator.randrange(20),
+                                         last_seen=cycle * 100 + generator.random())
+                    view.put(status, record['steamid'], record)
+                else:
+                    view.remove(status, make_record(number)['steamid'])
+            view.freeze()
+            index = query_index.update(view.members, view.drain_changes())
+            records = [record for members in view.members.values() for record in members.values()]
+            self.assert_same_index(index, build_query_index(records))
+
+    def test_unchanged_cycle_keeps_index(self):
+        view = ServerView()
+        view.replace('game', {record['steamid']: record for record in (make_record(i) for i in range(10))})
+        query_index = QueryIndex()
+        index = query_index.update(view.members, view.drain_changes())
+        self.assertIs(query_index.update(view.members, view.drain_changes()), index)
+
+if __name__ == '__main__':
+    unittest.main()
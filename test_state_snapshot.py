@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Тесты снимков состояния, журнала дельт WebSocket и ленты изменений:
+версии частей снимка, seq и пересинхронизация, объединенные дельты since()
+"""
+
+import unittest
+
+from change_feed import ChangeFeed
+from state_journal import StateJournal
+from state_snapshot import SnapshotPublisher, StateSnapshot
+
+def server(steamid, players=0, last_seen=0):
+    return {'steamid': steamid, 'players': players, 'last_seen': last_seen}
+
+class StateSnapshotTest(unittest.TestCase):
+
+    def test_evolve_versions_only_changed_parts(self):
+        snapshot = StateSnapshot()
+        first = snapshot.evolve(game_servers={'a': server('a')}, stats={'total': 1})
+        second = first.evolve(stats={'total': 2})
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.assertEqual(second.version_of('game_servers'), 1)
+        self.assertEqual(second.version_of('stats'), 2)
+        self.assertEqual(second.version_of('game_servers', 'stats'), 2)
+        self.assertEqual(second.version_of('saved_servers'), 0)
+
+    def test_evolve_without_changes_returns_same_snapshot(self):
+        snapshot = StateSnapshot().evolve(game_servers={'a': server('a')})
+        self.assertIs(snapshot.evolve(game_servers={'a': server('a')}), snapshot)
+
+    def test_snapshot_is_read_only_copy(self):
+        servers = {'a': server('a')}
+        snapshot = StateSnapshot(game_servers=servers)
+        servers['b'] = server('b')
+        self.assertNotIn('b', snapshot.game_servers)
+        with self.assertRaises(TypeError):
+            snapshot.game_servers['c'] = server('c')
+        with self.assertRaises(AttributeError):
+            snapshot.version = 5
+
+    def test_publisher_counts_only_new_versions(self):
+        publisher = SnapshotPublisher()
+        publisher.publish(stats={'total': 1})
+        publisher.publish(stats={'total': 1})
+        self.assertEqual(publisher.current.version, 1)
+        self.assertEqual(publisher.published, 1)
+
+class StateJournalTest(unittest.TestCase):
+
+    def state(self, game=None, disappeared=None):
+        return {'game_servers': game or {}, 'disappeared_servers': disappeared or {}}
+
+    def test_seq_grows_only_on_changes(self):
+        journal = StateJournal()
+        delta, changes = journal.commit(self.state({'a': server('a', 1)}))
+        self.assertEqual((delta['seq'], delta['base_seq']), (1, 0))
+        self.assertEqual(changes['game_servers'], [('a', None, server('a', 1))])
+        # Изменилось только время обнаружения
+        self.assertEqual(journal.commit(self.state({'a': server('a', 1, last_seen=10)})), (None, {}))
+        self.assertEqual(journal.seq, 1)
+
+    def test_since_merges_deltas(self):
+        journal = StateJournal()
+        journal.commit(self.state({'a': server('a', 1), 'b': server('b')}))
+        journal.commit(self.state({'a': server('a', 2), 'b': server('b')}))
+        journal.commit(self.state({'a': server('a', 3)}, {'b': server('b')}))
+        merged = journal.since(1)
+        self.assertEqual((merged['seq'], merged['base_seq']), (3, 1))
+        self.assertEqual(merged['game_servers'], {'upsert': [server('a', 3)], 'remove': ['b']})
+        self.assertEqual(merged['disappeared_servers'], {'upsert': [server('b')], 'remove': []})
+        self.assertEqual(journal.since(3), {'seq': 3, 'base_seq': 3})
+
+    def test_since_requests_resync_when_history_lost(self):
+        journal = StateJournal(max_deltas=2)
+        for players in range(4):
+            journal.commit(self.state({'a': server('a', players)}))
+        self.assertIsNone(journal.since(0))
+        self.assertIsNone(journal.since(10))
+        self.assertIsNotNone(journal.since(2))
+        self.assertEqual(journal.full()['game_servers'], [server('a', 3)])
+
+class ChangeFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.feed = ChangeFeed()
+        self.snapshot = StateSnapshot()
+
+    def publish(self, **parts):
+        self.snapshot = self.snapshot.evolve(**parts)
+        return self.feed.update(self.snapshot)
+
+    def test_since_returns_changes_after_version(self):
+        self.publish(game_servers={'a': server('a', 1)})
+        self.publish(game_servers={'a': server('a', 2), 'b': server('b')})
+        merged = self.feed.since(1)
+        self.assertEqual((merged['version'], merged['base_version']), (2, 1))
+        self.assertEqual(merged['game_servers']['upsert'], [server('a', 2), server('b')])
+        self.assertEqual(self.feed.since(2), {'version': 2, 'base_version': 2})
+
+    def test_other_parts_advance_version_without_repeating_delta(self):
+        self.publish(game_servers={'a': server('a', 1)})
+        self.assertIsNone(self.publish(stats={'total': 1}))
+        self.assertEqual(self.feed.version, 2)
+        self.assertEqual(self.feed.deltas[-1]['version'], 1)
+        # Клиент, получивший дельту версии 1, не получает ее повторно
+        self.assertNotIn('game_servers', self.feed.since(1))
+
+    def test_volatile_fields_do_not_produce_delta(self):
+        self.publish(game_servers={'a': server('a', 1)})
+        self.assertIsNone(self.publish(game_servers={'a': server('a', 1, last_seen=5)}))
+
+    def test_since_lost_history(self):
+        feed = self.feed = ChangeFeed(max_deltas=2)
+        for players in range(4):
+            self.publish(game_servers={'a': server('a', players)})
+        self.assertIsNone(feed.since(0))
+        self.assertEqual(feed.since(2)['game_servers']['upsert'], [server('a', 3)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тесты статики и условных запросов: выход за пределы каталога, 304 для
+сжатых вариантов, If-None-Match с суффиксами кодировок
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from async_http import HTTPRequest
+from http_compression import encoded_etag
+from response_cache import etag_matches
+from static_files import StaticFiles
+
+class StaticFilesResolveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='cs2_static_')
+        self.root = os.path.join(self.directory, 'public')
+        os.makedirs(os.path.join(self.root, 'css'))
+        for name in ('index.html', os.path.join('css', 'app.css'), '.env'):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('body { color: red; }\n' * 200)
+        with open(os.path.join(self.directory, 'secret.txt'), 'w') as f:
+            f.write('secret')
+        self.static = StaticFiles(self.root, watch=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resolves_files_inside_root(self):
+        root = os.path.realpath(self.root)
+        self.assertEqual(self.static.resolve('/'), os.path.join(root, 'index.html'))
+        self.assertEqual(self.static.resolve('/css/app.css'), os.path.join(root, 'css', 'app.css'))
+        self.assertEqual(self.static.resolve('//css//app.css'), os.path.join(root, 'css', 'app.css'))
+
+    def test_rejects_traversal_and_hidden_files(self):
+        for path in ('/../secret.txt', '/css/../../secret.txt', '/..', '/./index.html', '/.env',
+                     '/css/..\\..\\secret.txt', '/index.html\x00.png'):
+            self.assertIsNone(self.static.resolve(path), path)
+
+    def test_rejects_symlink_outside_root(self):
+        os.symlink(os.path.join(self.directory, 'secret.txt'), os.path.join(self.root, 'link.txt'))
+        self.assertIsNone(self.static.resolve('/link.txt'))
+
+    def test_not_modified_confirms_compressed_variant(self):
+        asset = self.static.get(self.static.resolve('/css/app.css'))
+        self.assertIn('gzip', asset.encoded)
+        variant = encoded_etag(asset.etag, 'gzip')
+
+        response = self.static.response(HTTPRequest('GET', '/css/app.css', headers={'if-none-match': variant}),
+                                        asset, 'gzip')
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], variant)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+        response = self.static.response(HTTPRequest('GET', '/css/app.css', headers={'if-none-match': asset.etag}),
+                                        asset, None)
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], asset.etag)
+
+        response = self.static.response(HTTPRequest('GET', '/css/app.css', headers={'if-none-match': '"other"'}),
+                                        asset, 'gzip')
+        self.assertEqual(response.status, 200)
+
+class EtagMatchesTest(unittest.TestCase):
+
+    def test_plain_weak_and_list(self):
+        self.assertTrue(etag_matches('"v3"', '"v3"'))
+        self.assertTrue(etag_matches('W/"v3"', '"v3"'))
+        self.assertTrue(etag_matches('"v1", "v3"', '"v3"'))
+        self.assertTrue(etag_matches('*', '"v3"'))
+        self.assertFalse(etag_matches('"v31"', '"v3"'))
+        self.assertFalse(etag_matches('', '"v3"'))
+        self.assertFalse(etag_matches(None, '"v3"'))
+
+    def test_encoding_suffixes(self):
+        for coding in ('gzip', 'br', 'zstd'):
+            self.assertTrue(etag_matches(encoded_etag('"v3"', coding), '"v3"'), coding)
+        self.assertTrue(etag_matches('W/"v3-gzip"', '"v3"'))
+        self.assertFalse(etag_matches('"v3-gzip"', '"v4"'))
+        self.assertFalse(etag_matches('"v3-deflate"', '"v3"'))
+
+if __name__ == '__main__':
+    unittest.main()
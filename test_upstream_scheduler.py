@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тесты планировщика запросов к Steam API: приоритет интерактивных
+запросов над накопленным фоновым обходом и ограничение частоты
+"""
+
+import threading
+import time
+import unittest
+
+from upstream_scheduler import UpstreamScheduler
+
+class UpstreamSchedulerTest(unittest.TestCase):
+
+    def run_requests(self, scheduler, priorities, delay=0.0):
+        """Потоки с acquire() в порядке priorities; возвращает порядок выдачи разрешений"""
+        order = []
+        lock = threading.Lock()
+
+        def request(name):
+            scheduler.acquire(name)
+            with lock:
+                order.append(name)
+
+        threads = []
+        for name in priorities:
+            thread = threading.Thread(target=request, args=(name,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(delay)
+        for thread in threads:
+            thread.join(10)
+        return order
+
+    def test_interactive_overtakes_background_queue(self):
+        scheduler = UpstreamScheduler(rate=50, burst=1)
+        scheduler.acquire('background')  # Бюджет исчерпан: дальше заявки ждут в очереди
+        order = self.run_requests(scheduler, ['background'] * 8 + ['interactive'], delay=0.002)
+        self.assertEqual(len(order), 9)
+        self.assertLessEqual(order.index('interactive'), 1)
+
+    def test_weighted_share(self):
+        scheduler = UpstreamScheduler(rate=200, burst=1)
+        scheduler.acquire('background')
+        order = self.run_requests(scheduler, ['background'] * 6 + ['interactive'] * 6 + ['watchlist'] * 3)
+        # Интерактивные (вес 8) получают разрешения раньше большей части фоновых (вес 1)
+        self.assertLess(max(i for i, name in enumerate(order) if name == 'interactive'),
+                        max(i for i, name in enumerate(order) if name == 'background'))
+        self.assertEqual(scheduler.stats()['classes']['interactive']['granted'], 6)
+
+    def test_rate_limit(self):
+        scheduler = UpstreamScheduler(rate=40, burst=1)
+        started = time.monotonic()
+        for _ in range(5):
+            scheduler.acquire('interactive')
+        # Первый запрос из бюджета, остальные четыре - по 1/40 сек
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 40 * 0.9)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            UpstreamScheduler(rate=0)
+        with self.assertRaises(ValueError):
+            UpstreamScheduler().acquire('urgent')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Встроенное хранилище временных рядов заселенности карт
+Кольцевые буферы фиксированного размера с агрегацией 1 с → 1 мин → 1 ч
+"""
+
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+
+from metrics import PERSIST_DURATION
+
+logger = logging.getLogger(__name__)
+
+TIMESERIES_FILE = 'timeseries.json.gz'
+
+# Уровни агрегации: (разрешение в секундах, емкость буфера)
+TIERS = (
+    (1, 3600),      # сырые точки за последний час
+    (60, 10080),    # минутные точки за 7 дней
+    (3600, 2160),   # часовые точки за 90 дней
+)
+
+class RingBuffer:
+    """Кольцевой буфер точек (время, среднее, максимум)
+
+    Массивы растут по мере заполнения и не превышают capacity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d')
+        self.avgs = array('f')
+        self.maxs = array('f')
+        self.start = 0  # Индекс самой старой точки
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, timestamp, avg, peak):
+        if len(self.times) < self.capacity:
+            self.times.append(timestamp)
+            self.avgs.append(avg)
+            self.maxs.append(peak)
+            return
+        self.times[self.start] = timestamp
+        self.avgs[self.start] = avg
+        self.maxs[self.start] = peak
+        self.start = (self.start + 1) % self.capacity
+
+    def _index(self, position):
+        return (self.start + position) % len(self.times)
+
+    def oldest(self):
+        return self.times[self.start] if self.times else None
+
+    def _bisect(self, timestamp):
+        """Первая позиция с временем >= timestamp"""
+        low, high = 0, len(self.times)
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._index(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(self, start, end):
+        """Точки в интервале [start, end] по возрастанию времени"""
+        for position in range(self._bisect(start), len(self.times)):
+            index = self._index(position)
+            if self.times[index] > end:
+                break
+            yield self.times[index], self.avgs[index], self.maxs[index]
+
+    def copy(self):
+        """Копия массивов (для сохранения вне блокировки хранилища)"""
+        buffer = RingBuffer(self.capacity)
+        buffer.times, buffer.avgs, buffer.maxs = self.times[:], self.avgs[:], self.maxs[:]
+        buffer.start = self.start
+        return buffer
+
+    def to_dict(self):
+        order = [self._index(position) for position in range(len(self.times))]
+        encode = lambda values: base64.b64encode(values.tobytes()).decode('ascii')
+        return {
+            'times': encode(array('d', (self.times[i] for i in order))),
+            'avgs': encode(array('f', (self.avgs[i] for i in order))),
+            'maxs': encode(array('f', (self.maxs[i] for i in order)))
+        }
+
+    @classmethod
+    def from_dict(cls, capacity, data):
+        buffer = cls(capacity)
+        for name, typecode in (('times', 'd'), ('avgs', 'f'), ('maxs', 'f')):
+            values = array(typecode)
+            values.frombytes(base64.b64decode(data[name]))
+            setattr(buffer, name, values[-capacity:])
+        return buffer
+
+class TieredSeries:
+    """Один ряд с каскадной агрегацией по уровням TIERS"""
+
+    def __init__(self, tiers=TIERS):
+        self.tiers = tiers
+        self.buffers = [RingBuffer(capacity) for _, capacity in tiers]
+        self.pending = [None] * len(tiers)  # [начало бакета, сумма, количество, максимум]
+
+    def add(self, timestamp, value):
+        self._accumulate(0, timestamp, value, 1, value)
+
+    def _accumulate(self, level, timestamp, total, count, peak):
+        resolution = self.tiers[level][0]
+        bucket = timestamp - timestamp % resolution
+        pending = self.pending[level]
+
+        if pending is not None and pending[0] != bucket:
+            self._flush(level)
+            pending = None
+
+        if pending is None:
+            self.pending[level] = [bucket, total, count, peak]
+        else:
+            pending[1] += total
+            pending[2] += count
+            pending[3] = max(pending[3], peak)
+
+    def _flush(self, level):
+        bucket, total, count, peak = self.pending[level]
+        self.pending[level] = None
+        self.buffers[level].append(bucket, total / count, peak)
+        if level + 1 < len(self.tiers):
+            self._accumulate(level + 1, bucket, total, count, peak)
+
+    def query(self, start, end, points):
+        """Ряд в интервале, прореженный не более чем до points точек"""
+        # Берем самый подробный уровень, который еще хранит начало интервала,
+        # иначе - уровень с самой длинной историей
+        oldest = [buffer.oldest() for buffer in self.buffers]
+        covering = [level for level, value in enumerate(oldest) if value is not None and value <= start]
+        if covering:
+            level = covering[0]
+        else:
+            level = min(range(len(oldest)), key=lambda level: (oldest[level] is None, oldest[level] or 0, level))
+
+        samples = list(self.buffers[level].range(start, end))
+        pending = self.pending[level]
+        if pending is not None and start <= pending[0] <= end:
+            samples.append((pending[0], pending[1] / pending[2], pending[3]))
+
+        if len(samples) <= points:
+            return self.tiers[level][0], [[t, round(a, 2), m] for t, a, m in samples]
+
+        # Прореживание: равные по времени бакеты, среднее и максимум
+        width = (end - start) / points
+        result = []
+        current = None
+        for timestamp, avg, peak in samples:
+            index = int((timestamp - start) // width)
+            if current is None or current[0] != index:
+                if current is not None:
+                    result.append([start + current[0] * width, round(current[1] / current[2], 2), current[3]])
+                current = [index, 0.0, 0, peak]
+            current[1] += avg
+            current[2] += 1
+            current[3] = max(current[3], peak)
+        if current is not None:
+            result.append([start + current[0] * width, round(current[1] / current[2], 2), current[3]])
+        return width, result
+
+class TimeSeriesStore:
+    """Набор рядов по ключам вида 'map:de_dust2:servers'
+
+    record() только обновляет буферы в памяти; файл записывает save_if_due()
+    из потока потребителя событий, чтобы сжатие всех рядов не задерживало
+    цикл сканирования.
+    """
+
+    def __init__(self, path=TIMESERIES_FILE, save_interval=60):
+        self.path = path
+        self.save_interval = save_interval
+        self.series = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Одна запись файла одновременно
+        self._last_save = time.time()
+
+    def record(self, values, timestamp=None):
+        """Запись значений одного цикла; известные ряды без значения получают 0"""
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        with self.lock:
+            for key in self.series.keys() - values.keys():
+                self.series[key].add(timestamp, 0)
+            for key, value in values.items():
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = TieredSeries()
+                series.add(timestamp, value)
+
+    def save_if_due(self):
+        """Сохранение, если с прошлого прошло save_interval секунд; True - файл записан"""
+        if time.time() - self._last_save < self.save_interval:
+            return False
+        self.save()
+        return True
+
+    def keys(self, prefix=''):
+        with self.lock:
+            return sorted(key for key in self.series if key.startswith(prefix))
+
+    def query(self, key, start, end, points=500):
+        """Прореженный ряд: {'resolution': секунд на точку, 'points': [[t, avg, max], ...]}"""
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                return None
+            resolution, samples = series.query(start, end, max(1, points))
+        return {'resolution': resolution, 'points': samples}
+
+    def save(self):
+        """Сохранение уровней в сжатый файл"""
+        self._last_save = time.time()
+        try:
+            # Под блокировкой только копирование массивов, кодирование и сжатие - без нее
+            with self.lock:
+                buffers = {key: [buffer.copy() for buffer in series.buffers] for key, series in self.series.items()}
+            with self.save_lock, PERSIST_DURATION.time('timeseries'):
+                data = {key: [buffer.to_dict() for buffer in items] for key, items in buffers.items()}
+                with gzip.open(self.path + '.tmp', 'wt', encoding='utf-8') as f:
+                    json.dump({'tiers': TIERS, 'series': data}, f, separators=(',', ':'))
+                os.replace(self.path + '.tmp', self.path)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения временных рядов: {e}")
+
+    def load(self):
+        """Загрузка рядов из файла"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            if [tuple(tier) for tier in data.get('tiers', [])] != list(TIERS):
+                logger.warning("⚠️ Уровни временных рядов изменились, история сброшена")
+                return
+
+            series = {}
+            for key, buffers in data.get('series', {}).items():
+                item = TieredSeries()
+                item.buffers = [
+                    RingBuffer.from_dict(capacity, buffer)
+                    for (_, capacity), buffer in zip(TIERS, buffers)
+                ]
+                series[key] = item
+            with self.lock:
+                self.series = series
+            logger.info(f"📈 Загружено {len(series)} временных рядов")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"❌ Ошибка загрузки временных рядов: {e}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Планировщик запросов к Steam API с классами приоритета
+Общий бюджет запросов (token bucket) делится между классами взвешенной
+справедливой очередью: запросы пользователя не ждут полного фонового обхода
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+
+# Класс приоритета → вес в справедливой очереди
+PRIORITY_WEIGHTS = {
+    'interactive': 8,  # Запросы пользователя (scan_graphics_settings, start_scan, /api/scan)
+    'watchlist': 3,    # Карты из подписок клиентов
+    'background': 1    # Фоновый обход continuous_scan
+}
+
+class UpstreamScheduler:
+    """Выдача разрешений на запросы к API
+
+    acquire() блокирует поток до своей очереди и свободного токена.
+    Каждой заявке назначается виртуальное время окончания
+    start + 1/вес (start-time fair queuing): новая заявка класса с большим
+    весом получает метку меньше, чем накопленные фоновые заявки, и
+    обслуживается раньше них. Суммарная частота не превышает rate.
+    """
+
+    def __init__(self, rate=10.0, burst=None, weights=None):
+        if rate <= 0:
+            raise ValueError("Частота запросов должна быть положительной")
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        self.condition = threading.Condition()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.virtual_time = 0.0
+        self.sequence = itertools.count()
+        self.queues = {name: deque() for name in self.weights}
+        self.last_finish = {name: 0.0 for name in self.weights}
+        self.granted = {name: 0 for name in self.weights}
+        self.waits = {name: deque(maxlen=256) for name in self.weights}  # Последние ожидания, сек
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _head(self):
+        """Заявка с наименьшей меткой окончания среди всех классов"""
+        heads = [queue[0] for queue in self.queues.values() if queue]
+        return min(heads) if heads else None
+
+    def acquire(self, priority='background'):
+        """Ожидание разрешения на один запрос; возвращает время ожидания в секундах"""
+        if priority not in self.weights:
+            raise ValueError(f"Неизвестный класс приоритета: {priority}")
+
+        with self.condition:
+            start = max(self.virtual_time, self.last_finish[priority])
+            finish = start + 1.0 / self.weights[priority]
+            self.last_finish[priority] = finish
+            ticket = (finish, next(self.sequence), start, time.monotonic())
+            self.queues[priority].append(ticket)
+
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                is_head = self._head() is ticket
+                if is_head and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.queues[priority].popleft()
+                    self.virtual_time = max(self.virtual_time, start)
+                    wait = now - ticket[3]
+                    self.granted[priority] += 1
+                    self.waits[priority].append(wait)
+                    self.condition.notify_all()
+                    return wait
+                # Первая в очереди ждет токен, остальные - выдачи разрешения
+                self.condition.wait((1 - self.tokens) / self.rate if is_head else None)
+
+    def stats(self):
+        with self.condition:
+            classes = {}
+            for name in self.weights:
+                waits = sorted(self.waits[name])
+                classes[name] = {
+                    'weight': self.weights[name],
+                    'queued': len(self.queues[name]),
+                    'granted': self.granted[name],
+                    'wait_avg_ms': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                    'wait_p95_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                    'wait_max_ms': round(waits[-1] * 1000, 1) if waits else 0.0
+                }
+            return {'rate': self.rate, 'burst': self.burst, 'classes': classes}
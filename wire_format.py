@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Форматы передачи WebSocket сообщений
+JSON (по умолчанию), компактный MessagePack со словарем имен полей,
+настройки permessage-deflate для web.WebSocketResponse
+"""
+
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Словарь имен полей: в компактном формате ключи заменяются индексами
+FIELD_DICTIONARY = (
+    'type', 'status', 'message', 'seq', 'base_seq', 'stats', 'upsert', 'remove',
+    'game_servers', 'disappeared_servers', 'empty_servers',
+    'steamid', 'name', 'addr', 'gameport', 'map', 'players', 'max_players', 'bots',
+    'version', 'region', 'secure', 'dedicated', 'os', 'gametype', 'product', 'appid',
+    'mode', 'disappeared_at', 'disappeared_count', 'returned_count', 'total_current', 'total_tracked'
+)
+FIELD_INDEX = {name: index for index, name in enumerate(FIELD_DICTIONARY)}
+
+def available_encodings():
+    return ('json', 'msgpack') if msgpack is not None else ('json',)
+
+def _compact(value):
+    """Замена известных ключей словарей их индексами (рекурсивно)"""
+    if isinstance(value, dict):
+        return {FIELD_INDEX.get(key, key): _compact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    return value
+
+def encode_message(data, encoding='json'):
+    """Сериализация сообщения в bytes: UTF-8 JSON (текстовый кадр) или MessagePack (двоичный)"""
+    if encoding == 'msgpack':
+        if msgpack is None:
+            raise ValueError("MessagePack недоступен: pip install msgpack")
+        return msgpack.packb(_compact(data), use_bin_type=True)
+    return json.dumps(data).encode('utf-8')
+
+def payload_size(message):
+    """Размер сообщения в байтах: str отправляется как UTF-8 (до сжатия permessage-deflate)"""
+    if isinstance(message, bytes) or message.isascii():
+        return len(message)
+    return len(message.encode('utf-8'))
+
+def compression_settings():
+    """Параметры permessage-deflate
+
+    aiohttp сжимает с уровнем 1 (Z_BEST_SPEED) и memLevel по умолчанию,
+    окно - 15 бит, если клиент не запросил меньшее. Из окружения
+    настраивается только включение (WS_COMPRESSION).
+    """
+    return {
+        'enabled': os.environ.get('WS_COMPRESSION', 'deflate').lower() == 'deflate',
+        'level': 1,
+        'mem_level': 8,
+        'window_bits': 15,
+    }
+
+def serve_kwargs():
+    """Аргументы web.WebSocketResponse для сжатия permessage-deflate"""
+    return {'compress': compression_settings()['enabled']}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Учет WebSocket соединений: keepalive, лимиты, удаление неактивных
+и оценка памяти на соединение
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from wire_format import compression_settings
+
+logger = logging.getLogger(__name__)
+
+def _seconds(name, default):
+    """Интервал из окружения; 0 отключает"""
+    value = float(os.environ.get(name, default))
+    return value if value > 0 else None
+
+def connection_settings():
+    """Параметры соединений из переменных окружения"""
+    return {
+        'ping_interval': _seconds('WS_PING_INTERVAL', 20),
+        'idle_timeout': _seconds('WS_IDLE_TIMEOUT', 0),
+        'reap_interval': _seconds('WS_REAP_INTERVAL', 30),
+        'max_connections': int(os.environ.get('WS_MAX_CONNECTIONS', 10000)),
+        'max_per_ip': int(os.environ.get('WS_MAX_PER_IP', 100)),
+        'max_message_size': int(os.environ.get('WS_MAX_MESSAGE_SIZE', 1 << 20)),
+    }
+
+def keepalive_kwargs(settings=None):
+    """Аргументы web.WebSocketResponse: ping/pong закрывает полуоткрытые соединения
+
+    Понг ожидается половину интервала ping, затем соединение закрывается.
+    """
+    settings = settings or connection_settings()
+    return {
+        'heartbeat': settings['ping_interval'],
+        'max_msg_size': settings['max_message_size'],
+    }
+
+def deflate_memory_estimate():
+    """Память zlib на соединение с permessage-deflate (сжатие + распаковка)"""
+    settings = compression_settings()
+    if not settings['enabled']:
+        return 0
+    window_bits = settings['window_bits']
+    compressor = (1 << (window_bits + 2)) + (1 << (settings['mem_level'] + 9))
+    decompressor = (1 << window_bits) + 7 * 1024
+    return compressor + decompressor
+
+class ConnectionInfo:
+    __slots__ = ('address', 'connected_at', 'last_activity', 'messages_in', 'bytes_in')
+
+    def __init__(self, address):
+        self.address = address
+        self.connected_at = time.time()
+        self.last_activity = time.monotonic()
+        self.messages_in = 0
+        self.bytes_in = 0
+
+class ConnectionManager:
+    """Лимиты соединений и периодическая очистка
+
+    Задача-уборщик удаляет закрытые соединения, оставшиеся в списках
+    клиентов, и при WS_IDLE_TIMEOUT закрывает клиентов, которые ничего не
+    присылали дольше этого времени. Полуоткрытые соединения закрывает
+    keepalive (ping_interval).
+    """
+
+    def __init__(self, settings=None, on_stale=None):
+        self.settings = settings or connection_settings()
+        self.on_stale = on_stale
+        self.connections = {}  # websocket → ConnectionInfo
+        self.per_ip = {}
+        self.rejected = 0
+        self.reaped_stale = 0
+        self.reaped_idle = 0
+        self.deflate_estimate = deflate_memory_estimate()
+        self.reaper = None
+
+    @staticmethod
+    def _address(websocket):
+        remote = getattr(websocket, 'remote_address', None)
+        return remote[0] if remote else 'unknown'
+
+    def admit(self, websocket):
+        """Регистрация соединения; (False, причина) при превышении лимитов"""
+        address = self._address(websocket)
+        if len(self.connections) >= self.settings['max_connections']:
+            self.rejected += 1
+            return False, 'server full'
+        if self.per_ip.get(address, 0) >= self.settings['max_per_ip']:
+            self.rejected += 1
+            return False, 'too many connections'
+
+        self.connections[websocket] = ConnectionInfo(address)
+        self.per_ip[address] = self.per_ip.get(address, 0) + 1
+        self.ensure_reaper()
+        return True, None
+
+    def release(self, websocket):
+        info = self.connections.pop(websocket, None)
+        if info is None:
+            return
+        remaining = self.per_ip.get(info.address, 1) - 1
+        if remaining > 0:
+            self.per_ip[info.address] = remaining
+        else:
+            self.per_ip.pop(info.address, None)
+
+    def touch(self, websocket, size):
+        info = self.connections.get(websocket)
+        if info is not None:
+            info.last_activity = time.monotonic()
+            info.messages_in += 1
+            info.bytes_in += size
+
+    def ensure_reaper(self):
+        if self.settings['reap_interval'] and (self.reaper is None or self.reaper.done()):
+            self.reaper = asyncio.get_running_loop().create_task(self.reap_forever())
+
+    async def reap_forever(self):
+        while self.connections:
+            await asyncio.sleep(self.settings['reap_interval'])
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки соединений: {e}")
+
+    def reap(self):
+        """Один проход очистки: закрытые и неактивные соединения"""
+        idle_timeout = self.settings['idle_timeout']
+        now = time.monotonic()
+        for websocket, info in list(self.connections.items()):
+            if getattr(websocket, 'closed', False):
+                self.release(websocket)
+                self.reaped_stale += 1
+                if self.on_stale:
+                    self.on_stale(websocket)
+            elif idle_timeout and now - info.last_activity > idle_timeout:
+                self.reaped_idle += 1
+                logger.info(f"💤 Закрытие неактивного соединения {info.address}")
+                asyncio.ensure_future(websocket.close(code=1001, reason='idle timeout'))
+
+    def memory(self, websocket, channel=None):
+        """Оценка памяти соединения в байтах: очередь отправки, буфер сокета, zlib"""
+        transport = getattr(websocket, 'transport', None)
+        write_buffer = transport.get_write_buffer_size() if transport is not None else 0
+        queued = channel.queued_bytes if channel is not None else 0
+        deflate = self.deflate_estimate if getattr(websocket, 'extensions', None) else 0
+        return {'queued': queued, 'write_buffer': write_buffer, 'deflate': deflate,
+                'total': queued + write_buffer + deflate}
+
+    def stats(self, channels=None):
+        channels = channels or {}
+        memory = [self.memory(websocket, channels.get(websocket)) for websocket in list(self.connections)]
+        return {
+            'connections': len(self.connections),
+            'addresses': len(self.per_ip),
+            'rejected': self.rejected,
+            'reaped_stale': self.reaped_stale,
+            'reaped_idle': self.reaped_idle,
+            'memory_bytes': sum(item['total'] for item in memory),
+            'memory_max_bytes': max((item['total'] for item in memory), default=0),
+            'limits': {name: self.settings[name] for name in ('max_connections', 'max_per_ip', 'idle_timeout',
+                                                              'ping_interval')}
+        }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Таблица обработчиков WebSocket сообщений
+Регистрация по типу сообщения, легкая проверка полей, выполнение
+параллельно или в пуле потоков и гистограммы задержек по типам
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SLOW_HANDLER_SECONDS = 1.0
+
+class LatencyHistogram:
+    """Количество вызовов по корзинам задержки, ошибки, сумма и максимум"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - больше максимальной границы
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, error=False):
+        milliseconds = seconds * 1000
+        index = 0
+        while index < len(self.buckets) and milliseconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает процентиль"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(self.buckets[index]) if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max, 2),
+            'buckets': {f'le_{bound}': count for bound, count in zip((*self.buckets, 'inf'), self.counts)}
+        }
+
+class MessageHandler:
+    """Обработчик типа сообщения
+
+    schema - поле → (допустимые типы, обязательно ли). concurrent - можно
+    выполнять параллельно с другими сообщениями соединения (только чтение).
+    offload - синхронная функция, выполняется в пуле потоков; ее результат
+    (словарь) отправляется клиенту.
+    """
+
+    __slots__ = ('message_type', 'function', 'schema', 'concurrent', 'offload', 'reply_type')
+
+    def __init__(self, message_type, function, schema=None, concurrent=False, offload=False, reply_type=None):
+        self.message_type = message_type
+        self.function = function
+        self.schema = {field: (types if isinstance(types, tuple) else (types,), required)
+                       for field, (types, required) in (schema or {}).items()}
+        self.concurrent = concurrent
+        self.offload = offload
+        self.reply_type = reply_type or message_type
+
+    def validate(self, data):
+        """Текст ошибки или None"""
+        for field, (types, required) in self.schema.items():
+            value = data.get(field)
+            if value is None:
+                if required:
+                    return f"Поле {field} обязательно"
+                continue
+            if isinstance(value, bool) and bool not in types:
+                return f"Поле {field} имеет неверный тип"
+            if not isinstance(value, types):
+                return f"Поле {field} имеет неверный тип"
+        return None
+
+class MessageDispatcher:
+    """Реестр обработчиков и выполнение сообщений одного соединения
+
+    Сообщения без concurrent выполняются по порядку; concurrent-обработчики
+    запускаются отдельными задачами (не больше max_concurrent на соединение).
+    """
+
+    def __init__(self, max_concurrent=8):
+        self.handlers = {}
+        self.metrics = {}
+        self.max_concurrent = max_concurrent
+        self.unknown = 0
+        self.invalid = 0
+        self.tasks = {}  # websocket → выполняющиеся задачи
+
+    def register(self, message_type, function, **options):
+        self.handlers[message_type] = MessageHandler(message_type, function, **options)
+        self.metrics[message_type] = LatencyHistogram()
+
+    async def dispatch(self, websocket, message):
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            self.invalid += 1
+            await self._reply_error(websocket, 'error', 'Сообщение должно быть JSON объектом')
+            return
+        if not isinstance(data, dict):
+            self.invalid += 1
+            await self._reply_error(websocket, 'error', 'Сообщение должно быть JSON объектом')
+            return
+
+        message_type = data.get('type')
+        logger.debug(f"📨 Получено сообщение типа: {message_type}")
+        handler = self.handlers.get(message_type)
+        if handler is None:
+            self.unknown += 1
+            logger.warning(f"❓ Неизвестный тип сообщения: {message_type}")
+            await self._reply_error(websocket, 'error', f'Неизвестный тип сообщения: {message_type}')
+            return
+
+        error = handler.validate(data)
+        if error:
+            self.invalid += 1
+            self.metrics[message_type].observe(0.0, error=True)
+            await self._reply_error(websocket, handler.reply_type, error)
+            return
+
+        running = self.tasks.setdefault(websocket, set())
+        if handler.concurrent and len(running) < self.max_concurrent:
+            task = asyncio.ensure_future(self._run(handler, websocket, data))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        else:
+            await self._run(handler, websocket, data)
+
+    async def _run(self, handler, websocket, data):
+        started = time.perf_counter()
+        failed = False
+        try:
+            if handler.offload:
+                reply = await asyncio.get_running_loop().run_in_executor(None, handler.function, websocket, data)
+                if reply is not None:
+                    await websocket.send(json.dumps(reply))
+            else:
+                await handler.function(websocket, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            failed = True
+            if not getattr(websocket, 'closed', False):
+                logger.error(f"❌ Ошибка обработки сообщения {handler.message_type}: {e}")
+                await self._reply_error(websocket, handler.reply_type, f'Ошибка обработки: {e}')
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics[handler.message_type].observe(elapsed, error=failed)
+            if elapsed > SLOW_HANDLER_SECONDS:
+                logger.warning(f"🐢 Медленный обработчик {handler.message_type}: {elapsed * 1000:.0f} мс")
+
+    async def _reply_error(self, websocket, reply_type, message):
+        try:
+            await websocket.send(json.dumps({'type': reply_type, 'status': 'error', 'message': message}))
+        except Exception:
+            pass
+
+    def close(self, websocket):
+        """Отмена незавершенных обработчиков отключившегося клиента"""
+        for task in self.tasks.pop(websocket, ()):
+            task.cancel()
+
+    def stats(self):
+        return {
+            'unknown': self.unknown,
+            'invalid': self.invalid,
+            'in_flight': sum(len(tasks) for tasks in self.tasks.values()),
+            'handlers': {message_type: histogram.to_dict()
+                         for message_type, histogram in self.metrics.items() if histogram.count}
+        }